@@ -0,0 +1 @@
+"""Бенчмарки гарячих шляхів складських операцій (див. README, розділ Benchmarks)."""
@@ -0,0 +1,201 @@
+"""
+Бенчмарк кластерної комплектації невеликих замовлень.
+
+Генерується склад і набір невеликих замовлень (1-3 рядки). Кожне
+замовлення створюється двічі з тими самими рядками, і обидві копії
+обробляються в лоти, тож обидва режими збирають однаковий набір рядків.
+Лоти першої копії комплектувальник збирає по одному лоту за рейс
+(perform_picking для кожного рядка), лоти другої — кластерами по K лотів
+(claim_cluster_lots, get_cluster_pick_list і confirm_cluster_picks для
+кожної зупинки). Для обох режимів виводиться
+кількість SQL-запитів, час роботи бази, довжина маршрутів і оцінка
+рядків відбору за годину: маршрут / швидкість ходьби + час на рейс,
+зупинку і рядок відбору + виміряний час бази.
+
+Приклади:
+    python -m benchmarks.cluster_picking
+    python -m benchmarks.cluster_picking --orders 120 --cluster-size 6
+    python -m benchmarks.cluster_picking --database-url postgresql://.../wms_bench --allow-reset
+"""
+import io
+import json
+import random
+import argparse
+import contextlib
+
+from benchmarks.common import create_benchmark_app, measure, print_results
+from benchmarks.warehouse_generator import generate_warehouse, generate_customer_orders
+from extensions import db
+
+
+def _quiet(verbose):
+    return contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+
+def _work_hours(args, route_length, trips, stops, lines, db_seconds):
+    """Оцінка робочого часу комплектувальника, годин"""
+    seconds = route_length / args.walk_speed + trips * args.trip_seconds + stops * args.stop_seconds \
+        + lines * args.line_seconds + db_seconds
+    return seconds / 3600
+
+
+def _pick_single(lots, user_id):
+    """Кожен лот — окремий рейс: маршрут лота і perform_picking для кожного рядка"""
+    from models.cluster_picking import claim_cluster_lots, get_cluster_pick_list
+    from models.picking import perform_picking
+    from models.order_lot import OrderLot
+
+    route_length = trips = stops = lines = 0
+    for _ in range(lots):
+        # Кластер з одного лота дає той самий лист відбору, що й екран лота
+        if not claim_cluster_lots(user_id, 1)['success']:
+            break
+        pick_list = get_cluster_pick_list(user_id)
+        route_length += pick_list['route_length']
+        trips += 1
+        lot = OrderLot.query.filter_by(lot_number=pick_list['lots'][0]['lot_number']).first()
+        for stop in pick_list['stops']:
+            if perform_picking(lot.order_id, stop['sku'], stop['quantity'], user_id, lot.lot_number)['success']:
+                stops += 1
+                lines += 1
+    return route_length, trips, stops, lines
+
+
+def _pick_clustered(lots, user_id, size):
+    """Рейс на кластер лотів: один лист відбору і підтвердження на кожній зупинці"""
+    from models.cluster_picking import claim_cluster_lots, get_cluster_pick_list, confirm_cluster_picks
+
+    route_length = trips = stops = lines = 0
+    claimed = 0
+    while claimed < lots:
+        result = claim_cluster_lots(user_id, min(size, lots - claimed))
+        if not result['success']:
+            break
+        claimed += result['claimed']
+        pick_list = get_cluster_pick_list(user_id)
+        route_length += pick_list['route_length']
+        trips += 1
+        for stop in pick_list['stops']:
+            # Сканування SKU на зупинці; система розкладає кількість по лотах кластера
+            confirmed = confirm_cluster_picks(user_id, [{'sku': stop['sku'], 'quantity': stop['quantity']}])
+            picked = sum(1 for pick in confirmed.get('results', []) if pick['success'])
+            if picked:
+                stops += 1
+                lines += picked
+        if not result['claimed']:
+            break
+    return route_length, trips, stops, lines
+
+
+def _lot_lines(order_ids):
+    """Рядки лотів замовлень (SKU, кількість) — набір роботи для режиму"""
+    from models.order_lot import OrderLot, OrderLotProgress
+
+    return sorted(db.session.query(OrderLotProgress.sku, OrderLotProgress.required_quantity).join(
+        OrderLot, OrderLot.id == OrderLotProgress.order_lot_id
+    ).filter(OrderLot.order_id.in_(order_ids)).all())
+
+
+def run_scenarios(args):
+    from models import User, ReceivedInventory
+    from models.order_lot import OrderLot
+    from models.storage import StorageLocation
+
+    results = []
+    copies = ([], [])
+    with _quiet(args.verbose):
+        stats = generate_warehouse(rows=args.rows, cells=args.cells, levels=args.levels,
+                                   skus=args.skus, pallets_per_sku=args.pallets_per_sku)
+        # Запас на рівні 1 для обох копій: інакше друга копія чекала б на переміщення з верхніх рівнів
+        for item in ReceivedInventory.query.join(
+            StorageLocation, ReceivedInventory.storage_location_id == StorageLocation.id
+        ).filter(StorageLocation.level == '1'):
+            item.net_weight = item.net_weight / item.box_count * args.stock
+            item.box_count = args.stock
+        cluster_user = User(username='900002', full_name='Benchmark cluster', password_hash='-')
+        db.session.add(cluster_user)
+        db.session.commit()
+        # Друга копія замовлень має ті самі рядки (ті самі зерна), тому режими збирають однакову роботу;
+        # лоти першої копії створюються раніше і першими потрапляють до режиму по одному лоту
+        for copy in copies:
+            rng = random.Random(args.seed)
+            for number in range(args.orders):
+                order = generate_customer_orders(count=1, lines=rng.randint(1, args.max_lines),
+                                                 max_quantity=args.max_quantity, seed=args.seed + number)[0]
+                order.process_order()
+                copy.append(order.id)
+    single_lots = OrderLot.query.filter(OrderLot.order_id.in_(copies[0])).count()
+    cluster_lots = OrderLot.query.filter(OrderLot.order_id.in_(copies[1])).count()
+    lots = single_lots + cluster_lots
+    same_work = _lot_lines(copies[0]) == _lot_lines(copies[1])
+
+    summary = {}
+    with measure('single_lot', results, args.verbose) as m:
+        route, trips, stops, lines = _pick_single(single_lots, 1)
+        m.details = f'{trips} рейсів, {lines} рядків, маршрут {route:.0f} м'
+    summary['single_lot'] = (m, route, trips, stops, lines)
+
+    with measure(f'cluster_{args.cluster_size}', results, args.verbose) as m:
+        route, trips, stops, lines = _pick_clustered(cluster_lots, cluster_user.id, args.cluster_size)
+        m.details = f'{trips} рейсів, {lines} рядків, {stops} зупинок, маршрут {route:.0f} м'
+    summary['cluster'] = (m, route, trips, stops, lines)
+
+    rates = {}
+    for mode, (m, route, trips, stops, lines) in summary.items():
+        hours = _work_hours(args, route, trips, stops, lines, m.wall_time)
+        rates[mode] = {
+            'lines': lines,
+            'trips': trips,
+            'route_m': round(route, 1),
+            'route_per_line_m': round(route / lines, 1) if lines else 0,
+            'sql_per_line': round(m.statements / lines, 1) if lines else 0,
+            'lines_per_hour': round(lines / hours, 1) if hours else 0
+        }
+    single, cluster = rates['single_lot']['lines_per_hour'], rates['cluster']['lines_per_hour']
+    rates['speedup'] = round(cluster / single, 2) if single else 0
+    rates['same_work'] = same_work
+    return stats, lots, results, rates
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк кластерної комплектації')
+    parser.add_argument('--database-url', help='URL бази (за замовчуванням тимчасова SQLite)')
+    parser.add_argument('--allow-reset', action='store_true', help='Дозволити перестворення не-SQLite бази')
+    parser.add_argument('--rows', type=int, default=4)
+    parser.add_argument('--cells', type=int, default=60)
+    parser.add_argument('--levels', type=int, default=4)
+    parser.add_argument('--skus', type=int, default=200)
+    parser.add_argument('--pallets-per-sku', type=int, default=4)
+    parser.add_argument('--orders', type=int, default=80, help='Кількість невеликих замовлень')
+    parser.add_argument('--max-lines', type=int, default=3, help='Максимум рядків у замовленні')
+    parser.add_argument('--max-quantity', type=int, default=5)
+    parser.add_argument('--stock', type=int, default=500, help='Ящиків на палеті рівня 1')
+    parser.add_argument('--cluster-size', type=int, default=4, help='Лотів у кластері')
+    parser.add_argument('--walk-speed', type=float, default=1.0, help='Швидкість ходьби, м/с')
+    parser.add_argument('--trip-seconds', type=float, default=60, help='Підготовка рейсу і здача лотів, с')
+    parser.add_argument('--stop-seconds', type=float, default=10, help='Пошук комірки і сканування, с')
+    parser.add_argument('--line-seconds', type=float, default=6, help='Розкладання рядка в лот, с')
+    parser.add_argument('--seed', type=int, default=7)
+    parser.add_argument('--json', action='store_true', help='Вивести результати у форматі JSON')
+    parser.add_argument('--verbose', action='store_true', help='Не приглушувати діагностичний вивід')
+    args = parser.parse_args(argv)
+
+    app = create_benchmark_app(args.database_url, args.allow_reset)
+    with app.app_context():
+        stats, lots, results, rates = run_scenarios(args)
+
+    if args.json:
+        print(json.dumps({'warehouse': stats, 'lots': lots, 'results': [m.as_dict() for m in results],
+                          'rates': rates}, ensure_ascii=False, indent=2))
+    else:
+        print(f"Склад: {stats['locations']} комірок, {stats['skus']} SKU; лотів: {lots}")
+        print_results(results)
+        for mode in ('single_lot', 'cluster'):
+            print(f'{mode:<12}' + ', '.join(f'{key}={value}' for key, value in rates[mode].items()))
+        print(f"Прискорення (рядків за годину): x{rates['speedup']}")
+        if not rates['same_work']:
+            print('Увага: лоти двох копій замовлень відрізняються (нестача залишку), режими збирали різну роботу')
+
+
+if __name__ == '__main__':
+    main()
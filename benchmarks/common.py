@@ -0,0 +1,110 @@
+"""
+Спільні засоби для бенчмарків: тимчасовий Flask-застосунок та вимірювання
+часу, кількості SQL-запитів і пікового використання пам'яті.
+"""
+import io
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+import contextlib
+
+from flask import Flask
+from sqlalchemy import event
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extensions import db  # noqa: E402
+
+
+def default_database_url():
+    """SQLite-база в тимчасовому каталозі"""
+    return 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'wms_benchmark.db')
+
+
+def create_benchmark_app(database_url=None, allow_reset=False):
+    """
+    Створює мінімальний Flask-застосунок і порожню схему бази.
+
+    База повністю перестворюється, тому для будь-якої бази, крім SQLite,
+    потрібно явно передати allow_reset=True (лише одноразова PostgreSQL).
+    """
+    database_url = database_url or default_database_url()
+    if not database_url.startswith('sqlite') and not allow_reset:
+        raise SystemExit('Бенчмарк видаляє всі таблиці. Для не-SQLite бази додайте --allow-reset '
+                         'і використовуйте лише одноразову базу.')
+
+    app = Flask('wms_benchmark')
+    app.config['SQLALCHEMY_DATABASE_URI'] = database_url
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    app.config['SECRET_KEY'] = 'benchmark'
+    db.init_app(app)
+
+    # Реєструємо моделі
+    import models  # noqa: F401
+    import models.pending_transfer  # noqa: F401
+
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app
+
+
+class Measurement:
+    """Результат вимірювання одного сценарію"""
+
+    def __init__(self, name):
+        self.name = name
+        self.wall_time = 0.0
+        self.statements = 0
+        self.peak_memory = 0
+        self.details = ''
+
+    def as_dict(self):
+        return {
+            'scenario': self.name,
+            'wall_time_ms': round(self.wall_time * 1000, 2),
+            'sql_statements': self.statements,
+            'peak_memory_kib': round(self.peak_memory / 1024, 1),
+            'details': self.details
+        }
+
+
+@contextlib.contextmanager
+def measure(name, results, verbose=False):
+    """
+    Вимірює блок коду: час виконання, кількість SQL-запитів до рушія
+    та пікове виділення пам'яті (tracemalloc). Діагностичний вивід моделей
+    приглушується, якщо verbose=False.
+    """
+    measurement = Measurement(name)
+
+    def count_statement(*args, **kwargs):
+        measurement.statements += 1
+
+    engine = db.engine
+    event.listen(engine, 'before_cursor_execute', count_statement)
+    tracemalloc.start()
+    output = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+    started = time.perf_counter()
+    try:
+        with output:
+            yield measurement
+    finally:
+        measurement.wall_time = time.perf_counter() - started
+        measurement.peak_memory = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        event.remove(engine, 'before_cursor_execute', count_statement)
+        results.append(measurement)
+
+
+def print_results(results):
+    """Друкує таблицю результатів"""
+    header = f"{'Сценарій':<32}{'Час, мс':>12}{'SQL':>8}{'Пам., КіБ':>12}  Деталі"
+    print(header)
+    print('-' * len(header))
+    for m in results:
+        data = m.as_dict()
+        print(f"{data['scenario']:<32}{data['wall_time_ms']:>12}{data['sql_statements']:>8}"
+              f"{data['peak_memory_kib']:>12}  {data['details']}")
@@ -0,0 +1,112 @@
+"""
+Бенчмарк гарячих шляхів обробки та комплектації замовлень.
+
+Сценарії: calculate_pallets, split_items_by_volume, reserve_inventory,
+process_order, release_wave та perform_picking. Для кожного сценарію
+виводиться час, кількість SQL-запитів і пікове використання пам'яті.
+
+Приклади:
+    python -m benchmarks.order_planning
+    python -m benchmarks.order_planning --skus 500 --lines 300 --orders 50
+    python -m benchmarks.order_planning --database-url postgresql://.../wms_bench --allow-reset
+"""
+import io
+import json
+import argparse
+import contextlib
+
+from benchmarks.common import create_benchmark_app, measure, print_results
+from benchmarks.warehouse_generator import generate_warehouse, generate_customer_orders
+from extensions import db
+
+
+def _quiet(verbose):
+    return contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+
+def run_scenarios(args):
+    from models.picking import perform_picking
+    from models.order_wave import release_wave
+
+    results = []
+
+    with _quiet(args.verbose):
+        stats = generate_warehouse(rows=args.rows, cells=args.cells, levels=args.levels,
+                                   skus=args.skus, pallets_per_sku=args.pallets_per_sku)
+        orders = generate_customer_orders(count=4, lines=args.lines)
+
+    # calculate_pallets
+    order = orders[0]
+    with measure('calculate_pallets', results, args.verbose) as m:
+        m.details = f'{order.calculate_pallets()} палет'
+
+    # split_items_by_volume
+    order = orders[1]
+    with measure('split_items_by_volume', results, args.verbose) as m:
+        order.split_items_by_volume()
+        m.details = f'{order.pallets_count} палет, {len(order.items)} частин'
+
+    # reserve_inventory (після розподілу по палетах)
+    order = orders[2]
+    with _quiet(args.verbose):
+        order.adapt_weight_based_items()
+        order.split_items_by_volume()
+    with measure('reserve_inventory', results, args.verbose) as m:
+        m.details = f'{len(order.reserve_inventory())} позицій'
+
+    # process_order повністю
+    order = orders[3]
+    with measure('process_order', results, args.verbose) as m:
+        order.process_order()
+        m.details = f'{args.lines} рядків, {len(order.lots)} лотів'
+
+    # release_wave для кількох замовлень
+    with _quiet(args.verbose):
+        wave_orders = generate_customer_orders(count=args.orders, lines=min(args.lines, 30), seed=11)
+    with measure('release_wave', results, args.verbose) as m:
+        result = release_wave(wave_orders)
+        m.details = f"{len(result['processed_orders'])} замовлень"
+
+    # perform_picking для кожної позиції першого лота
+    order.status = 'assembling'
+    db.session.commit()
+    lot = order.lots[0]
+    lot_items = [(item.sku, item.quantity) for item in order.items if item.lot_number == lot.lot_number]
+    with measure('perform_picking', results, args.verbose) as m:
+        picked = 0
+        for sku, quantity in lot_items:
+            if perform_picking(order.id, sku, quantity, 1, lot.lot_number)['success']:
+                picked += 1
+        m.details = f'{picked} з {len(lot_items)} відборів'
+
+    return stats, results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк обробки та комплектації замовлень')
+    parser.add_argument('--database-url', help='URL бази (за замовчуванням тимчасова SQLite)')
+    parser.add_argument('--allow-reset', action='store_true', help='Дозволити перестворення не-SQLite бази')
+    parser.add_argument('--rows', type=int, default=4)
+    parser.add_argument('--cells', type=int, default=60)
+    parser.add_argument('--levels', type=int, default=4)
+    parser.add_argument('--skus', type=int, default=200)
+    parser.add_argument('--pallets-per-sku', type=int, default=4)
+    parser.add_argument('--lines', type=int, default=100, help='Кількість рядків у замовленні')
+    parser.add_argument('--orders', type=int, default=20, help='Кількість замовлень у хвилі')
+    parser.add_argument('--json', action='store_true', help='Вивести результати у форматі JSON')
+    parser.add_argument('--verbose', action='store_true', help='Не приглушувати діагностичний вивід')
+    args = parser.parse_args(argv)
+
+    app = create_benchmark_app(args.database_url, args.allow_reset)
+    with app.app_context():
+        stats, results = run_scenarios(args)
+
+    if args.json:
+        print(json.dumps({'warehouse': stats, 'results': [m.as_dict() for m in results]}, ensure_ascii=False, indent=2))
+    else:
+        print(f"Склад: {stats['locations']} комірок, {stats['skus']} SKU, {stats['pallets']} палет")
+        print_results(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Стрес-тест одночасного відбору.
+
+Багато комплектувальників (за замовчуванням 50 потоків) одночасно
+виконують perform_picking для лотів із невеликою кількістю "гарячих" SKU,
+тож усі вони списують ящики з тих самих палет рівня 1. З --without-tasks
+завдання на відбір видаляються, і кожне сканування списує з першої за
+FEFO палети — максимальна конкуренція за один рядок.
+
+Наприкінці перевіряється, що жоден відбір не втрачено: для кожної палети
+початкова кількість мінус поточна дорівнює сумі записів відбору з неї,
+залишки не від'ємні, прогрес лотів збігається з записами відбору,
+а Inventory та зведення залишків узгоджені з палетами.
+
+Приклади:
+    python -m benchmarks.picking_concurrency
+    python -m benchmarks.picking_concurrency --pickers 50 --lots-per-picker 4 --without-tasks
+    python -m benchmarks.picking_concurrency --database-url postgresql://.../wms_bench --allow-reset
+"""
+import io
+import json
+import time
+import argparse
+import threading
+import contextlib
+
+from sqlalchemy import func
+
+from benchmarks.common import create_benchmark_app
+from benchmarks.warehouse_generator import generate_warehouse, generate_customer_orders
+from extensions import db
+
+
+def _quiet(verbose):
+    return contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO())
+
+
+def _worker(app, assignments, barrier, stats, lock):
+    from models.picking import perform_picking
+
+    picked = succeeded = failed = errors = 0
+    with app.app_context():
+        barrier.wait()
+        for order_id, lot_number, sku, quantity in assignments:
+            try:
+                result = perform_picking(order_id, sku, quantity, 1, lot_number)
+            except Exception:
+                db.session.rollback()
+                errors += 1
+                continue
+            if result['success']:
+                succeeded += 1
+                picked += result['actual_quantity']
+            else:
+                failed += 1
+        db.session.remove()
+
+    with lock:
+        stats['picked_boxes'] += picked
+        stats['succeeded'] += succeeded
+        stats['failed'] += failed
+        stats['errors'] += errors
+
+
+def _setup(args):
+    from models import ReceivedInventory, Order
+    from models.order_wave import release_wave
+    from models.order_lot import OrderLot, OrderLotProgress
+    from models.pick_task import PickTask
+    from models.storage import StorageLocation
+
+    generate_warehouse(rows=2, cells=max(args.hot_skus, 10), levels=3,
+                       skus=args.hot_skus, pallets_per_sku=args.pallets_per_sku)
+
+    # Запас на рівні 1, достатній для всіх лотів, щоб кожне сканування мало що списати
+    for item in ReceivedInventory.query.join(
+        StorageLocation, ReceivedInventory.storage_location_id == StorageLocation.id
+    ).filter(StorageLocation.level == '1'):
+        item.net_weight = item.net_weight / item.box_count * args.stock
+        item.box_count = args.stock
+    db.session.commit()
+
+    orders = generate_customer_orders(count=args.pickers * args.lots_per_picker,
+                                      lines=min(args.lines, args.hot_skus), max_quantity=args.max_quantity)
+    release_wave(orders)
+    db.session.query(Order).filter(Order.id.in_([order.id for order in orders])).update(
+        {'status': 'assembling'}, synchronize_session=False
+    )
+    if args.without_tasks:
+        db.session.query(PickTask).delete(synchronize_session=False)
+    db.session.commit()
+
+    rows = db.session.query(
+        OrderLot.order_id, OrderLot.lot_number, OrderLotProgress.sku, OrderLotProgress.required_quantity
+    ).join(OrderLotProgress, OrderLotProgress.order_lot_id == OrderLot.id).order_by(OrderLot.id, OrderLotProgress.id).all()
+    lots = {}
+    for order_id, lot_number, sku, quantity in rows:
+        lots.setdefault(lot_number, []).append((order_id, lot_number, sku, quantity))
+
+    # Лоти розподіляються між комплектувальниками по колу
+    assignments = [[] for _ in range(args.pickers)]
+    for index, lot_lines in enumerate(lots.values()):
+        assignments[index % args.pickers].extend(lot_lines)
+
+    initial = dict(db.session.query(ReceivedInventory.sscc, ReceivedInventory.box_count))
+    required = sum(quantity for _, _, _, quantity in rows)
+    return assignments, initial, required, len(lots)
+
+
+def _verify(initial, reported_boxes):
+    from models import ReceivedInventory
+    from models.inventory import Inventory
+    from models.order_lot import OrderLot, OrderLotProgress
+    from models.picking import OrderPickingItem
+    from models.inventory_summary import check_inventory_summary
+
+    current = dict(db.session.query(ReceivedInventory.sscc, ReceivedInventory.box_count))
+    picked_by_sscc = dict(db.session.query(
+        OrderPickingItem.sscc, func.sum(OrderPickingItem.picked_box_count)
+    ).group_by(OrderPickingItem.sscc))
+    lost = sum(1 for sscc, boxes in initial.items() if boxes - current.get(sscc, 0) != (picked_by_sscc.get(sscc) or 0))
+    negative = sum(1 for boxes in current.values() if boxes < 0)
+    recorded = int(sum(picked_by_sscc.values()) or 0)
+
+    progress = dict(((lot_number, sku), int(boxes)) for lot_number, sku, boxes in db.session.query(
+        OrderLot.lot_number, OrderLotProgress.sku, OrderLotProgress.picked_boxes
+    ).join(OrderLotProgress, OrderLotProgress.order_lot_id == OrderLot.id))
+    history = dict(((lot_number, sku), int(boxes)) for lot_number, sku, boxes in db.session.query(
+        OrderPickingItem.lot_number, OrderPickingItem.sku, func.sum(OrderPickingItem.picked_box_count)
+    ).group_by(OrderPickingItem.lot_number, OrderPickingItem.sku))
+    progress_mismatches = sum(1 for key, boxes in progress.items() if history.get(key, 0) != boxes)
+
+    pallets = dict(((sku, location_id), int(boxes)) for sku, location_id, boxes in db.session.query(
+        ReceivedInventory.sku, ReceivedInventory.storage_location_id, func.sum(ReceivedInventory.box_count)
+    ).group_by(ReceivedInventory.sku, ReceivedInventory.storage_location_id))
+    inventory = dict(((sku, location_id), int(quantity)) for sku, location_id, quantity in db.session.query(
+        Inventory.sku, Inventory.location_id, Inventory.quantity
+    ))
+    inventory_mismatches = sum(1 for key, boxes in pallets.items() if boxes > 0 and inventory.get(key) != boxes)
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary_mismatches = len(check_inventory_summary()['mismatches'])
+
+    return {
+        'recorded_boxes': recorded,
+        'lost_pallet_updates': lost,
+        'negative_pallets': negative,
+        'progress_mismatches': progress_mismatches,
+        'inventory_mismatches': inventory_mismatches,
+        'summary_mismatches': summary_mismatches,
+        'packed_lots': OrderLot.query.filter_by(status='packed').count(),
+        'consistent': (lost == 0 and negative == 0 and recorded == reported_boxes and progress_mismatches == 0
+                       and inventory_mismatches == 0 and summary_mismatches == 0)
+    }
+
+
+def run(args):
+    app = create_benchmark_app(args.database_url, args.allow_reset)
+
+    with app.app_context(), _quiet(args.verbose):
+        assignments, initial, required, lot_count = _setup(args)
+
+    stats = {'picked_boxes': 0, 'succeeded': 0, 'failed': 0, 'errors': 0}
+    lock = threading.Lock()
+    barrier = threading.Barrier(args.pickers)
+    threads = [
+        threading.Thread(target=_worker, args=(app, assignments[index], barrier, stats, lock))
+        for index in range(args.pickers)
+    ]
+
+    # sys.stdout спільний для всіх потоків, тому вивід приглушується один раз навколо пулу
+    with _quiet(args.verbose):
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        check = _verify(initial, stats['picked_boxes'])
+
+    scans = sum(len(lines) for lines in assignments)
+    return {
+        'pickers': args.pickers,
+        'lots': lot_count,
+        'scans': scans,
+        'required_boxes': required,
+        'with_tasks': not args.without_tasks,
+        'wall_time_s': round(elapsed, 3),
+        'scans_per_s': round(scans / elapsed, 1) if elapsed else 0,
+        **stats,
+        **check
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Стрес-тест одночасного відбору')
+    parser.add_argument('--database-url', help='URL бази (за замовчуванням тимчасова SQLite)')
+    parser.add_argument('--allow-reset', action='store_true', help='Дозволити перестворення не-SQLite бази')
+    parser.add_argument('--pickers', type=int, default=50, help='Кількість одночасних комплектувальників')
+    parser.add_argument('--lots-per-picker', type=int, default=2)
+    parser.add_argument('--hot-skus', type=int, default=3, help='Кількість SKU, за які змагаються потоки')
+    parser.add_argument('--pallets-per-sku', type=int, default=2)
+    parser.add_argument('--lines', type=int, default=2, help='SKU в одному замовленні')
+    parser.add_argument('--max-quantity', type=int, default=5)
+    parser.add_argument('--stock', type=int, default=5000, help='Ящиків на палеті рівня 1')
+    parser.add_argument('--without-tasks', action='store_true', help='Списувати з першої палети FEFO без завдань')
+    parser.add_argument('--json', action='store_true', help='Вивести результати у форматі JSON')
+    parser.add_argument('--verbose', action='store_true', help='Не приглушувати діагностичний вивід')
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        for key, value in result.items():
+            print(f'{key:<24}{value}')
+    if not result['consistent']:
+        raise SystemExit('Виявлено втрачені відбори або розбіжність залишків')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""
+Стрес-тест паралельного розміщення палет.
+
+Кілька приймальників (потоків) одночасно приймають палети через
+receive_pallets. За замовчуванням кожен приймальник має власний індекс
+вільних комірок, як окремий процес застосунку: індекси не знають про
+розміщення інших, тож розподіл комірок забезпечують лише claim у базі
+(SKIP LOCKED або таблиця putaway_claim) та перевірка зайнятості.
+Наприкінці перевіряється, що жодна комірка не отримала дві палети,
+що всі claim зняті, а Inventory і зведення залишків узгоджені
+з прийнятими палетами.
+
+Приклади:
+    python -m benchmarks.putaway_concurrency
+    python -m benchmarks.putaway_concurrency --receivers 20 --batches 10 --pallets 3
+    python -m benchmarks.putaway_concurrency --shared-index
+    python -m benchmarks.putaway_concurrency --database-url postgresql://.../wms_bench --allow-reset
+"""
+import io
+import json
+import time
+import random
+import argparse
+import threading
+import contextlib
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+
+from benchmarks.common import create_benchmark_app
+from benchmarks.warehouse_generator import generate_warehouse
+from extensions import db
+
+INVOICE_NUMBER = 'BENCH-PUTAWAY'
+
+
+def _prepare(args):
+    from models import Order, OrderItem, LogisticsItemData
+
+    generate_warehouse(rows=args.rows, cells=args.cells, levels=args.levels,
+                       skus=args.skus, pallets_per_sku=2)
+    order = Order(order_type='supplier', status='processing', order_number='BENCH-IN-1')
+    for logistics in LogisticsItemData.query.order_by(LogisticsItemData.sku):
+        order.items.append(OrderItem(sku=logistics.sku, product_name=logistics.product_name,
+                                     quantity=1000, invoice_number=INVOICE_NUMBER))
+    db.session.add(order)
+    db.session.commit()
+    return [item.id for item in order.items]
+
+
+def _worker(app, item_ids, args, number, stats, lock):
+    from models.putaway import FreeSlotIndex, receive_pallets
+
+    rng = random.Random(number)
+    received = unplaced = retries = failures = 0
+    latencies = []
+
+    with app.app_context():
+        index = None
+        if not args.shared_index:
+            # Власний індекс — як у окремого процесу застосунку
+            index = FreeSlotIndex()
+            index.load(db.session)
+            db.session.commit()
+
+        for batch in range(args.batches):
+            pallets = [
+                {'item_id': rng.choice(item_ids), 'sscc': f'BP{number:03d}{batch:04d}{k:03d}',
+                 'box_count': rng.randint(10, 40), 'net_weight': 100}
+                for k in range(args.pallets)
+            ]
+            for attempt in range(args.retries):
+                started = time.perf_counter()
+                try:
+                    result = receive_pallets(pallets, INVOICE_NUMBER, 1, index=index)
+                    db.session.commit()
+                    latencies.append(time.perf_counter() - started)
+                    received += result['received_count']
+                    unplaced += len(pallets) - result['received_count']
+                    break
+                except OperationalError:
+                    # Блокування бази (SQLite) — повторюємо
+                    db.session.rollback()
+                    retries += 1
+            else:
+                failures += 1
+        db.session.remove()
+
+    with lock:
+        stats['received'] += received
+        stats['unplaced'] += unplaced
+        stats['retries'] += retries
+        stats['failed_batches'] += failures
+        stats['latencies'].extend(latencies)
+
+
+def _verify(expected_received):
+    from models import ReceivedInventory
+    from models.storage import StorageLocation
+    from models.putaway import PutawayClaim
+    from models.inventory_reconciliation import diff_inventory
+    from models.inventory_summary import check_inventory_summary
+
+    received = ReceivedInventory.query.filter_by(invoice_number=INVOICE_NUMBER).count()
+    new_locations = db.session.query(ReceivedInventory.storage_location_id).filter(
+        ReceivedInventory.invoice_number == INVOICE_NUMBER
+    )
+    doubled = db.session.query(ReceivedInventory.storage_location_id).join(
+        StorageLocation, StorageLocation.id == ReceivedInventory.storage_location_id
+    ).filter(
+        ReceivedInventory.storage_location_id.in_(new_locations)
+    ).group_by(ReceivedInventory.storage_location_id).having(func.count(ReceivedInventory.id) > 1).count()
+    claims_left = PutawayClaim.query.count()
+    with contextlib.redirect_stdout(io.StringIO()):
+        inventory_differences = len(diff_inventory())
+        summary_mismatches = len(check_inventory_summary()['mismatches'])
+    return {
+        'received_in_db': received,
+        'doubled_locations': doubled,
+        'claims_left': claims_left,
+        'inventory_differences': inventory_differences,
+        'summary_mismatches': summary_mismatches,
+        'consistent': (received == expected_received and doubled == 0 and claims_left == 0
+                       and inventory_differences == 0 and summary_mismatches == 0)
+    }
+
+
+def run(args):
+    app = create_benchmark_app(args.database_url, args.allow_reset)
+
+    with app.app_context():
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            item_ids = _prepare(args)
+
+    stats = {'received': 0, 'unplaced': 0, 'retries': 0, 'failed_batches': 0, 'latencies': []}
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=_worker, args=(app, item_ids, args, number, stats, lock))
+        for number in range(args.receivers)
+    ]
+
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        with app.app_context():
+            check = _verify(stats['received'])
+
+    latencies = sorted(stats.pop('latencies'))
+    return {
+        'receivers': args.receivers,
+        'pallets_sent': args.receivers * args.batches * args.pallets,
+        'wall_time_s': round(elapsed, 3),
+        'pallets_per_s': round(stats['received'] / elapsed, 1) if elapsed else 0,
+        'batch_p50_ms': round(latencies[len(latencies) // 2] * 1000, 1) if latencies else 0,
+        'batch_max_ms': round(latencies[-1] * 1000, 1) if latencies else 0,
+        **stats,
+        **check
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Стрес-тест паралельного розміщення палет')
+    parser.add_argument('--database-url', help='URL бази (за замовчуванням тимчасова SQLite)')
+    parser.add_argument('--allow-reset', action='store_true', help='Дозволити перестворення не-SQLite бази')
+    parser.add_argument('--receivers', type=int, default=20, help='Кількість паралельних приймальників')
+    parser.add_argument('--batches', type=int, default=5, help='Пакетів на приймальника')
+    parser.add_argument('--pallets', type=int, default=2, help='Палет у пакеті')
+    parser.add_argument('--rows', type=int, default=4)
+    parser.add_argument('--cells', type=int, default=25)
+    parser.add_argument('--levels', type=int, default=4)
+    parser.add_argument('--skus', type=int, default=20)
+    parser.add_argument('--retries', type=int, default=20, help='Повторів після блокування бази')
+    parser.add_argument('--shared-index', action='store_true',
+                        help='Один індекс на всіх приймальників (як потоки одного процесу)')
+    parser.add_argument('--json', action='store_true', help='Вивести результати у форматі JSON')
+    parser.add_argument('--verbose', action='store_true', help='Не приглушувати діагностичний вивід')
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        for key, value in result.items():
+            print(f'{key:<24}{value}')
+    if not result['consistent']:
+        raise SystemExit('Виявлено подвійне розміщення або розбіжність залишків')
+
+
+if __name__ == '__main__':
+    main()
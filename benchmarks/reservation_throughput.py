@@ -0,0 +1,151 @@
+"""
+Бенчмарк пропускної здатності резервування залишків.
+
+Кілька потоків одночасно резервують товар для невеликого набору "гарячих" SKU
+через reserve_batch. Виводиться кількість резервувань за секунду, кількість
+конфліктів (повторів через блокування) та відмов через нестачу товару.
+Наприкінці перевіряється, що жоден рядок Inventory не зарезервовано понад
+його кількість, що сума резервів дорівнює сумі успішних резервувань
+і що зведення залишків (InventorySummary) узгоджене з таблицею Inventory.
+
+Приклади:
+    python -m benchmarks.reservation_throughput
+    python -m benchmarks.reservation_throughput --threads 16 --iterations 200 --hot-skus 5
+    python -m benchmarks.reservation_throughput --database-url postgresql://.../wms_bench --allow-reset
+"""
+import io
+import json
+import time
+import random
+import argparse
+import threading
+import contextlib
+
+from sqlalchemy import func
+from sqlalchemy.exc import OperationalError
+
+from benchmarks.common import create_benchmark_app
+from benchmarks.warehouse_generator import generate_warehouse
+from extensions import db
+
+
+def _worker(app, skus, args, seed, stats, lock):
+    from models.inventory_reservation import reserve_batch, ReservationError
+
+    rng = random.Random(seed)
+    reserved = succeeded = shortages = conflicts = 0
+
+    with app.app_context():
+        for _ in range(args.iterations):
+            demands = {}
+            for sku in rng.sample(skus, min(args.lines, len(skus))):
+                demands[sku] = rng.randint(1, args.max_quantity)
+
+            for attempt in range(args.retries):
+                try:
+                    reserve_batch(demands)
+                    succeeded += 1
+                    reserved += sum(demands.values())
+                    break
+                except ReservationError:
+                    db.session.rollback()
+                    shortages += 1
+                    break
+                except OperationalError:
+                    # Блокування бази (SQLite) або конфлікт транзакцій — повторюємо
+                    db.session.rollback()
+                    conflicts += 1
+        db.session.remove()
+
+    with lock:
+        stats['reserved_quantity'] += reserved
+        stats['succeeded'] += succeeded
+        stats['shortages'] += shortages
+        stats['conflicts'] += conflicts
+
+
+def _verify(expected_reserved):
+    from models.inventory import Inventory
+    from models.inventory_summary import check_inventory_summary
+
+    over_reserved = Inventory.query.filter(Inventory.reserved_quantity > Inventory.quantity).count()
+    negative = Inventory.query.filter(Inventory.reserved_quantity < 0).count()
+    total_reserved = db.session.query(func.coalesce(func.sum(Inventory.reserved_quantity), 0)).scalar()
+    with contextlib.redirect_stdout(io.StringIO()):
+        summary_mismatches = len(check_inventory_summary()['mismatches'])
+    return {
+        'over_reserved_rows': over_reserved,
+        'negative_rows': negative,
+        'total_reserved': int(total_reserved),
+        'summary_mismatches': summary_mismatches,
+        'consistent': (over_reserved == 0 and negative == 0 and int(total_reserved) == expected_reserved
+                       and summary_mismatches == 0)
+    }
+
+
+def run(args):
+    app = create_benchmark_app(args.database_url, args.allow_reset)
+
+    with app.app_context():
+        output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with output:
+            generate_warehouse(rows=2, cells=max(args.hot_skus, 10), levels=3,
+                               skus=args.hot_skus, pallets_per_sku=args.pallets_per_sku)
+        from models.inventory import Inventory
+        skus = [sku for (sku,) in db.session.query(Inventory.sku).distinct().order_by(Inventory.sku)]
+
+    stats = {'reserved_quantity': 0, 'succeeded': 0, 'shortages': 0, 'conflicts': 0}
+    lock = threading.Lock()
+    threads = [
+        threading.Thread(target=_worker, args=(app, skus, args, seed, stats, lock))
+        for seed in range(args.threads)
+    ]
+
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    with app.app_context():
+        check = _verify(stats['reserved_quantity'])
+
+    attempts = args.threads * args.iterations
+    return {
+        'threads': args.threads,
+        'attempts': attempts,
+        'wall_time_s': round(elapsed, 3),
+        'reservations_per_s': round(stats['succeeded'] / elapsed, 1) if elapsed else 0,
+        **stats,
+        **check
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк одночасного резервування залишків')
+    parser.add_argument('--database-url', help='URL бази (за замовчуванням тимчасова SQLite)')
+    parser.add_argument('--allow-reset', action='store_true', help='Дозволити перестворення не-SQLite бази')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--iterations', type=int, default=50, help='Резервувань на потік')
+    parser.add_argument('--hot-skus', type=int, default=10, help='Кількість SKU, за які змагаються потоки')
+    parser.add_argument('--pallets-per-sku', type=int, default=3)
+    parser.add_argument('--lines', type=int, default=3, help='SKU в одному резервуванні')
+    parser.add_argument('--max-quantity', type=int, default=5)
+    parser.add_argument('--retries', type=int, default=10, help='Повторів після конфлікту')
+    parser.add_argument('--json', action='store_true', help='Вивести результати у форматі JSON')
+    parser.add_argument('--verbose', action='store_true', help='Не приглушувати діагностичний вивід')
+    args = parser.parse_args(argv)
+
+    result = run(args)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        for key, value in result.items():
+            print(f'{key:<24}{value}')
+    if not result['consistent']:
+        raise SystemExit('Виявлено перерезервування або розбіжність резервів')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""
+Генератор синтетичного складу для бенчмарків.
+
+Створює ряди та комірки, логістичні дані для N SKU, місця відбору,
+прийняті палети (ReceivedInventory) на рівні відбору та верхніх рівнях
+і клієнтські замовлення заданого розміру.
+"""
+import random
+from datetime import datetime, timedelta
+
+from extensions import db
+from models import LogisticsItemData, User, Customer, Order, OrderItem, ReceivedInventory
+from models.storage import StorageRow, StorageLocation, SkuPickingLocation
+
+
+def generate_warehouse(rows=4, cells=50, levels=4, skus=200, pallets_per_sku=4, seed=42):
+    """
+    Заповнює порожню базу синтетичним складом.
+
+    Args:
+        rows: Кількість рядів
+        cells: Кількість комірок у ряду
+        levels: Кількість рівнів (рівень 1 — місця відбору)
+        skus: Кількість SKU
+        pallets_per_sku: Кількість палет на SKU (перша — на місці відбору)
+        seed: Зерно генератора випадкових чисел
+
+    Returns:
+        dict: Кількість створених записів
+    """
+    rng = random.Random(seed)
+
+    user = User(username='900001', full_name='Benchmark', password_hash='-')
+    customer = Customer(code='BENCH', name='Benchmark customer', address='-')
+    db.session.add_all([user, customer])
+
+    for r in range(rows):
+        row_code = f'R{r + 1:02d}'
+        db.session.add(StorageRow(code=row_code, name=row_code, temperature_min=0, temperature_max=8,
+                                  storage_type='chilled'))
+        for cell in range(1, cells + 1):
+            for level in range(1, levels + 1):
+                db.session.add(StorageLocation(
+                    row_code=row_code,
+                    cell=f'{cell:03d}',
+                    level=str(level),
+                    location_code=f'{row_code}-{cell:03d}-{level}',
+                    location_type='picking' if level == 1 else 'upper'
+                ))
+    db.session.commit()
+
+    picking_locations = StorageLocation.query.filter_by(level='1').order_by(StorageLocation.id).all()
+    upper_locations = StorageLocation.query.filter(StorageLocation.level > '1').order_by(StorageLocation.id).all()
+    if skus > len(picking_locations):
+        raise ValueError(f'Недостатньо місць відбору: {len(picking_locations)} для {skus} SKU')
+
+    now = datetime.utcnow()
+    sscc_counter = 0
+    upper_index = 0
+    for i in range(skus):
+        sku = f'{500000 + i}'
+        weight_based = i % 4 == 0
+        db.session.add(LogisticsItemData(
+            sku=sku,
+            product_name=f'Benchmark product {i}',
+            packaging_unit_type='КГ' if weight_based else 'ШТ',
+            length=rng.choice([20, 30, 40, 60]),
+            width=rng.choice([20, 30, 40]),
+            height=rng.choice([10, 20, 30]),
+            count=1 if weight_based else rng.choice([4, 6, 10, 12]),
+            storage_type='04',
+            temperature_range=4,
+            shelf_life=30
+        ))
+        db.session.add(SkuPickingLocation(sku=sku, picking_location_id=picking_locations[i].id))
+
+        for p in range(pallets_per_sku):
+            if p == 0:
+                location = picking_locations[i]
+            else:
+                location = upper_locations[upper_index % len(upper_locations)]
+                upper_index += 1
+            sscc_counter += 1
+            box_count = rng.randint(20, 60)
+            db.session.add(ReceivedInventory(
+                sscc=f'{99000000000000000 + sscc_counter:018d}',
+                storage_location_id=location.id,
+                sku=sku,
+                product_name=f'Benchmark product {i}',
+                box_count=box_count,
+                net_weight=round(box_count * rng.uniform(4, 12), 2),
+                received_at=now,
+                expiry_date=now + timedelta(days=rng.randint(5, 60)),
+                received_by=1,
+                invoice_number='BENCH'
+            ))
+        db.session.commit()
+
+    return {
+        'locations': len(picking_locations) + len(upper_locations),
+        'skus': skus,
+        'pallets': sscc_counter
+    }
+
+
+def generate_customer_orders(count=1, lines=50, max_quantity=40, seed=7):
+    """
+    Створює клієнтські замовлення зі статусом 'created'.
+
+    Args:
+        count: Кількість замовлень
+        lines: Кількість позицій у кожному замовленні (різні SKU)
+        max_quantity: Максимальна кількість у позиції
+
+    Returns:
+        list: Створені замовлення
+    """
+    rng = random.Random(seed)
+    logistics = LogisticsItemData.query.order_by(LogisticsItemData.sku).all()
+    customer = Customer.query.filter_by(code='BENCH').first()
+    lines = min(lines, len(logistics))
+
+    orders = []
+    for _ in range(count):
+        order = Order(
+            order_type='customer',
+            customer_id=customer.id,
+            status='created',
+            order_number=Order.generate_order_number('customer')
+        )
+        for item in rng.sample(logistics, lines):
+            order.items.append(OrderItem(
+                sku=item.sku,
+                product_name=item.product_name,
+                quantity=rng.randint(1, max_quantity),
+                unit_price=1.0
+            ))
+        db.session.add(order)
+        db.session.commit()
+        orders.append(order)
+    return orders
@@ -1,6 +1,6 @@
 from flask_wtf import FlaskForm
 from wtforms import StringField, IntegerField, FloatField, SelectField, SubmitField, FieldList, FormField, Form
-from wtforms.validators import DataRequired, NumberRange, Length
+from wtforms.validators import DataRequired, NumberRange, Length, Optional
 
 """
 Модуль форм для роботи з замовленнями клієнтів
@@ -27,5 +27,6 @@ class CustomerOrderForm(FlaskForm):
     з можливістю динамічного додавання позицій
     """
     customer_id = SelectField('Клієнт', coerce=int, validators=[DataRequired()])
+    priority = IntegerField('Пріоритет', default=0, validators=[Optional(), NumberRange(min=0)])
     items = FieldList(FormField(OrderItemSubForm), min_entries=1, max_entries=50)
     submit = SubmitField('Створити замовлення')
\ No newline at end of file
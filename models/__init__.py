@@ -5,16 +5,22 @@ from werkzeug.security import generate_password_hash, check_password_hash
 
 # Імпортуємо моделі
 from models.inventory import Inventory
+from models.inventory_summary import InventorySummary
 from models.supplier import Supplier, SupplierContract, ContractItem
 from models.order import Order, OrderItem
 from models.storage import StorageRow, StorageLocation, SkuPickingLocation
 from models.sscc_barcode import SSCCBarcode
 from models.received_inventory import ReceivedInventory
+from models.putaway import PutawayClaim
+from models.pick_walk import PickWalkRank
+from models.receiving_staging import ReceivingScan
 from models.picking import OrderPickingItem, InventoryTransfer, perform_picking
 from models.audit import AuditLog
 from models.customer import Customer
 from models.client_stock import ClientStock
-from models.order_lot import OrderLot, OrderLotSKU
+from models.order_lot import OrderLot, OrderLotSKU, OrderLotProgress
+from models.pick_task import PickTask
+from models.lot_feed import lot_feed
 
 # Database Models
 class Position(db.Model):
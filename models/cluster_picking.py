@@ -0,0 +1,467 @@
+"""
+Кластерна комплектація: комплектувальник одночасно збирає кілька лотів.
+
+Комплектувальник забирає до K лотів у статусі 'wait' (на PostgreSQL
+паралельні комплектувальники пропускають заблоковані лоти, на інших
+базах лот забирає умовний UPDATE ... WHERE status = 'wait'). Потреба всіх
+лотів кластера об'єднується в один лист відбору: зупинки за місцями
+відбору в порядку обходу складу, на кожній — розподіл ящиків по лотах
+(місцях на візку). Підтвердження сканувань обробляються пакетом:
+палети, прогрес лотів і завершення лотів оновлюються однією транзакцією,
+записи відбору додаються одним пакетним INSERT.
+"""
+from datetime import datetime
+from extensions import db
+from flask import current_app
+from sqlalchemy import and_, case, exists, insert, select, update
+from models.order_lot import OrderLot, OrderLotSKU, OrderLotProgress, ensure_lot_progress, record_pick
+from models.storage import StorageLocation, SkuPickingLocation
+from models.pick_walk import PickWalkRank, ensure_walk_ranks, walk_route_length, max_cell_number
+from models.pick_task import (PickTask, task_sources, free_pallets, draw_boxes, adjustment_rows, close_lot_tasks,
+                              retry_on_conflict)
+from models.received_inventory import sync_inventory
+
+DEFAULT_CLUSTER_SIZE = 4
+MAX_CLUSTER_SIZE = 12
+PICKABLE_ORDER_STATUSES = ('processing', 'assembling')
+
+
+def cluster_size(size=None):
+    """Розмір кластера: з запиту або CLUSTER_PICKING_SIZE, в межах 1..MAX_CLUSTER_SIZE"""
+    if size is None:
+        try:
+            size = current_app.config.get('CLUSTER_PICKING_SIZE', DEFAULT_CLUSTER_SIZE)
+        except RuntimeError:
+            size = DEFAULT_CLUSTER_SIZE
+    try:
+        size = int(size)
+    except (TypeError, ValueError):
+        size = DEFAULT_CLUSTER_SIZE
+    return max(1, min(size, MAX_CLUSTER_SIZE))
+
+
+def _cluster_lots_query(user_id):
+    """Лоти, які зараз збирає комплектувальник"""
+    return OrderLot.query.filter(OrderLot.status == 'start', OrderLot.picker_id == user_id)
+
+
+def claim_cluster_lots(user_id, size=None):
+    """
+    Додає до кластера комплектувальника лоти зі статусом 'wait' (у порядку
+    створення), доки в ньому не буде size лотів. Лоти замовлень, які вже
+    збирає інший користувач, пропускаються.
+
+    Args:
+        user_id: ID комплектувальника
+        size: Бажана кількість лотів у кластері
+
+    Returns:
+        dict: Результат операції з номерами лотів кластера
+    """
+    from models.order import Order
+
+    size = cluster_size(size)
+    current = _cluster_lots_query(user_id).count()
+    needed = size - current
+    claimed_ids = []
+
+    if needed > 0:
+        query = db.session.query(OrderLot.id).join(Order, Order.id == OrderLot.order_id).filter(
+            OrderLot.status == 'wait',
+            Order.status.in_(PICKABLE_ORDER_STATUSES),
+            (Order.started_by_user_id.is_(None)) | (Order.started_by_user_id == user_id)
+        ).order_by(OrderLot.id).limit(needed)
+        if db.session.get_bind().dialect.name == 'postgresql':
+            query = query.with_for_update(of=OrderLot, skip_locked=True)
+        candidate_ids = [lot_id for (lot_id,) in query]
+
+        if candidate_ids:
+            # Умовний UPDATE: лот, який уже забрав інший комплектувальник, не зміниться
+            db.session.execute(
+                update(OrderLot).where(
+                    OrderLot.id.in_(candidate_ids),
+                    OrderLot.status == 'wait'
+                ).values(status='start', picker_id=user_id),
+                execution_options={'synchronize_session': False}
+            )
+            claimed_ids = [lot_id for (lot_id,) in db.session.query(OrderLot.id).filter(
+                OrderLot.id.in_(candidate_ids),
+                OrderLot.status == 'start',
+                OrderLot.picker_id == user_id
+            )]
+
+        if claimed_ids:
+            order_ids = select(OrderLot.order_id).where(OrderLot.id.in_(claimed_ids))
+            db.session.execute(
+                update(Order).where(Order.id.in_(order_ids), Order.status == 'processing').values(status='assembling'),
+                execution_options={'synchronize_session': False}
+            )
+            db.session.execute(
+                update(Order).where(Order.id.in_(order_ids), Order.started_by_user_id.is_(None)).values(
+                    started_by_user_id=user_id
+                ),
+                execution_options={'synchronize_session': False}
+            )
+
+    lots = _cluster_lots_query(user_id).order_by(OrderLot.id).populate_existing().all()
+    # Прогрес лотів, створених до появи таблиці прогресу
+    for lot in lots:
+        ensure_lot_progress(lot)
+    db.session.commit()
+
+    message = f'До кластера додано лотів: {len(claimed_ids)}, у кластері {len(lots)} з {size}'
+    print(message)
+    return {
+        'success': bool(lots),
+        'message': message if lots else 'Немає доступних лотів для комплектації',
+        'claimed': len(claimed_ids),
+        'lot_numbers': [lot.lot_number for lot in lots]
+    }
+
+
+def get_cluster_pick_list(user_id):
+    """
+    Об'єднаний лист відбору кластера одним запитом: незібрані позиції всіх
+    лотів з місцем відбору та рангом обходу. Позиції одного SKU об'єднуються
+    в одну зупинку з розподілом по лотах.
+
+    Returns:
+        dict: Лоти кластера, зупинки в порядку обходу і довжина маршруту
+    """
+    from models.order import Order
+
+    ensure_walk_ranks()
+    lots = db.session.query(OrderLot, Order.order_number).join(Order, Order.id == OrderLot.order_id).filter(
+        OrderLot.status == 'start',
+        OrderLot.picker_id == user_id
+    ).order_by(OrderLot.id).all()
+    if not lots:
+        return {'success': False, 'message': 'Кластер порожній. Заберіть лоти для комплектації', 'lots': [], 'stops': []}
+
+    slots = {lot.id: slot for slot, (lot, _) in enumerate(lots, start=1)}
+    rows = db.session.query(
+        OrderLotProgress,
+        StorageLocation.location_code,
+        PickWalkRank.walk_rank,
+        PickWalkRank.row_number,
+        PickWalkRank.cell_number,
+        max_cell_number()
+    ).outerjoin(
+        SkuPickingLocation, SkuPickingLocation.sku == OrderLotProgress.sku
+    ).outerjoin(
+        StorageLocation, StorageLocation.id == SkuPickingLocation.picking_location_id
+    ).outerjoin(
+        PickWalkRank, PickWalkRank.location_id == StorageLocation.id
+    ).filter(
+        OrderLotProgress.order_lot_id.in_(list(slots)),
+        OrderLotProgress.picked_boxes < OrderLotProgress.required_quantity
+    ).order_by(
+        case((PickWalkRank.walk_rank.is_(None), 1), else_=0), PickWalkRank.walk_rank,
+        OrderLotProgress.sku, OrderLotProgress.order_lot_id
+    ).all()
+
+    lot_numbers = {lot.id: lot.lot_number for lot, _ in lots}
+    stops = {}
+    lot_points = {}
+    for progress, location_code, walk_rank, row_number, cell_number, _ in rows:
+        stop = stops.get(progress.sku)
+        if stop is None:
+            stop = stops[progress.sku] = {
+                'sequence': len(stops) + 1,
+                'sku': progress.sku,
+                'product_name': progress.product_name,
+                'location': location_code or 'Не вказано',
+                'quantity': 0,
+                'lots': []
+            }
+        remaining = progress.required_quantity - progress.picked_boxes
+        stop['quantity'] += remaining
+        stop['lots'].append({
+            'lot_number': lot_numbers[progress.order_lot_id],
+            'slot': slots[progress.order_lot_id],
+            'quantity': remaining
+        })
+        if walk_rank is not None:
+            lot_points.setdefault(progress.order_lot_id, []).append((row_number, cell_number))
+
+    # Маршрут кластера проходить кожну комірку один раз; для порівняння —
+    # сума маршрутів, якби кожен лот збирався окремо
+    row_length = rows[0][5] if rows else 1
+    cluster_points = list(dict.fromkeys((row[3], row[4]) for row in rows if row[2] is not None))
+    route_length = walk_route_length(cluster_points, row_length)
+    separate_route_length = sum(walk_route_length(points, row_length) for points in lot_points.values())
+
+    return {
+        'success': True,
+        'lots': [
+            {
+                'lot_number': lot.lot_number,
+                'order_number': order_number,
+                'slot': slots[lot.id],
+                'remaining_lines': lot.remaining_lines
+            }
+            for lot, order_number in lots
+        ],
+        'stops': list(stops.values()),
+        'route_length': round(route_length, 1),
+        'separate_route_length': round(separate_route_length, 1)
+    }
+
+
+def _requested_picks(picks, lots, progress):
+    """
+    Розкладає сканування на відбори по лотах. Сканування без номера лота
+    розподіляється між лотами кластера з незібраною потребою цього SKU.
+    Кількість обмежується незібраною потребою позиції.
+
+    Returns:
+        tuple: ([(lot, sku, ящиків, запитано)], [відхилені сканування])
+    """
+    by_number = {lot.lot_number: lot for lot in lots}
+    remaining = {key: max(row.required_quantity - row.picked_boxes, 0) for key, row in progress.items()}
+    requested, rejected = [], []
+
+    for pick in picks:
+        sku = str(pick.get('sku') or '')
+        lot_number = pick.get('lot_number')
+        try:
+            quantity = int(pick.get('quantity') or 0)
+        except (TypeError, ValueError):
+            quantity = 0
+        if not sku or quantity <= 0:
+            rejected.append({'sku': sku, 'lot_number': lot_number, 'message': 'Не вказано SKU або кількість'})
+            continue
+
+        if lot_number:
+            lot = by_number.get(lot_number)
+            if lot is None:
+                rejected.append({'sku': sku, 'lot_number': lot_number, 'message': 'Лот не належить кластеру'})
+                continue
+            targets = [lot]
+        else:
+            targets = [lot for lot in lots if remaining.get((lot.id, sku))]
+
+        placed = 0
+        for lot in targets:
+            count = min(quantity - placed, remaining.get((lot.id, sku), 0))
+            if count > 0:
+                requested.append((lot, sku, count, quantity if lot_number else count))
+                remaining[(lot.id, sku)] -= count
+                placed += count
+        if placed == 0:
+            rejected.append({'sku': sku, 'lot_number': lot_number, 'message': 'Позицію вже зібрано або її немає в лоті'})
+    return requested, rejected
+
+
+def confirm_cluster_picks(user_id, picks):
+    """
+    Підтверджує пакет сканувань кластера однією транзакцією.
+
+    Завдання на відбір лотів кластера з їхніми палетами завантажуються
+    одним запитом і підтверджуються; вільні палети рівня 1 читаються лише
+    для SKU, яким не вистачає завдань. Ящики списуються атомарним умовним
+    UPDATE, конфлікти транзакцій повторюються. Записи відбору додаються
+    одним пакетним INSERT, прогрес лотів оновлюється в пам'яті, зібрані
+    лоти отримують статус 'packed' і підсумки.
+
+    Args:
+        user_id: ID комплектувальника
+        picks: Сканування [{'lot_number', 'sku', 'quantity'}]; без lot_number
+            кількість розподіляється між лотами кластера
+
+    Returns:
+        dict: Результат по кожному відбору та завершені лоти
+    """
+    return retry_on_conflict(_confirm_cluster_picks, user_id, picks)
+
+
+def _confirm_cluster_picks(user_id, picks):
+    """Одна спроба підтвердження пакета сканувань однією транзакцією"""
+    from models.order import Order
+    from models.picking import OrderPickingItem
+    from models.pending_transfer import PendingTransferRequest
+    from models import LogisticsItemData
+
+    lots = _cluster_lots_query(user_id).order_by(OrderLot.id).with_for_update().populate_existing().all()
+    if not lots:
+        return {'success': False, 'message': 'Кластер порожній. Заберіть лоти для комплектації'}
+    for lot in lots:
+        ensure_lot_progress(lot)
+
+    lots_by_id = {lot.id: lot for lot in lots}
+    progress = {
+        (row.order_lot_id, row.sku): row
+        for row in OrderLotProgress.query.filter(OrderLotProgress.order_lot_id.in_(list(lots_by_id)))
+    }
+    requested, rejected = _requested_picks(picks or [], lots, progress)
+    skus = sorted({sku for _, sku, _, _ in requested})
+
+    # Завдання лотів з палетами і логістика для всіх SKU — по одному запиту
+    tasks = task_sources([lot.lot_number for lot in lots], skus)
+    needed = {}
+    for lot, sku, count, _ in requested:
+        needed[(lot.lot_number, sku)] = needed.get((lot.lot_number, sku), 0) + count
+    uncovered = sorted({sku for (lot_number, sku), count in needed.items() if count > sum(
+        min(task.outstanding, item.box_count) for task, item, _ in tasks.get((lot_number, sku), [])
+    )})
+    # Коригування лише для SKU, яким не вистачає завдань: незавершені переміщення і вільні палети
+    blocked = {sku for (sku,) in db.session.query(PendingTransferRequest.sku).filter(
+        PendingTransferRequest.sku.in_(uncovered),
+        PendingTransferRequest.confirmed == False  # noqa: E712
+    ).distinct()} if uncovered else set()
+    pallets = free_pallets([sku for sku in uncovered if sku not in blocked])
+    unit_types = dict(db.session.query(LogisticsItemData.sku, LogisticsItemData.packaging_unit_type).filter(
+        LogisticsItemData.sku.in_(skus)
+    )) if skus else {}
+
+    now = datetime.utcnow()
+    inventory_deltas = {}
+    pick_rows = []
+    adjustments = []
+    results = []
+    for lot, sku, count, requested_quantity in requested:
+        if sku in blocked:
+            results.append({
+                'lot_number': lot.lot_number, 'sku': sku, 'success': False, 'picked': 0,
+                'message': f'Для товару {sku} є незавершені запити на переміщення. Зачекайте на їх підтвердження.'
+            })
+            continue
+
+        unit_type = unit_types.get(sku)
+        picks = draw_boxes(count, tasks.get((lot.lot_number, sku), []), pallets.get(sku, []), user_id, now,
+                           inventory_deltas)
+        for item, location_code, pick_count, weight, _ in picks:
+            pick_rows.append({
+                'order_id': lot.order_id,
+                'sku': sku,
+                'sscc': item.sscc,
+                'requested_quantity': requested_quantity,
+                'picked_box_count': pick_count,
+                'calculated_weight': weight,
+                'actual_quantity': weight if unit_type == 'КГ' else pick_count,
+                'packaging_unit_type': unit_type,
+                'underpicked': False,
+                'picked_by_user_id': user_id,
+                'picked_at': now,
+                'storage_location': location_code,
+                'lot_number': lot.lot_number
+            })
+        adjustments.extend(adjustment_rows(lot, sku, picks, user_id, now))
+        picked_boxes = sum(pick[2] for pick in picks)
+        picked_weight = sum(pick[3] for pick in picks)
+
+        row = record_pick(lot, sku, picked_boxes, picked_weight, progress=progress.get((lot.id, sku))) \
+            if picked_boxes else progress.get((lot.id, sku))
+        underpicked = picked_boxes < count
+        # Недобір позначається на останньому записі відбору цієї позиції
+        if underpicked and picked_boxes:
+            pick_rows[-1]['underpicked'] = True
+        results.append({
+            'lot_number': lot.lot_number,
+            'sku': sku,
+            'success': picked_boxes > 0,
+            'picked': picked_boxes,
+            'requested': count,
+            'underpicked': underpicked,
+            'line_complete': bool(row and row.is_complete),
+            'message': 'Товар успішно відібрано' + (' (частково)' if underpicked and picked_boxes else '')
+            if picked_boxes else 'Немає доступного товару для відбору'
+        })
+
+    # Палети списано прямими UPDATE — залишки Inventory оновлюємо одним пакетом
+    sync_inventory(db.session, inventory_deltas)
+
+    # Записи відбору і завдання-коригування всіх сканувань — по одному пакетному INSERT
+    if pick_rows:
+        db.session.execute(insert(OrderPickingItem), pick_rows)
+    if adjustments:
+        db.session.execute(insert(PickTask), adjustments)
+
+    completed = [lot for lot in lots if lot.remaining_lines == 0]
+    if completed:
+        lot_skus = []
+        for lot in completed:
+            rows = sorted((row for (lot_id, _), row in progress.items() if lot_id == lot.id), key=lambda row: row.id)
+            lot.status = 'packed'
+            lot.completed_at = now
+            lot.picker_id = user_id
+            lot.box_count = sum(row.picked_boxes for row in rows)
+            lot.total_weight = sum(row.picked_weight for row in rows)
+            lot_skus.extend({
+                'order_lot_id': lot.id,
+                'sku': row.sku,
+                'product_name': row.product_name,
+                'quantity': row.picked_boxes,
+                'weight': row.picked_weight
+            } for row in rows)
+        # Підсумки всіх зібраних лотів одним пакетним INSERT
+        if lot_skus:
+            db.session.execute(insert(OrderLotSKU), lot_skus)
+        # Невикористані завдання зібраних лотів звільняють розподілені ящики
+        close_lot_tasks([lot.id for lot in completed])
+        db.session.flush()
+
+        # Замовлення зібране, коли зібрані всі його лоти
+        order_ids = {lot.order_id for lot in completed}
+        unpacked = exists().where(and_(OrderLot.order_id == Order.id, OrderLot.status != 'packed'))
+        db.session.execute(
+            update(Order).where(Order.id.in_(order_ids), ~unpacked).values(status='packed'),
+            execution_options={'synchronize_session': False}
+        )
+
+    # Сканування, відбори та завершення лотів зберігаються однією транзакцією
+    db.session.commit()
+
+    picked_total = sum(result['picked'] for result in results)
+    message = f'Підтверджено відборів: {sum(1 for result in results if result["success"])} з {len(results)}, ' \
+              f'ящиків: {picked_total}, зібрано лотів: {len(completed)}'
+    print(message)
+    return {
+        'success': any(result['success'] for result in results),
+        'message': message if results else 'Немає сканувань для підтвердження',
+        'results': results,
+        'rejected': rejected,
+        'completed_lots': [lot.lot_number for lot in completed],
+        'remaining_lots': [lot.lot_number for lot in lots if lot.status != 'packed']
+    }
+
+
+def release_cluster(user_id):
+    """
+    Повертає в чергу ('wait') лоти кластера, з яких ще нічого не відібрано.
+    Замовлення без інших розпочатих лотів знову стають доступними всім.
+
+    Returns:
+        dict: Кількість повернених лотів
+    """
+    from models.order import Order
+
+    picked = exists().where(and_(
+        OrderLotProgress.order_lot_id == OrderLot.id,
+        OrderLotProgress.picked_boxes > 0
+    ))
+    lot_ids = [lot_id for (lot_id,) in db.session.query(OrderLot.id).filter(
+        OrderLot.status == 'start',
+        OrderLot.picker_id == user_id,
+        ~picked
+    )]
+    if lot_ids:
+        order_ids = {order_id for (order_id,) in db.session.query(OrderLot.order_id).filter(OrderLot.id.in_(lot_ids))}
+        db.session.execute(
+            update(OrderLot).where(OrderLot.id.in_(lot_ids), OrderLot.status == 'start').values(
+                status='wait', picker_id=None
+            ),
+            execution_options={'synchronize_session': False}
+        )
+        started = exists().where(and_(OrderLot.order_id == Order.id, OrderLot.status != 'wait'))
+        db.session.execute(
+            update(Order).where(
+                Order.id.in_(order_ids), Order.started_by_user_id == user_id, ~started
+            ).values(status='processing', started_by_user_id=None),
+            execution_options={'synchronize_session': False}
+        )
+    db.session.commit()
+
+    message = f'Повернено в чергу лотів: {len(lot_ids)}'
+    print(message)
+    return {'success': True, 'message': message, 'released': len(lot_ids)}
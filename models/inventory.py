@@ -2,6 +2,10 @@ from extensions import db
 from datetime import datetime
 
 class Inventory(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint('sku', 'location_id', name='uq_inventory_sku_location'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     sku = db.Column(db.String(50), nullable=False, index=True)
     location_id = db.Column(db.Integer, db.ForeignKey('storage_location.id'), nullable=True)
@@ -48,30 +52,13 @@ class Inventory(db.Model):
     @classmethod
     def unreserve_by_sku(cls, sku, quantity):
         """Скасовує резервування вказаної кількості товару за SKU"""
+        from models.inventory_reservation import release_batch
+
         if quantity <= 0:
             raise ValueError("Кількість для скасування резервування має бути більше нуля")
-            
-        # Знаходимо всі записи за SKU
-        items = cls.query.filter_by(sku=sku).order_by(cls.created_at).all()
-        
-        # Перевіряємо, чи достатньо зарезервовано
-        total_reserved = sum(item.reserved_quantity for item in items)
-        if total_reserved < quantity:
-            raise ValueError(f"Неможливо скасувати резервування. Всього зарезервовано: {total_reserved}, запитано: {quantity}")
-        
-        # Скасовуємо резервування
-        remaining = quantity
-        for item in items:
-            if item.reserved_quantity > 0:
-                to_unreserve = min(item.reserved_quantity, remaining)
-                item.reserved_quantity -= to_unreserve
-                remaining -= to_unreserve
-                
-                if remaining <= 0:
-                    break
-        
-        db.session.commit()
-        return True
+
+        # Рядки блокуються та змінюються в порядку FIFO (див. models/inventory_reservation.py)
+        return release_batch({sku: quantity})
         
     def can_reserve(self, quantity):
         """Перевіряє, чи можна зарезервувати вказану кількість товару"""
@@ -85,29 +72,14 @@ class Inventory(db.Model):
         
     @classmethod
     def reserve_by_sku(cls, sku, quantity):
-        """Резервує вказану кількість товару за SKU"""
+        """Резервує вказану кількість товару за SKU в місцях відбору (level = 1)"""
+        from models.inventory_reservation import reserve_batch
+
         if quantity <= 0:
             raise ValueError("Кількість для резервування має бути більше нуля")
-            
-        available = cls.get_total_available(sku)
-        if available < quantity:
-            raise ValueError(f"Недостатньо товару для резервування. Доступно: {available}, запитано: {quantity}")
-        
-        # Знаходимо всі записи за SKU і резервуємо потрібну кількість
-        items = cls.query.filter_by(sku=sku).order_by(cls.created_at).all()
-        remaining = quantity
-        
-        for item in items:
-            if item.available_quantity > 0:
-                to_reserve = min(item.available_quantity, remaining)
-                item.reserved_quantity += to_reserve
-                remaining -= to_reserve
-                
-                if remaining <= 0:
-                    break
-        
-        db.session.commit()
-        return True
+
+        # Перевірка доступності та резервування виконуються над заблокованими рядками
+        return reserve_batch({sku: quantity})
     
     @classmethod
     def get_by_sku(cls, sku):
@@ -117,27 +89,22 @@ class Inventory(db.Model):
     @classmethod
     def get_total_quantity(cls, sku):
         """Отримує загальну кількість товару за SKU"""
-        from sqlalchemy import func
-        result = db.session.query(func.sum(cls.quantity)).filter_by(sku=sku).scalar()
-        return result or 0
+        from models.inventory_summary import get_summary
+        summary = get_summary(sku)
+        return summary.quantity if summary else 0
     
     @classmethod
     def get_total_available(cls, sku):
         """Повертає загальну доступну кількість товару за SKU в місцях відбору (level = 1)"""
-        from models.storage import StorageLocation
-        
-        # Отримуємо всі записи інвентаря для SKU в місцях відбору (level = 1)
-        items = db.session.query(cls).join(
-            StorageLocation, cls.location_id == StorageLocation.id
-        ).filter(
-            cls.sku == sku,
-            StorageLocation.level == '1'
-        ).all()
+        from models.inventory_summary import get_summary
         
-        return sum(item.available_quantity for item in items)
+        # Зведення підтримується обробниками flush, тому це одне читання за первинним ключем
+        summary = get_summary(sku)
+        return summary.available_picking if summary else 0
     
     @classmethod
     def get_total_available_all_levels(cls, sku):
         """Повертає загальну доступну кількість товару за SKU по всіх рівнях складу"""
-        items = cls.query.filter_by(sku=sku).all()
-        return sum(item.available_quantity for item in items)
\ No newline at end of file
+        from models.inventory_summary import get_summary
+        summary = get_summary(sku)
+        return summary.available_quantity if summary else 0
@@ -3,94 +3,171 @@ from models.pending_transfer import PendingTransferRequest
 from models.storage import StorageLocation, SkuPickingLocation
 from models.received_inventory import ReceivedInventory
 
-def create_pending_transfer(sku, required_box_count):
+def _eligible_pallets(skus):
+    """
+    Палети на верхніх рівнях (level > 1) для всіх SKU одним запитом у порядку FEFO.
+    Палети, для яких вже є непідтверджений запит на переміщення, відкидаються (anti-join).
+    """
+    pending = db.session.query(PendingTransferRequest.id).filter(
+        PendingTransferRequest.sscc == ReceivedInventory.sscc,
+        PendingTransferRequest.confirmed == False  # noqa: E712
+    ).exists()
+
+    return db.session.query(
+        ReceivedInventory.sku,
+        ReceivedInventory.sscc,
+        ReceivedInventory.storage_location_id,
+        ReceivedInventory.box_count
+    ).join(
+        StorageLocation, StorageLocation.id == ReceivedInventory.storage_location_id
+    ).filter(
+        ReceivedInventory.sku.in_(skus),
+        StorageLocation.level > '1',
+        ReceivedInventory.box_count > 0,
+        ~pending
+    ).order_by(
+        ReceivedInventory.sku,
+        ReceivedInventory.expiry_date.is_(None),
+        ReceivedInventory.expiry_date,
+        StorageLocation.level,
+        ReceivedInventory.id
+    ).all()
+
+
+def _picking_slots(skus):
+    """
+    Місця відбору для всіх SKU: призначені (SkuPickingLocation), а для SKU без
+    призначення — різні вільні комірки level = 1 (без товару та без
+    непідтверджених переміщень у них).
+
+    Returns:
+        dict: {sku: ID комірки відбору}
+    """
+    slots = {}
+    assigned = db.session.query(SkuPickingLocation.sku, StorageLocation.id).join(
+        StorageLocation, StorageLocation.id == SkuPickingLocation.picking_location_id
+    ).filter(
+        SkuPickingLocation.sku.in_(skus),
+        StorageLocation.level == '1'
+    ).order_by(SkuPickingLocation.sku, StorageLocation.id).all()
+    for sku, location_id in assigned:
+        slots.setdefault(sku, location_id)
+
+    unassigned = [sku for sku in skus if sku not in slots]
+    if unassigned:
+        occupied = db.session.query(ReceivedInventory.storage_location_id).filter(
+            ReceivedInventory.box_count > 0,
+            ReceivedInventory.storage_location_id.isnot(None)
+        )
+        incoming = db.session.query(PendingTransferRequest.to_location_id).filter(
+            PendingTransferRequest.confirmed == False,  # noqa: E712
+            PendingTransferRequest.to_location_id.isnot(None)
+        )
+        free_locations = db.session.query(StorageLocation.id).filter(
+            StorageLocation.level == '1',
+            ~StorageLocation.id.in_(occupied),
+            ~StorageLocation.id.in_(incoming),
+            ~StorageLocation.id.in_(db.session.query(SkuPickingLocation.picking_location_id))
+        ).order_by(StorageLocation.id).limit(len(unassigned)).all()
+
+        for sku, (location_id,) in zip(unassigned, free_locations):
+            slots[sku] = location_id
+
+    return slots
+
+
+def create_pending_transfers(demands, commit=True):
+    """
+    Створює запити на переміщення товару з комірок зберігання (level > 1) до місць відбору (level = 1)
+    одразу для багатьох SKU.
+
+    Палети для всіх SKU вибираються одним запитом у порядку FEFO, місця відбору
+    підбираються разом для всіх SKU, а запити додаються одним пакетом.
+
+    Args:
+        demands: Словник {sku: необхідна кількість ящиків}
+        commit: Чи зберігати зміни одразу (False — запити лишаються в поточній транзакції)
+
+    Returns:
+        dict: Результат операції з кількістю створених запитів загалом і по SKU
+    """
+    demands = {sku: count for sku, count in demands.items() if count and count > 0}
+    skus = sorted(demands)
+    if not skus:
+        return {
+            'success': True,
+            'message': 'Створено 0 запитів на переміщення',
+            'created_requests': 0,
+            'created_by_sku': {},
+            'remaining_required': {},
+            'failed_skus': []
+        }
+
+    slots = _picking_slots(skus)
+    failed_skus = [sku for sku in skus if sku not in slots]
+
+    remaining = dict(demands)
+    created_by_sku = {}
+    transfer_requests = []
+    for sku, sscc, location_id, box_count in _eligible_pallets([sku for sku in skus if sku in slots]):
+        if remaining[sku] <= 0:
+            continue
+
+        # Переміщуємо всю палету
+        transfer_requests.append(PendingTransferRequest(
+            sku=sku,
+            sscc=sscc,
+            from_location_id=location_id,
+            to_location_id=slots[sku],
+            box_count=box_count  # Весь обсяг
+        ))
+        created_by_sku[sku] = created_by_sku.get(sku, 0) + 1
+        remaining[sku] -= box_count
+
+    db.session.add_all(transfer_requests)
+    if commit:
+        db.session.commit()
+
+    message = f'Створено {len(transfer_requests)} запитів на переміщення'
+    if failed_skus:
+        message += f". Не знайдено місця відбору для товарів: {', '.join(failed_skus)}"
+
+    return {
+        'success': len(failed_skus) < len(skus),
+        'message': message,
+        'created_requests': len(transfer_requests),
+        'created_by_sku': created_by_sku,
+        'remaining_required': {sku: max(count, 0) for sku, count in remaining.items()},
+        'failed_skus': failed_skus
+    }
+
+
+def create_pending_transfer(sku, required_box_count, commit=True):
     """
     Створює запити на переміщення товару з комірок зберігання (level > 1) до місць відбору (level = 1)
     
     Args:
         sku: Артикул товару
         required_box_count: Необхідна кількість ящиків для переміщення
+        commit: Чи зберігати зміни одразу (False — запити лишаються в поточній транзакції)
     
     Returns:
         dict: Результат операції з інформацією про створені запити
     """
-    # Комірки з рівнем > 1, де є товар
-    storage_locations = db.session.query(StorageLocation).join(
-        ReceivedInventory, StorageLocation.id == ReceivedInventory.storage_location_id
-    ).filter(
-        ReceivedInventory.sku == sku,
-        StorageLocation.level > '1',
-        ReceivedInventory.box_count > 0
-    ).order_by(StorageLocation.level).all()
-
-    # Призначене місце відбору
-    picking_location = db.session.query(StorageLocation).join(
-        SkuPickingLocation, StorageLocation.id == SkuPickingLocation.picking_location_id
-    ).filter(
-        SkuPickingLocation.sku == sku,
-        StorageLocation.level == '1'
-    ).first()
+    result = create_pending_transfers({sku: required_box_count}, commit=commit)
 
-    if not picking_location:
-        # Вільна комірка level=1, якщо не задана
-        picking_location = StorageLocation.query.filter(
-            StorageLocation.level == '1',
-            ~StorageLocation.id.in_(
-                db.session.query(ReceivedInventory.storage_location_id).filter(
-                    ReceivedInventory.box_count > 0
-                )
-            )
-        ).first()
-
-    if not picking_location:
+    if sku in result['failed_skus']:
         return {
             'success': False,
             'message': 'Не знайдено доступного місця відбору для товару',
             'created_requests': 0
         }
 
-    remaining_required = required_box_count
-    created_requests = 0
-
-    for location in storage_locations:
-        if remaining_required <= 0:
-            break
-
-        inventory_items = ReceivedInventory.query.filter(
-            ReceivedInventory.sku == sku,
-            ReceivedInventory.storage_location_id == location.id,
-            ReceivedInventory.box_count > 0
-        ).order_by(ReceivedInventory.expiry_date).all()
-
-        for item in inventory_items:
-            if remaining_required <= 0:
-                break
-
-            # Перевірка, чи для цього SSCC вже існує незавершене переміщення
-            existing_request = PendingTransferRequest.query.filter_by(sscc=item.sscc, confirmed=False).first()
-            if existing_request:
-                continue
-
-            # Переміщуємо всю палету
-            transfer_request = PendingTransferRequest(
-                sku=sku,
-                sscc=item.sscc,
-                from_location_id=location.id,
-                to_location_id=picking_location.id,
-                box_count=item.box_count  # Весь обсяг
-            )
-
-            db.session.add(transfer_request)
-            created_requests += 1
-            remaining_required -= item.box_count
-
-    db.session.commit()
-    
     return {
         'success': True,
-        'message': f'Створено {created_requests} запитів на переміщення',
-        'created_requests': created_requests,
-        'remaining_required': remaining_required
+        'message': f"Створено {result['created_requests']} запитів на переміщення",
+        'created_requests': result['created_requests'],
+        'remaining_required': result['remaining_required'].get(sku, 0)
     }
 
 def check_picking_availability(sku, required_quantity):
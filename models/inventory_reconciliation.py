@@ -0,0 +1,303 @@
+"""
+Звірка та відновлення таблиці Inventory з received_inventory.
+
+Очікувані кількості за (sku, location_id) рахуються одним згрупованим
+запитом по received_inventory, порівнюються з рядками inventory і,
+за потреби, виправляються порціями — кожна порція окремою короткою
+транзакцією. Виправлення умовні: рядок змінюється лише якщо його кількість
+не змінилась від моменту звірки, тож паралельне приймання не перезаписується.
+Для великих баз звірку можна запускати паралельно по діапазонах SKU.
+"""
+from extensions import db
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from sqlalchemy import func, select, update, bindparam
+from sqlalchemy.exc import IntegrityError
+from models.inventory import Inventory
+from models.received_inventory import ReceivedInventory
+
+DEFAULT_CHUNK_SIZE = 1000
+MAX_REPORTED_DIFFERENCES = 200
+
+
+def _sku_range_filter(column, sku_from, sku_to):
+    """Діапазон SKU [sku_from, sku_to)"""
+    conditions = []
+    if sku_from is not None:
+        conditions.append(column >= sku_from)
+    if sku_to is not None:
+        conditions.append(column < sku_to)
+    return conditions
+
+
+def _expected_quantities(sku_from, sku_to):
+    """Очікувані кількості {(sku, location_id): кількість} одним згрупованим запитом"""
+    rows = db.session.query(
+        ReceivedInventory.sku,
+        ReceivedInventory.storage_location_id,
+        func.sum(ReceivedInventory.box_count)
+    ).filter(
+        *_sku_range_filter(ReceivedInventory.sku, sku_from, sku_to)
+    ).group_by(
+        ReceivedInventory.sku,
+        ReceivedInventory.storage_location_id
+    ).all()
+    return {(sku, location_id): int(quantity or 0) for sku, location_id, quantity in rows}
+
+
+def _actual_rows(sku_from, sku_to):
+    table = Inventory.__table__
+    return db.session.execute(
+        select(table.c.id, table.c.sku, table.c.location_id, table.c.quantity, table.c.reserved_quantity).where(
+            *_sku_range_filter(table.c.sku, sku_from, sku_to)
+        )
+    ).all()
+
+
+def diff_inventory(sku_from=None, sku_to=None):
+    """
+    Порівнює inventory з очікуваними кількостями з received_inventory.
+
+    Returns:
+        list: Розбіжності у вигляді словників з полем 'action':
+            insert — рядка немає, хоча товар є;
+            delete — рядок є, хоча товару немає (або кількість <= 0);
+            update — кількість відрізняється або резерв перевищує кількість.
+    """
+    expected = _expected_quantities(sku_from, sku_to)
+    differences = []
+
+    for row in _actual_rows(sku_from, sku_to):
+        key = (row.sku, row.location_id)
+        quantity = expected.pop(key, 0)
+        if quantity <= 0:
+            differences.append({
+                'action': 'delete', 'id': row.id, 'sku': row.sku, 'location_id': row.location_id,
+                'quantity': row.quantity, 'expected_quantity': 0,
+                'reserved_quantity': row.reserved_quantity, 'expected_reserved': 0
+            })
+            continue
+
+        # Резерв не може перевищувати фактичну кількість
+        reserved = min(max(row.reserved_quantity, 0), quantity)
+        if row.quantity != quantity or row.reserved_quantity != reserved:
+            differences.append({
+                'action': 'update', 'id': row.id, 'sku': row.sku, 'location_id': row.location_id,
+                'quantity': row.quantity, 'expected_quantity': quantity,
+                'reserved_quantity': row.reserved_quantity, 'expected_reserved': reserved
+            })
+
+    for (sku, location_id), quantity in expected.items():
+        if quantity > 0:
+            differences.append({
+                'action': 'insert', 'id': None, 'sku': sku, 'location_id': location_id,
+                'quantity': 0, 'expected_quantity': quantity,
+                'reserved_quantity': 0, 'expected_reserved': 0
+            })
+
+    differences.sort(key=lambda d: (d['sku'], d['location_id'] is None, d['location_id'] or 0))
+    return differences
+
+
+def _apply_chunk(chunk):
+    """Застосовує порцію виправлень однією транзакцією; повертає кількість пропущених"""
+    from models.inventory_summary import recompute, insert_for_dialect
+
+    table = Inventory.__table__
+    connection = db.session.connection()
+    now = datetime.utcnow()
+    skipped = 0
+
+    # Не всі драйвери повертають кількість рядків для пакетних UPDATE/DELETE
+    sane_rowcount = connection.dialect.supports_sane_multi_rowcount
+
+    updates = [d for d in chunk if d['action'] == 'update']
+    if updates:
+        stmt = update(table).where(
+            table.c.id == bindparam('row_id'),
+            table.c.quantity == bindparam('old_quantity'),
+            table.c.reserved_quantity == bindparam('old_reserved')
+        ).values(
+            quantity=bindparam('new_quantity'),
+            reserved_quantity=bindparam('new_reserved'),
+            updated_at=now
+        )
+        result = connection.execute(stmt, [
+            {'row_id': d['id'], 'old_quantity': d['quantity'], 'old_reserved': d['reserved_quantity'],
+             'new_quantity': d['expected_quantity'], 'new_reserved': d['expected_reserved']}
+            for d in updates
+        ])
+        if sane_rowcount:
+            skipped += len(updates) - result.rowcount
+
+    deletes = [d for d in chunk if d['action'] == 'delete']
+    if deletes:
+        stmt = table.delete().where(
+            table.c.id == bindparam('row_id'),
+            table.c.quantity == bindparam('old_quantity')
+        )
+        result = connection.execute(stmt, [{'row_id': d['id'], 'old_quantity': d['quantity']} for d in deletes])
+        if sane_rowcount:
+            skipped += len(deletes) - result.rowcount
+
+    inserts = [d for d in chunk if d['action'] == 'insert']
+    if inserts:
+        # Рядок міг з'явитися після звірки (паралельне приймання) — такі пропускаємо.
+        # Рядки без локації унікальний ключ не захищає, тому їх перевіряємо запитом
+        existing = {
+            (sku, location_id) for sku, location_id in connection.execute(
+                select(table.c.sku, table.c.location_id).where(
+                    table.c.sku.in_({d['sku'] for d in inserts})
+                )
+            )
+        }
+        rows = [
+            {'sku': d['sku'], 'location_id': d['location_id'], 'quantity': d['expected_quantity'],
+             'reserved_quantity': 0, 'created_at': now, 'updated_at': now}
+            for d in inserts if (d['sku'], d['location_id']) not in existing
+        ]
+        inserted = 0
+        insert = insert_for_dialect(connection)
+        if rows and insert is not None:
+            # Паралельна вставка між перевіркою і INSERT упирається в uq_inventory_sku_location
+            stmt = insert(table).values(rows).on_conflict_do_nothing(
+                index_elements=['sku', 'location_id']
+            ).returning(table.c.id)
+            inserted = len(connection.execute(stmt).all())
+        else:
+            for row in rows:
+                try:
+                    with connection.begin_nested():
+                        connection.execute(table.insert().values(**row))
+                    inserted += 1
+                except IntegrityError:
+                    pass
+        skipped += len(inserts) - inserted
+
+    # Зведення залишків для змінених SKU перераховується в тій самій транзакції
+    recompute(db.session, {d['sku'] for d in chunk})
+    db.session.commit()
+    return skipped
+
+
+def reconcile_inventory(sku_from=None, sku_to=None, apply=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Звіряє inventory з received_inventory для діапазону SKU [sku_from, sku_to).
+
+    Args:
+        sku_from: Початок діапазону SKU (включно), None — без обмеження
+        sku_to: Кінець діапазону SKU (не включно), None — без обмеження
+        apply: Застосувати виправлення
+        chunk_size: Кількість виправлень в одній транзакції
+
+    Returns:
+        dict: Результат звірки з кількістю розбіжностей за типами
+    """
+    differences = diff_inventory(sku_from, sku_to)
+    counts = {'insert': 0, 'update': 0, 'delete': 0}
+    for d in differences:
+        counts[d['action']] += 1
+
+    applied = skipped = 0
+    if apply and differences:
+        chunk_size = max(chunk_size, 1)
+        for start in range(0, len(differences), chunk_size):
+            chunk = differences[start:start + chunk_size]
+            try:
+                chunk_skipped = _apply_chunk(chunk)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Помилка застосування порції виправлень Inventory: {str(e)}")
+                raise
+            skipped += chunk_skipped
+            applied += len(chunk) - chunk_skipped
+
+    range_label = f"{sku_from or '…'} – {sku_to or '…'}"
+    if not differences:
+        message = f'Inventory узгоджено з прийнятими палетами (SKU {range_label})'
+    elif apply:
+        message = f'Виправлено {applied} з {len(differences)} розбіжностей Inventory (SKU {range_label})'
+        if skipped:
+            message += f', пропущено через одночасні зміни: {skipped}'
+    else:
+        message = f'Знайдено {len(differences)} розбіжностей Inventory (SKU {range_label})'
+    print(message)
+
+    return {
+        'success': not differences or (apply and not skipped),
+        'message': message,
+        'sku_from': sku_from,
+        'sku_to': sku_to,
+        'counts': counts,
+        'applied': applied,
+        'skipped': skipped,
+        'differences': differences[:MAX_REPORTED_DIFFERENCES]
+    }
+
+
+def split_sku_ranges(parts):
+    """
+    Ділить множину SKU на parts діапазонів приблизно однакового розміру.
+
+    Returns:
+        list: Пари (sku_from, sku_to); перший sku_from і останній sku_to — None
+    """
+    skus = sorted(
+        {sku for (sku,) in db.session.query(ReceivedInventory.sku).distinct()} |
+        {sku for (sku,) in db.session.query(Inventory.sku).distinct()}
+    )
+    parts = max(1, min(parts, len(skus)))
+    if parts == 1:
+        return [(None, None)]
+
+    step = len(skus) / parts
+    bounds = [skus[int(round(i * step))] for i in range(1, parts)]
+    bounds = sorted(set(bounds))
+    edges = [None] + bounds + [None]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def reconcile_inventory_parallel(app, workers=4, apply=False, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Звіряє Inventory паралельно по діапазонах SKU.
+
+    Кожен потік працює у власному контексті застосунку (окрема сесія
+    та з'єднання), діапазони не перетинаються, тож блокування не конфліктують.
+    """
+    with app.app_context():
+        ranges = split_sku_ranges(workers)
+
+    def run(sku_range):
+        with app.app_context():
+            try:
+                return reconcile_inventory(sku_range[0], sku_range[1], apply=apply, chunk_size=chunk_size)
+            finally:
+                db.session.remove()
+
+    with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+        results = list(executor.map(run, ranges))
+
+    counts = {'insert': 0, 'update': 0, 'delete': 0}
+    for result in results:
+        for action, count in result['counts'].items():
+            counts[action] += count
+    total = sum(counts.values())
+    applied = sum(result['applied'] for result in results)
+    skipped = sum(result['skipped'] for result in results)
+
+    if not total:
+        message = f'Inventory узгоджено з прийнятими палетами ({len(ranges)} діапазонів SKU)'
+    elif apply:
+        message = f'Виправлено {applied} з {total} розбіжностей Inventory ({len(ranges)} діапазонів SKU)'
+    else:
+        message = f'Знайдено {total} розбіжностей Inventory ({len(ranges)} діапазонів SKU)'
+
+    return {
+        'success': all(result['success'] for result in results),
+        'message': message,
+        'counts': counts,
+        'applied': applied,
+        'skipped': skipped,
+        'ranges': [result['message'] for result in results],
+        'differences': [d for result in results for d in result['differences']][:MAX_REPORTED_DIFFERENCES]
+    }
@@ -0,0 +1,162 @@
+"""
+Резервування залишків Inventory з блокуванням рядків.
+
+Кандидати на резервування вибираються одним запитом для всіх SKU
+у порядку FIFO (created_at). На PostgreSQL рядки блокуються через
+SELECT ... FOR UPDATE SKIP LOCKED, а якщо незаблокованих рядків не вистачає —
+повторно з очікуванням блокування. На SQLite блокувань рядків немає, тому
+кожна зміна застосовується умовним UPDATE (WHERE доступно >= кількості):
+якщо інший процес встиг змінити рядок, розподіл повторюється.
+Зведення InventorySummary оновлюється в тій самій транзакції.
+"""
+from extensions import db
+from sqlalchemy import update
+from models.inventory import Inventory
+from models.storage import StorageLocation
+from models.inventory_summary import InventorySummary, add_reservation_delta, apply_deltas
+
+MAX_ATTEMPTS = 5
+
+
+class ReservationError(ValueError):
+    """Недостатньо товару для резервування або скасування резервування"""
+
+
+def _supports_row_locks():
+    return db.session.get_bind().dialect.name == 'postgresql'
+
+
+def _select_rows(skus, picking_only, releasing, skip_locked):
+    """Повертає (id, sku, вільна кількість, рівень) рядків-кандидатів у порядку FIFO"""
+    free = Inventory.reserved_quantity if releasing else Inventory.quantity - Inventory.reserved_quantity
+
+    query = db.session.query(Inventory.id, Inventory.sku, free, StorageLocation.level)
+    if picking_only:
+        query = query.join(StorageLocation, Inventory.location_id == StorageLocation.id).filter(
+            StorageLocation.level == '1'
+        )
+    else:
+        query = query.outerjoin(StorageLocation, Inventory.location_id == StorageLocation.id)
+    query = query.filter(
+        Inventory.sku.in_(skus),
+        free > 0
+    ).order_by(Inventory.sku, Inventory.created_at, Inventory.id)
+
+    if _supports_row_locks():
+        query = query.with_for_update(of=Inventory, skip_locked=skip_locked)
+    return query.all()
+
+
+def _allocate(rows, demands):
+    """Розподіляє потребу по рядках за один прохід. Повертає (розподіл, нестача)"""
+    remaining = dict(demands)
+    allocations = []
+    for row_id, sku, free, level in rows:
+        need = remaining.get(sku, 0)
+        if need <= 0:
+            continue
+        take = min(free, need)
+        allocations.append((row_id, sku, level, take))
+        remaining[sku] = need - take
+
+    shortages = {sku: qty for sku, qty in remaining.items() if qty > 0}
+    return allocations, shortages
+
+
+def _apply(row_id, delta, releasing):
+    """Атомарно змінює резерв рядка; повертає False, якщо рядок вже змінено іншим процесом"""
+    table = Inventory.__table__
+    if releasing:
+        stmt = update(table).where(
+            table.c.id == row_id,
+            table.c.reserved_quantity >= delta
+        ).values(reserved_quantity=table.c.reserved_quantity - delta)
+    else:
+        stmt = update(table).where(
+            table.c.id == row_id,
+            table.c.quantity - table.c.reserved_quantity >= delta
+        ).values(reserved_quantity=table.c.reserved_quantity + delta)
+    return db.session.execute(stmt).rowcount == 1
+
+
+def _change_reservations(demands, picking_only, releasing, commit):
+    demands = {sku: qty for sku, qty in demands.items() if qty}
+    for sku, qty in demands.items():
+        if qty < 0:
+            raise ValueError("Кількість для резервування має бути більше нуля")
+    if not demands:
+        return True
+
+    # Скидаємо незбережені зміни, щоб умовні UPDATE бачили актуальні дані
+    db.session.flush()
+
+    remaining = dict(demands)
+    summary_deltas = {}
+    for attempt in range(MAX_ATTEMPTS):
+        skus = sorted(sku for sku, qty in remaining.items() if qty > 0)
+        if not skus:
+            break
+
+        rows = _select_rows(skus, picking_only, releasing, skip_locked=True)
+        allocations, shortages = _allocate(rows, remaining)
+        if shortages and _supports_row_locks():
+            # Частина рядків заблокована іншими транзакціями — чекаємо на них
+            rows = _select_rows(skus, picking_only, releasing, skip_locked=False)
+            allocations, shortages = _allocate(rows, remaining)
+
+        if shortages:
+            sku, missing = next(iter(sorted(shortages.items())))
+            if releasing:
+                raise ReservationError(f"Неможливо скасувати резервування товару {sku}. "
+                                       f"Не вистачає зарезервованих {missing} з {remaining[sku]}")
+            raise ReservationError(f"Недостатньо товару {sku} для резервування. "
+                                   f"Не вистачає {missing} з {remaining[sku]}")
+
+        for row_id, sku, level, delta in allocations:
+            if _apply(row_id, delta, releasing):
+                remaining[sku] -= delta
+                add_reservation_delta(summary_deltas, sku, level, -delta if releasing else delta)
+    else:
+        if any(qty > 0 for qty in remaining.values()):
+            raise ReservationError("Не вдалося зарезервувати товар через одночасні зміни залишків")
+
+    # Прямі UPDATE не проходять через flush, тому зведення оновлюємо тут
+    apply_deltas(db.session.connection(), summary_deltas)
+
+    # Рядки Inventory та зведення в сесії могли застаріти після прямих UPDATE
+    for instance in db.session.identity_map.values():
+        if isinstance(instance, Inventory):
+            db.session.expire(instance, ['reserved_quantity'])
+        elif isinstance(instance, InventorySummary):
+            db.session.expire(instance)
+
+    if commit:
+        db.session.commit()
+    return True
+
+
+def reserve_batch(demands, picking_only=True, commit=True):
+    """
+    Резервує товар для кількох SKU одним викликом.
+
+    Args:
+        demands: Словник {sku: кількість}
+        picking_only: Резервувати лише в місцях відбору (level = 1)
+        commit: Чи зберігати зміни одразу
+
+    Raises:
+        ReservationError: Якщо для будь-якого SKU недостатньо товару
+    """
+    return _change_reservations(demands, picking_only, releasing=False, commit=commit)
+
+
+def release_batch(demands, picking_only=False, commit=True):
+    """
+    Скасовує резервування для кількох SKU одним викликом (FIFO за created_at).
+
+    Args:
+        demands: Словник {sku: кількість}
+        picking_only: Скасовувати лише в місцях відбору (level = 1)
+        commit: Чи зберігати зміни одразу
+    """
+    return _change_reservations(demands, picking_only, releasing=True, commit=commit)
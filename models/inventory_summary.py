@@ -0,0 +1,413 @@
+"""
+Зведені залишки за SKU (InventorySummary).
+
+Таблиця зберігає для кожного SKU загальну і зарезервовану кількість, а також
+доступну кількість у місцях відбору (level = 1) і на верхніх рівнях. Вона
+підтримується інкрементально: обробник before_flush рахує зміни рядків
+Inventory в сесії, а after_flush застосовує їх одним INSERT ... ON CONFLICT
+з додаванням різниць, тому паралельні транзакції не перетирають одна одну.
+Якщо попереднє значення рядка невідоме (атрибут прострочений) або рядок
+видалено, SKU перераховується з таблиці Inventory.
+
+Зміна рівня комірки (StorageLocation.level) через ORM перераховує SKU,
+що в ній лежать. Масові UPDATE storage_location в обхід ORM (міграції,
+SQL-скрипти зміни розмітки) зведення не бачить — після них потрібна
+команда flask inventory-summary-check --rebuild.
+
+Порожня таблиця при наявних рядках Inventory (база, оновлена до появи
+зведення) заповнюється автоматично при першому читанні чи записі
+(ensure_summary_seeded). Для перевірки та відновлення таблиці —
+check_inventory_summary (команда flask inventory-summary-check).
+"""
+from extensions import db
+from datetime import datetime
+from sqlalchemy import event, func, case, inspect, update
+from models.inventory import Inventory
+
+DELTAS_KEY = 'inventory_summary_deltas'
+RECOMPUTE_KEY = 'inventory_summary_recompute'
+SEEDED_KEY = 'inventory_summary_seeded'
+
+# Бази, для яких уже перевірено, що зведення заповнене (за URL з'єднання)
+_seeded_databases = set()
+
+
+class InventorySummary(db.Model):
+    __tablename__ = 'inventory_summary'
+    sku = db.Column(db.String(50), primary_key=True)
+    quantity = db.Column(db.Integer, default=0, nullable=False)
+    reserved_quantity = db.Column(db.Integer, default=0, nullable=False)
+    available_picking = db.Column(db.Integer, default=0, nullable=False)  # Доступно на рівні 1
+    available_upper = db.Column(db.Integer, default=0, nullable=False)  # Доступно на верхніх рівнях
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<InventorySummary {self.sku}: {self.available_picking}/{self.available_upper}>'
+
+    @property
+    def available_quantity(self):
+        """Доступна кількість по всіх рівнях складу"""
+        return self.available_picking + self.available_upper
+
+    @classmethod
+    def get_for_skus(cls, skus):
+        """Повертає словник {sku: InventorySummary} одним запитом"""
+        skus = list(set(skus))
+        if not skus:
+            return {}
+        ensure_summary_seeded(db.session)
+        return {summary.sku: summary for summary in cls.query.filter(cls.sku.in_(skus)).all()}
+
+
+def get_summary(sku):
+    """Зведення одного SKU за первинним ключем або None"""
+    ensure_summary_seeded(db.session)
+    return db.session.get(InventorySummary, sku)
+
+
+def contribution(quantity, reserved, level):
+    """Внесок рядка Inventory у зведення: (кількість, резерв, доступно на рівні 1, доступно вище)"""
+    quantity = quantity or 0
+    reserved = reserved or 0
+    available = quantity - reserved
+    if level == '1':
+        return (quantity, reserved, available, 0)
+    return (quantity, reserved, 0, available)
+
+
+def add_delta(deltas, sku, values, sign=1):
+    """Додає внесок рядка до накопичених різниць {sku: [q, r, pick, upper]}"""
+    current = deltas.setdefault(sku, [0, 0, 0, 0])
+    for i, value in enumerate(values):
+        current[i] += sign * value
+
+
+def add_reservation_delta(deltas, sku, level, reserved_delta):
+    """Різниця зведення для зміни резерву рядка на reserved_delta"""
+    add_delta(deltas, sku, contribution(0, reserved_delta, level))
+
+
+def _value(state, key, old):
+    """Старе (old=True) або нове значення атрибута; None в кортежі — значення невідоме"""
+    history = state.attrs[key].history
+    if old:
+        if history.deleted:
+            return (history.deleted[0],)
+        if history.unchanged:
+            return (history.unchanged[0],)
+        if history.added:
+            # Атрибут змінено без завантаження старого значення
+            return None
+        return (state.dict.get(key),) if key in state.dict else None
+    if history.added:
+        return (history.added[0],)
+    if history.unchanged:
+        return (history.unchanged[0],)
+    return (state.dict.get(key),) if key in state.dict else None
+
+
+def _row_values(state, old):
+    values = [_value(state, key, old) for key in ('sku', 'location_id', 'quantity', 'reserved_quantity')]
+    if any(value is None for value in values):
+        return None
+    return tuple(value[0] for value in values)
+
+
+def _load_levels(session, location_ids):
+    from models.storage import StorageLocation
+
+    location_ids = {location_id for location_id in location_ids if location_id is not None}
+    if not location_ids:
+        return {}
+    with session.no_autoflush:
+        rows = session.query(StorageLocation.id, StorageLocation.level).filter(
+            StorageLocation.id.in_(location_ids)
+        ).all()
+    return dict(rows)
+
+
+def insert_for_dialect(connection):
+    name = connection.dialect.name
+    if name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    elif name == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        return None
+    return insert
+
+
+def _upsert(connection, rows, additive):
+    """
+    Записує рядки зведення. additive=True — додає різниці до наявних значень,
+    additive=False — замінює значення (перерахунок).
+    """
+    if not rows:
+        return
+    table = InventorySummary.__table__
+    now = datetime.utcnow()
+    for row in rows:
+        row['updated_at'] = now
+
+    insert = insert_for_dialect(connection)
+    columns = ('quantity', 'reserved_quantity', 'available_picking', 'available_upper')
+    if insert is not None:
+        stmt = insert(table)
+        set_ = {
+            column: (table.c[column] + stmt.excluded[column]) if additive else stmt.excluded[column]
+            for column in columns
+        }
+        set_['updated_at'] = stmt.excluded.updated_at
+        connection.execute(stmt.on_conflict_do_update(index_elements=['sku'], set_=set_), rows)
+        return
+
+    # Інші СУБД: UPDATE, а для відсутніх SKU — INSERT
+    for row in rows:
+        values = {
+            column: (table.c[column] + row[column]) if additive else row[column]
+            for column in columns
+        }
+        values['updated_at'] = now
+        result = connection.execute(update(table).where(table.c.sku == row['sku']).values(**values))
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(**row))
+
+
+def ensure_summary_seeded(session):
+    """
+    Заповнює порожню таблицю зведення з Inventory.
+
+    Після оновлення бази таблиця порожня, і без цього всі SKU мали б нульову
+    доступність. Перевірка — один запит на процес і базу: після коміту
+    заповненої таблиці результат запам'ятовується.
+
+    Returns:
+        bool: True, якщо таблицю заповнено в цьому виклику
+    """
+    key = str(session.get_bind().url)
+    if key in _seeded_databases:
+        return False
+
+    connection = session.connection()
+    table = InventorySummary.__table__
+    if connection.execute(table.select().with_only_columns(table.c.sku).limit(1)).first() is not None:
+        # Рядки, додані поточною транзакцією, запам'ятовуються лише після її коміту
+        if not session.info.get(SEEDED_KEY):
+            _seeded_databases.add(key)
+        return False
+    if connection.execute(Inventory.__table__.select().with_only_columns(Inventory.__table__.c.id).limit(1)).first() is None:
+        return False
+
+    with session.no_autoflush:
+        aggregates = _aggregate_query(session).all()
+    _upsert(connection, list(_summary_rows(aggregates).values()), additive=False)
+    session.info[SEEDED_KEY] = key
+    print(f"Зведення залишків заповнено з Inventory ({len(aggregates)} SKU)")
+    return True
+
+
+def apply_deltas(connection, deltas, session=None):
+    """
+    Застосовує накопичені різниці {sku: [q, r, pick, upper]} одним запитом.
+
+    Різниці застосовуються після змін Inventory, тож якщо зведення щойно
+    заповнено з Inventory, вони вже враховані і пропускаються.
+    """
+    if ensure_summary_seeded(session or db.session):
+        return
+    rows = [
+        {
+            'sku': sku,
+            'quantity': delta[0],
+            'reserved_quantity': delta[1],
+            'available_picking': delta[2],
+            'available_upper': delta[3]
+        }
+        for sku, delta in sorted(deltas.items())
+        if any(delta)
+    ]
+    _upsert(connection, rows, additive=True)
+
+
+def _aggregate_query(session, skus=None):
+    """Зведення, пораховане з таблиці Inventory одним згрупованим запитом"""
+    from models.storage import StorageLocation
+
+    available = Inventory.quantity - Inventory.reserved_quantity
+    is_picking = StorageLocation.level == '1'
+    query = session.query(
+        Inventory.sku,
+        func.coalesce(func.sum(Inventory.quantity), 0),
+        func.coalesce(func.sum(Inventory.reserved_quantity), 0),
+        func.coalesce(func.sum(case((is_picking, available), else_=0)), 0),
+        func.coalesce(func.sum(case((is_picking, 0), else_=available)), 0)
+    ).outerjoin(
+        StorageLocation, Inventory.location_id == StorageLocation.id
+    )
+    if skus is not None:
+        query = query.filter(Inventory.sku.in_(skus))
+    return query.group_by(Inventory.sku)
+
+
+def _summary_rows(aggregates, skus=()):
+    rows = {
+        sku: {
+            'sku': sku,
+            'quantity': int(quantity),
+            'reserved_quantity': int(reserved),
+            'available_picking': int(picking),
+            'available_upper': int(upper)
+        }
+        for sku, quantity, reserved, picking, upper in aggregates
+    }
+    # SKU без жодного рядка Inventory — нульове зведення
+    for sku in skus:
+        rows.setdefault(sku, {'sku': sku, 'quantity': 0, 'reserved_quantity': 0,
+                              'available_picking': 0, 'available_upper': 0})
+    return rows
+
+
+def recompute(session, skus):
+    """Перераховує зведення вказаних SKU з таблиці Inventory"""
+    skus = sorted(set(skus))
+    if not skus:
+        return
+    with session.no_autoflush:
+        aggregates = _aggregate_query(session, skus).all()
+    _upsert(session.connection(), list(_summary_rows(aggregates, skus).values()), additive=False)
+
+
+def _relevelled_skus(session):
+    """SKU, що лежать у комірках, рівень яких змінено в сесії"""
+    from models.storage import StorageLocation
+
+    location_ids = [
+        instance.id for instance in session.dirty
+        if isinstance(instance, StorageLocation) and instance.id is not None
+        and inspect(instance).attrs.level.history.has_changes()
+    ]
+    if not location_ids:
+        return set()
+    with session.no_autoflush:
+        return {sku for (sku,) in session.query(Inventory.sku).filter(
+            Inventory.location_id.in_(location_ids)
+        ).distinct()}
+
+
+@event.listens_for(db.session, 'before_flush')
+def collect_inventory_changes(session, flush_context, instances):
+    """Рахує різниці зведення для нових і змінених рядків Inventory"""
+    changes = []
+    for instance in session.new:
+        if isinstance(instance, Inventory):
+            changes.append((None, instance))
+    for instance in session.dirty:
+        if isinstance(instance, Inventory) and session.is_modified(instance):
+            changes.append((instance, instance))
+    deleted_skus = {instance.sku for instance in session.deleted if isinstance(instance, Inventory)}
+    relevelled_skus = _relevelled_skus(session)
+    if not changes and not deleted_skus and not relevelled_skus:
+        return
+
+    deltas = session.info.setdefault(DELTAS_KEY, {})
+    recompute_skus = session.info.setdefault(RECOMPUTE_KEY, set())
+    # Видалені рядки могли бути змінені всередині іншого flush (історія атрибутів
+    # тоді недостовірна), тому SKU видалених рядків перераховуються після flush
+    recompute_skus.update(deleted_skus)
+    # Зміна рівня комірки переносить її залишок між "на рівні 1" і "вище"
+    recompute_skus.update(relevelled_skus)
+
+    rows = []
+    location_ids = set()
+    for old_instance, new_instance in changes:
+        state = inspect(old_instance if old_instance is not None else new_instance)
+        old = _row_values(state, old=True) if old_instance is not None else None
+        new = _row_values(state, old=False) if new_instance is not None else None
+        if state.obj().sku in recompute_skus:
+            continue
+        if (old_instance is not None and old is None) or (new_instance is not None and new is None):
+            recompute_skus.add(state.obj().sku)
+            continue
+        rows.append((old, new))
+        location_ids.update(values[1] for values in (old, new) if values)
+
+    levels = _load_levels(session, location_ids)
+    for old, new in rows:
+        if old:
+            add_delta(deltas, old[0], contribution(old[2], old[3], levels.get(old[1])), sign=-1)
+        if new:
+            add_delta(deltas, new[0], contribution(new[2], new[3], levels.get(new[1])))
+
+
+@event.listens_for(db.session, 'after_flush')
+def apply_inventory_changes(session, flush_context):
+    """Застосовує накопичені різниці зведення в тій самій транзакції"""
+    deltas = session.info.pop(DELTAS_KEY, None)
+    recompute_skus = session.info.pop(RECOMPUTE_KEY, None)
+    if deltas:
+        apply_deltas(session.connection(), deltas, session)
+    if recompute_skus:
+        recompute(session, recompute_skus)
+
+
+@event.listens_for(db.session, 'after_commit')
+def remember_seeded_summary(session):
+    key = session.info.pop(SEEDED_KEY, None)
+    if key:
+        _seeded_databases.add(key)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_inventory_changes(session):
+    session.info.pop(DELTAS_KEY, None)
+    session.info.pop(RECOMPUTE_KEY, None)
+    session.info.pop(SEEDED_KEY, None)
+
+
+def check_inventory_summary(rebuild=False):
+    """
+    Порівнює зведення з таблицею Inventory і за потреби відновлює його.
+
+    Args:
+        rebuild: Виправити розбіжності (перезаписати зведення для цих SKU)
+
+    Returns:
+        dict: Результат перевірки зі списком розбіжностей
+    """
+    expected = _summary_rows(_aggregate_query(db.session).all())
+    actual = {summary.sku: summary for summary in InventorySummary.query.all()}
+
+    columns = ('quantity', 'reserved_quantity', 'available_picking', 'available_upper')
+    mismatches = []
+    for sku in sorted(set(expected) | set(actual)):
+        row = expected.get(sku) or {'sku': sku, 'quantity': 0, 'reserved_quantity': 0,
+                                    'available_picking': 0, 'available_upper': 0}
+        summary = actual.get(sku)
+        current = {column: (getattr(summary, column) if summary else None) for column in columns}
+        if summary is not None and all(current[column] == row[column] for column in columns):
+            continue
+        # Нульові SKU без рядка зведення не вважаються розбіжністю
+        if summary is None and not any(row[column] for column in columns):
+            continue
+        mismatches.append({'sku': sku, 'expected': {c: row[c] for c in columns}, 'actual': current})
+
+    if rebuild and mismatches:
+        rows = [expected.get(m['sku']) or {'sku': m['sku'], **m['expected']} for m in mismatches]
+        _upsert(db.session.connection(), rows, additive=False)
+        db.session.commit()
+        # Зведення змінено напряму — оновлюємо об'єкти в сесії
+        db.session.expire_all()
+
+    if not mismatches:
+        message = f'Зведення залишків узгоджене ({len(expected)} SKU)'
+    elif rebuild:
+        message = f'Виправлено розбіжностей у зведенні залишків: {len(mismatches)}'
+    else:
+        message = f'Знайдено розбіжностей у зведенні залишків: {len(mismatches)}'
+    print(message)
+
+    return {
+        'success': rebuild or not mismatches,
+        'message': message,
+        'mismatches': mismatches
+    }
@@ -0,0 +1,170 @@
+"""
+Стрічка доступних для комплектації лотів.
+
+available_lots_page повертає сторінку лотів у статусі 'wait' одним
+запитом: сторінка ідентифікаторів лотів (keyset за OrderLot.id)
+з'єднується із замовленням і товарами лота, тож кількість запитів не
+залежить від кількості лотів.
+
+LotFeed сповіщає підписників (Server-Sent Events у routes/picking.py),
+коли транзакція, що створила лоти (process_order, release_wave),
+зафіксована. Підписник після сповіщення читає лише лоти з id, більшим за
+останній отриманий; однакові запити підписників обслуговуються з
+короткочасного кешу, тож десятки ТЗД не повторюють той самий запит.
+Очікування має тайм-аут, тому лоти, створені іншим процесом сервера,
+теж надходять не пізніше ніж за FEED_HEARTBEAT секунд.
+"""
+import time
+import threading
+from extensions import db
+from sqlalchemy import event, func, select
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+AVAILABLE_ORDER_STATUSES = ('processing', 'assembling')
+FEED_HEARTBEAT = 15     # Максимальне очікування сповіщення, с
+FEED_STREAM_SECONDS = 25  # Тривалість одного SSE-з'єднання (як long polling); клієнт перепідключається сам
+FEED_CACHE_TTL = 1.0    # Скільки секунд відповідь для однакового курсора береться з кешу
+LOTS_CREATED_KEY = 'lot_feed_lots_created'
+
+
+def page_size(value):
+    """Розмір сторінки з параметра запиту в межах 1..MAX_PAGE_SIZE"""
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def available_lots_page(after_id=None, limit=DEFAULT_PAGE_SIZE):
+    """
+    Сторінка лотів у статусі 'wait' із замовлень, що обробляються, одним запитом.
+
+    Args:
+        after_id: Повернути лоти з id, більшим за цей (курсор попередньої сторінки)
+        limit: Кількість лотів на сторінці
+
+    Returns:
+        dict: lots (lot_id, lot_number, order_number, status, sku_list),
+              has_more, next_after (курсор наступної сторінки) і last_id
+              (найбільший id лота — з нього стрічка починає надсилати нові лоти)
+    """
+    from models.order import Order, OrderItem
+    from models.order_lot import OrderLot
+
+    # limit + 1 ідентифікатор: зайвий лише показує, що є наступна сторінка
+    page = select(OrderLot.id).join(Order, Order.id == OrderLot.order_id).where(
+        OrderLot.status == 'wait',
+        Order.status.in_(AVAILABLE_ORDER_STATUSES)
+    )
+    if after_id:
+        page = page.where(OrderLot.id > after_id)
+    page = page.order_by(OrderLot.id).limit(limit + 1).subquery()
+    last_id = select(func.max(OrderLot.id)).scalar_subquery()
+
+    rows = db.session.query(
+        OrderLot.id, OrderLot.lot_number, OrderLot.status, Order.order_number, OrderItem.sku, last_id
+    ).join(
+        page, page.c.id == OrderLot.id
+    ).join(
+        Order, Order.id == OrderLot.order_id
+    ).outerjoin(
+        OrderItem, OrderItem.lot_number == OrderLot.lot_number
+    ).order_by(OrderLot.id, OrderItem.id).all()
+
+    lots = {}
+    max_id = after_id or 0
+    for lot_id, lot_number, status, order_number, sku, latest in rows:
+        lot = lots.get(lot_id)
+        if lot is None:
+            lot = lots[lot_id] = {
+                'lot_id': lot_id,
+                'lot_number': lot_number,
+                'order_number': order_number,
+                'status': status,
+                'sku_list': []
+            }
+        if sku is not None:
+            lot['sku_list'].append(sku)
+        max_id = max(max_id, latest or 0)
+
+    lots = list(lots.values())
+    has_more = len(lots) > limit
+    lots = lots[:limit]
+    if not rows:
+        max_id = max(max_id, db.session.query(func.max(OrderLot.id)).scalar() or 0)
+    return {
+        'lots': lots,
+        'has_more': has_more,
+        'next_after': lots[-1]['lot_id'] if lots else after_id,
+        'last_id': max_id
+    }
+
+
+class LotFeed:
+    """Сповіщення про нові лоти в межах процесу з кешем відповідей для підписників"""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._version = 0
+        self._cache = {}
+
+    @property
+    def version(self):
+        return self._version
+
+    def publish(self):
+        """Викликається після коміту транзакції, що створила лоти"""
+        with self._condition:
+            self._version += 1
+            self._cache.clear()
+            self._condition.notify_all()
+
+    def wait(self, version, timeout=FEED_HEARTBEAT):
+        """Чекає на нові лоти після version; повертає поточну версію"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._version != version, timeout)
+            return self._version
+
+    def lots_after(self, after_id, limit=MAX_PAGE_SIZE):
+        """Лоти з id > after_id; підписники з тим самим курсором ділять один запит"""
+        key = (after_id, limit)
+        with self._condition:
+            cached = self._cache.get(key)
+            version = self._version
+        if cached and time.monotonic() - cached[0] < FEED_CACHE_TTL:
+            return cached[1]
+
+        page = available_lots_page(after_id, limit)
+        with self._condition:
+            # Відповідь, прочитану до нового сповіщення, не кешуємо — вона може бути неповною
+            if version == self._version:
+                self._cache[key] = (time.monotonic(), page)
+        return page
+
+
+lot_feed = LotFeed()
+
+
+@event.listens_for(db.session, 'after_flush')
+def remember_created_lots(session, flush_context):
+    from models.order_lot import OrderLot
+
+    if any(isinstance(obj, OrderLot) for obj in session.new):
+        session.info[LOTS_CREATED_KEY] = True
+
+
+@event.listens_for(db.session, 'after_commit')
+def publish_created_lots(session):
+    """Підписники дізнаються про лоти лише після коміту, коли їх видно іншим з'єднанням"""
+    if session.info.pop(LOTS_CREATED_KEY, False):
+        lot_feed.publish()
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_created_lots(session):
+    # Відкат точки збереження (пропущене замовлення хвилі) не скасовує лоти інших замовлень
+    if session.in_nested_transaction():
+        return
+    session.info.pop(LOTS_CREATED_KEY, None)
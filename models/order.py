@@ -1,5 +1,6 @@
 from extensions import db
 from datetime import datetime
+from sqlalchemy import insert
 import math
 
 
@@ -18,6 +19,7 @@ class Order(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     requires_transfer = db.Column(db.Boolean, default=False)  # Чи потребує замовлення переміщення товарів
+    priority = db.Column(db.Integer, default=0, nullable=False)  # Пріоритет при хвильовій обробці (більше — раніше)
 
     
     # Relationships
@@ -46,29 +48,28 @@ class Order(db.Model):
             
         return True
         
-    def calculate_pallets(self):
+    def calculate_pallets(self, snapshot=None):
         """Розраховує кількість палет, необхідних для замовлення, на основі об'єму товарів"""
-        from models import LogisticsItemData
+        from models.order_planning import OrderPlanningSnapshot
+
+        own_snapshot = snapshot is None
+        if own_snapshot:
+            snapshot = OrderPlanningSnapshot.for_order(self)
 
         STANDARD_PALLET_VOLUME = 960000  # 120 * 80 * 100 см³
         total_volume = 0
 
         for item in self.items:
-            if not all([item.length_cm, item.width_cm, item.height_cm]):
-                logistics_data = LogisticsItemData.query.filter_by(sku=item.sku).first()
-                if logistics_data:
-                    item.length_cm = logistics_data.length
-                    item.width_cm = logistics_data.width
-                    item.height_cm = logistics_data.height
-                    db.session.commit()
-                else:
-                    continue
-
             # Отримуємо логістичну інформацію
-            logistics_data = LogisticsItemData.query.filter_by(sku=item.sku).first()
+            logistics_data = snapshot.get_logistics(item.sku)
             if not logistics_data:
                 continue
 
+            if not all([item.length_cm, item.width_cm, item.height_cm]):
+                item.length_cm = logistics_data.length
+                item.width_cm = logistics_data.width
+                item.height_cm = logistics_data.height
+
             unit_volume = item.length_cm * item.width_cm * item.height_cm
 
             if logistics_data.packaging_unit_type == "ШТ":
@@ -85,30 +86,45 @@ class Order(db.Model):
         # Розраховуємо кількість палет (округлюємо вгору)
         if total_volume > 0:
             self.pallets_count = math.ceil(total_volume / STANDARD_PALLET_VOLUME)
-            db.session.commit()
+            if own_snapshot:
+                db.session.commit()
             return self.pallets_count
 
         return 0
 
     
-    def split_items_by_volume(self):
+    def split_items_by_volume(self, snapshot=None, strategy=None):
         """
-        Розбиває товари по палетах з урахуванням спільного об'єму (жадібний алгоритм).
+        Розбиває товари по палетах з урахуванням спільного об'єму та максимальної ваги палети.
         Товари з різними SKU можуть бути на одній палеті, якщо вміщаються по об'єму.
         Ураховує кратність упаковки для штучного товару та доступність товару на складі.
+        Стратегія формування палет (greedy, first_fit_decreasing, best_fit) береться
+        з параметра strategy або з налаштування PALLET_BUILDING_STRATEGY.
         """
-        from models import LogisticsItemData, OrderItem
-        from models.inventory import Inventory
-
-        PALLET_VOLUME = 960000
-        pallets = []  # Список палет: [{'number': int, 'volume': float, 'items': []}]
-        next_pallet_number = 1
-        new_items = []
+        from flask import current_app
+        from models import OrderItem
+        from models.order_planning import OrderPlanningSnapshot
+        from models.pallet_building import get_pallet_builder, MAX_PALLET_WEIGHT
+
+        own_snapshot = snapshot is None
+        if own_snapshot:
+            snapshot = OrderPlanningSnapshot.for_order(self)
+
+        builder = get_pallet_builder(
+            strategy or current_app.config.get('PALLET_BUILDING_STRATEGY'),
+            max_weight=current_app.config.get('MAX_PALLET_WEIGHT', MAX_PALLET_WEIGHT)
+        )
+
+        # Позиції для формування палет: (товар, логістика, кратність, ваговий)
+        lines = []
+        unit_volumes = []
+        unit_weights = []
+        box_counts = []
         skipped_items = []
 
         for item in self.items:
             # Перевіряємо загальний доступний залишок по всіх рівнях складу
-            total_available = Inventory.get_total_available_all_levels(item.sku) if hasattr(Inventory, 'get_total_available_all_levels') else Inventory.get_total_available(item.sku)
+            total_available = snapshot.get_total_available_all_levels(item.sku)
             
             # Якщо товару немає в наявності, пропускаємо його
             if total_available <= 0:
@@ -125,7 +141,7 @@ class Order(db.Model):
                 print(f"Кількість товару {item.sku} обмежена до {total_available} (було {item.quantity})")
                 item.quantity = total_available
             
-            logistics = LogisticsItemData.query.filter_by(sku=item.sku).first()
+            logistics = snapshot.get_logistics(item.sku)
             if not logistics:
                 continue
 
@@ -141,60 +157,32 @@ class Order(db.Model):
             # Обʼєм одиниці для вагового товару — просто упаковка; для штучного — ящик
             unit_volume = logistics.length * logistics.width * logistics.height
             if is_weight_based:
-                boxes_remaining = item.quantity  # для вагових товарів: 1 шт = 1 "ящик"
+                boxes = item.quantity  # для вагових товарів: 1 шт = 1 "ящик"
             else:
-                boxes_remaining = math.ceil(item.quantity / multiplicity)  # кількість ящиків
-
-            while boxes_remaining > 0:
-                placed = False
-                for pallet in pallets:
-                    if pallet['volume'] + unit_volume <= PALLET_VOLUME:
-                        qty_fit = min(
-                            boxes_remaining,
-                            int((PALLET_VOLUME - pallet['volume']) // unit_volume)
-                        )
-                        if qty_fit > 0:
-                            actual_qty = qty_fit if is_weight_based else qty_fit * multiplicity
-                            new_item = OrderItem(
-                                sku=item.sku,
-                                product_name=item.product_name,
-                                quantity=actual_qty,
-                                unit_price=item.unit_price,
-                                pallet_number=pallet['number'],
-                                length_cm=logistics.length,
-                                width_cm=logistics.width,
-                                height_cm=logistics.height,
-                                is_weight_based=is_weight_based
-                            )
-                            pallet['volume'] += qty_fit * unit_volume
-                            pallet['items'].append(new_item)
-                            new_items.append(new_item)
-                            boxes_remaining -= qty_fit
-                            placed = True
-                        break
-
-                if not placed:
-                    qty_fit = min(boxes_remaining, int(PALLET_VOLUME // unit_volume)) or 1
-                    actual_qty = qty_fit if is_weight_based else qty_fit * multiplicity
-                    new_item = OrderItem(
-                        sku=item.sku,
-                        product_name=item.product_name,
-                        quantity=actual_qty,
-                        unit_price=item.unit_price,
-                        pallet_number=next_pallet_number,
-                        length_cm=logistics.length,
-                        width_cm=logistics.width,
-                        height_cm=logistics.height,
-                        is_weight_based=is_weight_based
-                    )
-                    pallets.append({
-                        'number': next_pallet_number,
-                        'volume': qty_fit * unit_volume,
-                        'items': [new_item]
-                    })
-                    new_items.append(new_item)
-                    boxes_remaining -= qty_fit
-                    next_pallet_number += 1
+                boxes = math.ceil(item.quantity / multiplicity)  # кількість ящиків
+
+            lines.append((item, logistics, multiplicity, is_weight_based))
+            unit_volumes.append(unit_volume)
+            unit_weights.append(snapshot.get_avg_box_weight(item.sku) or 0)
+            box_counts.append(boxes)
+
+        # Формуємо компактний план, а OrderItem створюємо лише з готового плану
+        plan = builder.build(unit_volumes, unit_weights, box_counts)
+
+        new_items = []
+        for line_index, pallet_number, boxes in plan:
+            item, logistics, multiplicity, is_weight_based = lines[line_index]
+            new_items.append(OrderItem(
+                sku=item.sku,
+                product_name=item.product_name,
+                quantity=boxes if is_weight_based else boxes * multiplicity,
+                unit_price=item.unit_price,
+                pallet_number=pallet_number,
+                length_cm=logistics.length,
+                width_cm=logistics.width,
+                height_cm=logistics.height,
+                is_weight_based=is_weight_based
+            ))
 
         # Виводимо інформацію про пропущені товари
         if skipped_items:
@@ -204,11 +192,12 @@ class Order(db.Model):
 
         self.items.clear()
         self.items.extend(new_items)
-        self.pallets_count = len(pallets)
-        db.session.commit()
+        self.pallets_count = plan.pallets_count
+        if own_snapshot:
+            db.session.commit()
         return True
     
-    def create_lots(self):
+    def create_lots(self, commit=True):
         """Створює лоти для товарів на основі розподілу по палетах.
         Лоти створюються для всіх товарів, які мають призначений номер палети,
         незалежно від того, чи були вони зарезервовані та чи потребують переміщення."""
@@ -218,7 +207,7 @@ class Order(db.Model):
         
         # Генеруємо лоти для кожної палети
         from datetime import date
-        from models.order_lot import OrderLot
+        from models.order_lot import OrderLot, OrderLotProgress, lot_requirements, count_remaining_lines, lot_progress_rows
         today = date.today()
         
         # Змінено: отримуємо всі товари з призначеним номером палети, незалежно від статусу резервування
@@ -227,6 +216,7 @@ class Order(db.Model):
         # Визначаємо унікальні номери палет для всіх товарів
         pallet_numbers = set(item.pallet_number for item in all_items_with_pallet)
         
+        new_lots = []
         for pallet_num in pallet_numbers:
             # Отримуємо всі товари для цієї палети
             pallet_items = [item for item in all_items_with_pallet if item.pallet_number == pallet_num]
@@ -244,48 +234,72 @@ class Order(db.Model):
                 print(f"Створено лот {lot_number} для товару {item.sku} ({item.product_name}){quantity_info}")
             
             # Створюємо запис в таблиці OrderLot зі статусом 'wait'
+            required = lot_requirements(pallet_items)
             order_lot = OrderLot(
                 lot_number=lot_number,
                 order_id=self.id,
                 status='wait',
-                pallet_number=pallet_num
+                pallet_number=pallet_num,
+                remaining_lines=count_remaining_lines(required)
             )
             db.session.add(order_lot)
+            new_lots.append((order_lot, required))
         
+        # Прогрес відбору по SKU всіх нових лотів одним пакетним INSERT
+        if new_lots:
+            db.session.flush()
+            progress_rows = [row for order_lot, required in new_lots for row in lot_progress_rows(order_lot, required)]
+            if progress_rows:
+                db.session.execute(insert(OrderLotProgress), progress_rows)
+
         # Підраховуємо кількість створених лотів
         created_lots_count = len(pallet_numbers)
         print(f"Створено {created_lots_count} лотів для замовлення {self.order_number}")
         
-        db.session.commit()
+        if commit:
+            db.session.commit()
         return True
     
     def process_order(self):
         """Обробляє замовлення: розраховує палети, створює лоти, резервує товари.
         Обробляє лише ту кількість товару, яка реально доступна на складі.
-        Створює лоти незалежно від підтвердження переміщення."""
+        Створює лоти незалежно від підтвердження переміщення.
+
+        Логістичні дані та залишки для всіх SKU замовлення завантажуються
+        одним знімком, усі кроки працюють з ним у пам'яті, а результат
+        зберігається однією транзакцією."""
+        from models.order_planning import OrderPlanningSnapshot
+        from models.inventory_management import create_pending_transfers
+        from models.pick_task import allocate_pick_tasks
+
         try:
-            # Крок 0: Адаптивна обробка вагових товарів
-            self.adapt_weight_based_items()
-            
-            # Крок 1: Розрахунок кількості палет
-            self.calculate_pallets()
-            
-            # Крок 2: Розподіл товарів по палетах з урахуванням доступності
-            self.split_items_by_volume()
-            
-            # Крок 3: Резервування товарів та отримання списку оброблених товарів
-            processed_items = self.reserve_inventory()
+            # Знімок логістики та залишків для всіх SKU замовлення
+            snapshot = OrderPlanningSnapshot.for_order(self)
+
+            # Кроки 0-3: ваговий товар, палети, розподіл та резервування
+            transfer_demand = {}
+            processed_items = self.plan_order(snapshot, transfer_demand)
             
             # Якщо немає жодного обробленого товару, повертаємо помилку
             if not processed_items:
+                db.session.rollback()
                 print(f"Замовлення {self.order_number} не може бути оброблене: немає доступних товарів")
                 return False
             
+            # Резервуємо весь товар замовлення одним викликом із блокуванням рядків
+            snapshot.apply_reservations()
+
+            # Запити на переміщення для всієї нестачі замовлення одним пакетом
+            create_pending_transfers(transfer_demand, commit=False)
+
             # Крок 4: Створення лотів для всіх товарів, незалежно від підтвердження переміщення
             # Змінено: створюємо лоти навіть якщо товар знаходиться на верхніх рівнях і потребує переміщення
-            self.create_lots()
+            self.create_lots(commit=False)
+
+            # Завдання на відбір: палети для кожної позиції лотів за FEFO
+            allocate_pick_tasks([self])
             
-            # Крок 5: Оновлення статусу замовлення
+            # Крок 5: Оновлення статусу замовлення та збереження всіх змін однією транзакцією
             self.status = 'processing'
             db.session.commit()
             
@@ -300,31 +314,49 @@ class Order(db.Model):
             print(f"Помилка обробки замовлення: {str(e)}")
             raise e
             
-    def adapt_weight_based_items(self):
+    def plan_order(self, snapshot, transfer_demand=None):
+        """Виконує кроки планування замовлення над спільним знімком без коміту.
+
+        Args:
+            snapshot: OrderPlanningSnapshot з SKU цього замовлення
+            transfer_demand: Словник {sku: кількість} для накопичення нестачі;
+                запити на переміщення створює викликач (create_pending_transfers)
+
+        Returns:
+            list: Оброблені товарні позиції
+        """
+        # Крок 0: Адаптивна обробка вагових товарів
+        self.adapt_weight_based_items(snapshot)
+        
+        # Крок 1: Розрахунок кількості палет
+        self.calculate_pallets(snapshot)
+        
+        # Крок 2: Розподіл товарів по палетах з урахуванням доступності
+        self.split_items_by_volume(snapshot)
+        
+        # Крок 3: Резервування товарів та отримання списку оброблених товарів
+        return self.reserve_inventory(snapshot, transfer_demand)
+
+    def adapt_weight_based_items(self, snapshot=None):
         """Адаптивна обробка вагових товарів (packaging_unit_type == 'КГ')
         Конвертує вагу в приблизну кількість ящиків на основі середньої ваги"""
-        from models import LogisticsItemData
-        from models.inventory import Inventory
-        from models.received_inventory import ReceivedInventory
-        import math
+        from models.order_planning import OrderPlanningSnapshot
+
+        own_snapshot = snapshot is None
+        if own_snapshot:
+            snapshot = OrderPlanningSnapshot.for_order(self)
         
         for item in self.items:
             # Отримуємо логістичні дані
-            logistics_item = LogisticsItemData.query.filter_by(sku=item.sku).first()
+            logistics_item = snapshot.get_logistics(item.sku)
             if not logistics_item or logistics_item.packaging_unit_type != 'КГ':
                 continue
             
-            # Отримуємо всі прийняті палети для SKU
-            received_items = ReceivedInventory.query.filter_by(sku=item.sku).all()
-            
-            total_weight = sum(p.net_weight for p in received_items if p.net_weight)
-            total_boxes = sum(p.box_count for p in received_items if p.box_count)
-
-            if total_boxes == 0 or total_weight == 0:
+            # Середня вага ящика за всіма прийнятими палетами SKU
+            avg_weight_per_box = snapshot.get_avg_box_weight(item.sku)
+            if not avg_weight_per_box:
                 continue  # Уникаємо ділення на нуль
 
-            avg_weight_per_box = total_weight / total_boxes
-
             requested_weight = item.quantity  # у КГ
             estimated_box_count = math.ceil(requested_weight / avg_weight_per_box)
             
@@ -336,23 +368,33 @@ class Order(db.Model):
             item.is_weight_based = True
             
             # Перевіряємо загальний доступний залишок по всіх рівнях складу
-            total_available = Inventory.get_total_available_all_levels(item.sku)
+            total_available = snapshot.get_total_available_all_levels(item.sku)
             
             # Якщо доступно менше, ніж запитано, обмежуємо кількість
             if total_available < estimated_box_count:
                 print(f"Для товару {item.sku} ({item.product_name}) доступно лише {total_available} з {estimated_box_count} необхідних ящиків")
                 item.quantity = total_available
 
-        db.session.commit()
+        if own_snapshot:
+            db.session.commit()
     
-    def reserve_inventory(self):
+    def reserve_inventory(self, snapshot=None, transfer_demand=None):
         """Резервує товари з інвентаря для цього замовлення та створює запити на переміщення при необхідності.
         Обробляє лише ту кількість товару, яка реально доступна на складі.
-        Створює переміщення для різниці між потрібною та доступною кількістю товару."""
-        from models.inventory import Inventory
-        from models.inventory_management import check_picking_availability, create_pending_transfer
-        from models.pending_transfer import PendingTransferRequest
-        from models import LogisticsItemData, OrderItem
+        Створює переміщення для різниці між потрібною та доступною кількістю товару.
+        Якщо передано transfer_demand, різниця лише додається до нього, а запити
+        на переміщення створює викликач (одним набором для всього замовлення чи хвилі)."""
+        from models.inventory_management import create_pending_transfers
+        from models.order_planning import OrderPlanningSnapshot
+
+        own_snapshot = snapshot is None
+        if own_snapshot:
+            snapshot = OrderPlanningSnapshot.for_order(self)
+        
+        # Нестача накопичується і перетворюється на запити одним пакетом
+        own_transfer_demand = transfer_demand is None
+        if own_transfer_demand:
+            transfer_demand = {}
         
         # Список товарів, для яких створено запити на переміщення
         items_requiring_transfer = []
@@ -364,7 +406,7 @@ class Order(db.Model):
         
         for item in self.items:
             # Перевіряємо загальний доступний залишок по всіх рівнях складу
-            total_available_all_levels = Inventory.get_total_available_all_levels(item.sku) if hasattr(Inventory, 'get_total_available_all_levels') else Inventory.get_total_available(item.sku)
+            total_available_all_levels = snapshot.get_total_available_all_levels(item.sku)
             
             # Якщо товару недостатньо сумарно по всіх рівнях, обмежуємо кількість
             if total_available_all_levels < item.quantity:
@@ -380,7 +422,7 @@ class Order(db.Model):
                 print(f"Кількість товару {item.sku} обмежена до {item.quantity} (було {original_quantity})")
             
             # Отримуємо доступну кількість товару в місцях відбору (level = 1)
-            available_at_picking = Inventory.get_total_available(item.sku)
+            available_at_picking = snapshot.get_total_available(item.sku)
             
             # Визначаємо, скільки можемо зарезервувати з місць відбору
             to_reserve = min(available_at_picking, item.quantity)
@@ -396,8 +438,9 @@ class Order(db.Model):
                 
                 print(f"Товар {item.sku} ({item.product_name}) частково доступний. Доступно: {available_at_picking}, потрібно: {item.quantity}, різниця: {difference}")
                 
-                # Створюємо запит на переміщення для різниці
-                transfer_result = create_pending_transfer(item.sku, difference)
+                # Додаємо різницю до нестачі для запитів на переміщення і знімаємо її зі знімка
+                transfer_demand[item.sku] = transfer_demand.get(item.sku, 0) + difference
+                snapshot.claim_transfer(item.sku, difference)
                 
                 # Додаємо інформацію про переміщення
                 items_requiring_transfer.append({
@@ -406,12 +449,9 @@ class Order(db.Model):
                     'quantity': item.quantity,
                     'available': available_at_picking,
                     'required': item.quantity,
-                    'difference': difference,
-                    'created_requests': transfer_result.get('created_requests', 0)
+                    'difference': difference
                 })
                 
-                transfer_requests_created += transfer_result.get('created_requests', 0)
-                
                 # Позначаємо замовлення як таке, що потребує переміщення
                 self.requires_transfer = True
                 
@@ -419,7 +459,7 @@ class Order(db.Model):
                 if to_reserve > 0:
                     try:
                         # Резервуємо доступну кількість
-                        Inventory.reserve_by_sku(item.sku, to_reserve)
+                        snapshot.reserve(item.sku, to_reserve)
                         
                         # Оновлюємо інформацію про резервування в OrderItem
                         item.reserved_quantity = to_reserve
@@ -445,7 +485,7 @@ class Order(db.Model):
                 # Якщо доступно достатньо товару на місцях відбору
                 try:
                     # Резервуємо всю потрібну кількість
-                    Inventory.reserve_by_sku(item.sku, item.quantity)
+                    snapshot.reserve(item.sku, item.quantity)
                     
                     # Оновлюємо інформацію про резервування в OrderItem
                     item.reserved_quantity = item.quantity
@@ -458,13 +498,20 @@ class Order(db.Model):
                     item.reservation_status = 'unreserved'
                     item.reserved_quantity = 0
         
+        # Запити на переміщення для всієї нестачі одним пакетом
+        if own_transfer_demand and transfer_demand:
+            transfer_requests_created = create_pending_transfers(transfer_demand, commit=False)['created_requests']
+        
         # Зберігаємо зміни
-        db.session.commit()
+        if own_snapshot:
+            snapshot.apply_reservations()
+            db.session.commit()
         
         # Якщо є товари, для яких створено запити на переміщення, виводимо інформацію
         if items_requiring_transfer:
             self.requires_transfer = True
-            print(f"Створено {transfer_requests_created} запитів на переміщення для замовлення {self.order_number}")
+            if own_transfer_demand:
+                print(f"Створено {transfer_requests_created} запитів на переміщення для замовлення {self.order_number}")
         
         # Якщо є частково зарезервовані товари, виводимо інформацію
         if partially_reserved_items:
@@ -476,20 +523,26 @@ class Order(db.Model):
     
     def unreserve_inventory(self):
         """Скасовує резервування товарів для цього замовлення"""
-        from models.inventory import Inventory
+        from models.inventory_reservation import release_batch, ReservationError
         
+        # Скасовуємо резервування тільки фактично зарезервованої кількості, всі SKU одним викликом
+        reserved = {}
         for item in self.items:
-            # Скасовуємо резервування тільки фактично зарезервованої кількості
             if item.reserved_quantity > 0:
-                try:
-                    Inventory.unreserve_by_sku(item.sku, item.reserved_quantity)
-                    # Скидаємо інформацію про резервування
-                    item.reserved_quantity = 0
-                    item.reservation_status = 'unreserved'
-                except ValueError as e:
-                    # Якщо виникла помилка при скасуванні резервування, логуємо її, але продовжуємо
-                    print(f"Помилка скасування резервування товару {item.sku}: {str(e)}")
-                    continue
+                reserved[item.sku] = reserved.get(item.sku, 0) + item.reserved_quantity
+
+        try:
+            release_batch(reserved, commit=False)
+        except ReservationError as e:
+            # Якщо виникла помилка при скасуванні резервування, логуємо її, але продовжуємо
+            print(f"Помилка скасування резервування товарів замовлення {self.order_number}: {str(e)}")
+            db.session.rollback()
+            return False
+
+        for item in self.items:
+            # Скидаємо інформацію про резервування
+            item.reserved_quantity = 0
+            item.reservation_status = 'unreserved'
         
         db.session.commit()
         return True
@@ -556,8 +609,8 @@ class OrderItem(db.Model):
     reserved_quantity = db.Column(db.Integer, default=0, nullable=False)  # Фактично зарезервована кількість
     reservation_status = db.Column(db.String(20), default='unreserved', nullable=False)  # 'full', 'partial', 'unreserved'
     unit_price = db.Column(db.Float, nullable=True)
-    invoice_number = db.Column(db.String(50), nullable=True)  # Added for TSD receiving workflow
-    lot_number = db.Column(db.String(50), nullable=True)  # Номер лота для відстеження партій товару
+    invoice_number = db.Column(db.String(50), nullable=True, index=True)  # Added for TSD receiving workflow
+    lot_number = db.Column(db.String(50), nullable=True, index=True)  # Номер лота для відстеження партій товару
     pallet_number = db.Column(db.Integer, nullable=True)  # Номер палети, до якої належить товар
     length_cm = db.Column(db.Float, nullable=True)  # Довжина в см
     width_cm = db.Column(db.Float, nullable=True)  # Ширина в см
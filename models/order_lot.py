@@ -1,5 +1,6 @@
 from extensions import db
 from datetime import datetime
+from sqlalchemy import func, insert
 
 class OrderLot(db.Model):
     __tablename__ = 'order_lot' 
@@ -7,12 +8,13 @@ class OrderLot(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     lot_number = db.Column(db.String(50), unique=True, nullable=False)
     order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False)
-    status = db.Column(db.String(20), default='wait', nullable=False)  # 'wait', 'start', 'packed'
+    status = db.Column(db.String(20), default='wait', nullable=False, index=True)  # 'wait', 'start', 'packed'
     pallet_number = db.Column(db.Integer, nullable=False)
     box_count = db.Column(db.Integer, nullable=True)  # Кількість зібраних ящиків
     total_weight = db.Column(db.Float, nullable=True)  # Загальна вага
     completed_at = db.Column(db.DateTime, nullable=True)  # Дата і час завершення
     picker_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)  # Логін комплектувальника
+    remaining_lines = db.Column(db.Integer, nullable=True)  # Незібрані SKU лота (None — прогрес ще не створено)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Зв'язки
@@ -38,4 +40,131 @@ class OrderLotSKU(db.Model):
     order_lot = db.relationship('OrderLot', backref=db.backref('sku_details', cascade='all, delete-orphan'))
 
     def __repr__(self):
-        return f'<OrderLotSKU {self.sku} – {self.quantity} шт., {self.weight:.2f} кг>'
\ No newline at end of file
+        return f'<OrderLotSKU {self.sku} – {self.quantity} шт., {self.weight:.2f} кг>'
+
+
+class OrderLotProgress(db.Model):
+    """Прогрес відбору SKU в лоті, оновлюється в транзакції кожного відбору"""
+    __tablename__ = 'order_lot_progress'
+    __table_args__ = (db.UniqueConstraint('order_lot_id', 'sku', name='uq_order_lot_progress_lot_sku'),)
+    id = db.Column(db.Integer, primary_key=True)
+    order_lot_id = db.Column(db.Integer, db.ForeignKey('order_lot.id'), nullable=False, index=True)
+    sku = db.Column(db.String(50), nullable=False)
+    product_name = db.Column(db.String(100), nullable=False)
+    required_quantity = db.Column(db.Integer, nullable=False, default=0)  # Потрібно ящиків
+    picked_boxes = db.Column(db.Integer, nullable=False, default=0)       # Відібрано ящиків
+    picked_weight = db.Column(db.Float, nullable=False, default=0.0)      # Відібрана вага
+
+    order_lot = db.relationship('OrderLot', backref=db.backref('progress', cascade='all, delete-orphan'))
+
+    @property
+    def is_complete(self):
+        return self.picked_boxes >= self.required_quantity
+
+    def __repr__(self):
+        return f'<OrderLotProgress {self.sku}: {self.picked_boxes}/{self.required_quantity}>'
+
+
+def lot_requirements(items):
+    """Потреба лота за SKU: {sku: (назва, кількість)}"""
+    required = {}
+    for item in items:
+        name, quantity = required.get(item.sku, (item.product_name, 0))
+        required[item.sku] = (name, quantity + (item.quantity or 0))
+    return required
+
+
+def count_remaining_lines(required):
+    """Кількість позицій лота, які ще потрібно відібрати"""
+    return sum(1 for _, quantity in required.values() if quantity > 0)
+
+
+def lot_progress_rows(lot, required):
+    """Рядки прогресу нового лота для пакетного INSERT (після flush лота)"""
+    return [
+        {
+            'order_lot_id': lot.id,
+            'sku': sku,
+            'product_name': product_name,
+            'required_quantity': quantity,
+            'picked_boxes': 0,
+            'picked_weight': 0.0
+        }
+        for sku, (product_name, quantity) in required.items()
+    ]
+
+
+def ensure_lot_progress(lot):
+    """
+    Створює прогрес для лота, створеного до появи таблиці прогресу:
+    потреба — з позицій замовлення, відібране — з історії відбору
+    (по одному згрупованому запиту). Рядок лота блокується, щоб прогрес
+    не створили двічі.
+
+    Returns:
+        bool: True, якщо прогрес було створено
+    """
+    from models.order import OrderItem
+    from models.picking import OrderPickingItem
+
+    if lot.remaining_lines is not None:
+        return False
+    lot = OrderLot.query.filter_by(id=lot.id).with_for_update().populate_existing().one()
+    if lot.remaining_lines is not None:
+        return False
+
+    required = db.session.query(
+        OrderItem.sku, func.max(OrderItem.product_name), func.coalesce(func.sum(OrderItem.quantity), 0)
+    ).filter(
+        OrderItem.order_id == lot.order_id,
+        OrderItem.lot_number == lot.lot_number
+    ).group_by(OrderItem.sku).all()
+    picked = {sku: (boxes, weight) for sku, boxes, weight in db.session.query(
+        OrderPickingItem.sku,
+        func.coalesce(func.sum(OrderPickingItem.picked_box_count), 0),
+        func.coalesce(func.sum(OrderPickingItem.calculated_weight), 0)
+    ).filter(
+        OrderPickingItem.order_id == lot.order_id,
+        OrderPickingItem.lot_number == lot.lot_number
+    ).group_by(OrderPickingItem.sku)}
+
+    rows = [
+        {
+            'order_lot_id': lot.id,
+            'sku': sku,
+            'product_name': product_name,
+            'required_quantity': int(quantity),
+            'picked_boxes': int(picked.get(sku, (0, 0))[0]),
+            'picked_weight': float(picked.get(sku, (0, 0))[1])
+        }
+        for sku, product_name, quantity in required
+    ]
+    if rows:
+        db.session.execute(insert(OrderLotProgress), rows)
+    lot.remaining_lines = sum(1 for row in rows if row['picked_boxes'] < row['required_quantity'])
+    db.session.flush()
+    return True
+
+
+def record_pick(lot, sku, boxes, weight, progress=None):
+    """
+    Додає відібране до прогресу SKU; якщо позиція стала повністю
+    відібраною, зменшує лічильник незібраних позицій лота.
+    Рядок лота має бути заблокований викликачем.
+
+    Args:
+        progress: Уже завантажений прогрес SKU (None — завантажити)
+
+    Returns:
+        OrderLotProgress: Оновлений прогрес SKU
+    """
+    if progress is None:
+        progress = OrderLotProgress.query.filter_by(order_lot_id=lot.id, sku=sku).first()
+    if progress is None:
+        return None
+    was_complete = progress.is_complete
+    progress.picked_boxes += boxes
+    progress.picked_weight += weight
+    if not was_complete and progress.is_complete:
+        lot.remaining_lines = max((lot.remaining_lines or 0) - 1, 0)
+    return progress
@@ -0,0 +1,134 @@
+from extensions import db
+from sqlalchemy import func
+
+
+class OrderPlanningSnapshot:
+    """
+    Знімок логістичних даних та залишків для набору SKU.
+
+    Всі дані, потрібні для обробки замовлення (логістика, доступні залишки
+    на рівні 1 та по всіх рівнях, середня вага ящика), завантажуються кількома
+    згрупованими запитами. Кроки обробки замовлення працюють із цим знімком
+    у пам'яті, а резервування накопичуються і застосовуються одним пакетним
+    викликом (apply_reservations) над заблокованими рядками Inventory.
+    """
+
+    def __init__(self, skus):
+        self.skus = sorted(set(skus))
+        self.logistics = {}
+        self.available_picking = {}
+        self.available_all_levels = {}
+        self.received_totals = {}
+        self.pending_reservations = {}
+        self._load()
+
+    @classmethod
+    def for_order(cls, order):
+        """Створює знімок для всіх SKU замовлення"""
+        return cls(item.sku for item in order.items)
+
+    @classmethod
+    def for_orders(cls, orders):
+        """Створює спільний знімок для кількох замовлень"""
+        return cls(item.sku for order in orders for item in order.items)
+
+    def _load(self):
+        from models import LogisticsItemData
+        from models.inventory_summary import InventorySummary
+        from models.received_inventory import ReceivedInventory
+
+        if not self.skus:
+            return
+
+        # Логістичні дані для всіх SKU одним запитом
+        for logistics in LogisticsItemData.query.filter(LogisticsItemData.sku.in_(self.skus)).all():
+            self.logistics[logistics.sku] = logistics
+
+        # Доступні залишки по всіх рівнях та на рівні 1 зі зведення залишків
+        for sku, summary in InventorySummary.get_for_skus(self.skus).items():
+            self.available_all_levels[sku] = summary.available_quantity
+            self.available_picking[sku] = summary.available_picking
+
+        # Загальна вага та кількість ящиків прийнятих палет
+        received = db.session.query(
+            ReceivedInventory.sku,
+            func.sum(ReceivedInventory.net_weight),
+            func.sum(ReceivedInventory.box_count)
+        ).filter(
+            ReceivedInventory.sku.in_(self.skus)
+        ).group_by(ReceivedInventory.sku).all()
+
+        for sku, total_weight, total_boxes in received:
+            self.received_totals[sku] = (total_weight or 0, total_boxes or 0)
+
+    def get_logistics(self, sku):
+        """Повертає LogisticsItemData для SKU або None"""
+        return self.logistics.get(sku)
+
+    def get_total_available(self, sku):
+        """Доступна кількість в місцях відбору (level = 1)"""
+        return self.available_picking.get(sku, 0)
+
+    def get_total_available_all_levels(self, sku):
+        """Доступна кількість по всіх рівнях складу"""
+        return self.available_all_levels.get(sku, 0)
+
+    def get_avg_box_weight(self, sku):
+        """Середня вага ящика за прийнятими палетами або None, якщо даних немає"""
+        total_weight, total_boxes = self.received_totals.get(sku, (0, 0))
+        if not total_weight or not total_boxes:
+            return None
+        return total_weight / total_boxes
+
+    def reserve(self, sku, quantity):
+        """
+        Резервує товар в місцях відбору у знімку.
+
+        Зменшує доступні залишки знімка, щоб наступні позиції з тим самим SKU
+        бачили актуальні дані. Записи Inventory змінюються в apply_reservations.
+        """
+        if quantity <= 0:
+            raise ValueError("Кількість для резервування має бути більше нуля")
+
+        available = self.get_total_available(sku)
+        if available < quantity:
+            raise ValueError(f"Недостатньо товару для резервування. Доступно: {available}, запитано: {quantity}")
+
+        self.pending_reservations[sku] = self.pending_reservations.get(sku, 0) + quantity
+        self.available_picking[sku] = available - quantity
+        self.available_all_levels[sku] = self.get_total_available_all_levels(sku) - quantity
+        return True
+
+    def claim_transfer(self, sku, quantity):
+        """
+        Закріплює у знімку товар з верхніх рівнів, під який створюється запит на переміщення.
+
+        Без цього наступні замовлення хвилі бачили б ті самі ящики верхніх
+        рівнів вільними і планували б їх повторно.
+        """
+        if quantity <= 0:
+            return
+        self.available_all_levels[sku] = max(self.get_total_available_all_levels(sku) - quantity, 0)
+
+    def checkpoint(self):
+        """Стан доступних залишків і резервувань знімка для відкату (див. restore)"""
+        return (dict(self.available_picking), dict(self.available_all_levels), dict(self.pending_reservations))
+
+    def restore(self, state):
+        """Повертає знімок до стану, збереженого checkpoint"""
+        available_picking, available_all_levels, pending_reservations = state
+        self.available_picking = dict(available_picking)
+        self.available_all_levels = dict(available_all_levels)
+        self.pending_reservations = dict(pending_reservations)
+
+    def apply_reservations(self):
+        """
+        Застосовує накопичені резервування одним викликом без коміту.
+
+        Рядки блокуються і доступність перевіряється повторно, тому якщо
+        інший оператор встиг зарезервувати той самий товар, буде ReservationError.
+        """
+        from models.inventory_reservation import reserve_batch
+
+        pending, self.pending_reservations = self.pending_reservations, {}
+        return reserve_batch(pending, commit=False)
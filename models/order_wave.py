@@ -0,0 +1,125 @@
+from extensions import db
+from sqlalchemy.orm import selectinload
+from models.order import Order
+from models.order_planning import OrderPlanningSnapshot
+
+
+def get_wave_candidates(order_ids=None, limit=None):
+    """
+    Повертає клієнтські замовлення зі статусом 'created' у порядку хвилі:
+    спочатку вищий пріоритет, потім раніше створені.
+
+    Args:
+        order_ids: Обмежити хвилю вказаними ID замовлень (None — всі замовлення)
+        limit: Максимальна кількість замовлень у хвилі
+    """
+    query = Order.query.options(selectinload(Order.items)).filter(
+        Order.order_type == 'customer',
+        Order.status == 'created'
+    )
+    if order_ids:
+        query = query.filter(Order.id.in_(order_ids))
+
+    query = query.order_by(Order.priority.desc(), Order.created_at, Order.id)
+    if limit:
+        query = query.limit(limit)
+    return query.all()
+
+
+def _has_available_items(order, snapshot):
+    """Чи є в замовленні хоча б одна позиція з логістикою та залишком на складі"""
+    return any(
+        snapshot.get_logistics(item.sku) and snapshot.get_total_available_all_levels(item.sku) > 0
+        for item in order.items
+    )
+
+
+def release_wave(orders):
+    """
+    Обробляє хвилю клієнтських замовлень за один прохід.
+
+    Для всіх замовлень будується один знімок залишків, товар розподіляється
+    між замовленнями за пріоритетом і часом створення, нестача по SKU
+    сумується і перетворюється на один набір запитів на переміщення.
+    Лоти, резервування та запити зберігаються однією транзакцією.
+
+    Args:
+        orders: Замовлення у порядку розподілу (див. get_wave_candidates)
+
+    Returns:
+        dict: Результат операції з інформацією про оброблені та пропущені замовлення
+    """
+    from models.inventory_management import create_pending_transfers
+    from models.pick_task import allocate_pick_tasks
+
+    orders = [order for order in orders if order.order_type == 'customer' and order.status == 'created']
+    if not orders:
+        return {
+            'success': False,
+            'message': 'Немає замовлень для обробки',
+            'processed_orders': [],
+            'skipped_orders': [],
+            'created_requests': 0
+        }
+
+    processed_orders = []
+    skipped_orders = []
+    transfer_demand = {}
+    created_requests = 0
+
+    try:
+        snapshot = OrderPlanningSnapshot.for_orders(orders)
+
+        for order in orders:
+            # Замовлення без жодного доступного товару лишаємо без змін
+            if not _has_available_items(order, snapshot):
+                skipped_orders.append(order.order_number)
+                print(f"Замовлення {order.order_number} пропущено: немає доступних товарів")
+                continue
+
+            # Планування змінює позиції замовлення, тому виконується в точці збереження:
+            # якщо після розподілу не лишилось ні резерву, ні переміщення, замовлення,
+            # знімок і нестача хвилі повертаються до стану перед ним
+            state = snapshot.checkpoint()
+            demand = dict(transfer_demand)
+            savepoint = db.session.begin_nested()
+            if not order.plan_order(snapshot, transfer_demand):
+                savepoint.rollback()
+                snapshot.restore(state)
+                transfer_demand.clear()
+                transfer_demand.update(demand)
+                skipped_orders.append(order.order_number)
+                print(f"Замовлення {order.order_number} пропущено: товар розподілено між попередніми замовленнями")
+                continue
+            savepoint.commit()
+            order.create_lots(commit=False)
+            order.status = 'processing'
+            processed_orders.append(order.order_number)
+
+        # Резервування всієї хвилі одним викликом із блокуванням рядків
+        snapshot.apply_reservations()
+
+        # Один набір запитів на переміщення для сумарної нестачі хвилі
+        transfer_result = create_pending_transfers(transfer_demand, commit=False)
+        created_requests = transfer_result['created_requests']
+
+        # Завдання на відбір для лотів усієї хвилі одним пакетом
+        allocate_pick_tasks([order for order in orders if order.status == 'processing'])
+
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Помилка хвильової обробки замовлень: {str(e)}")
+        raise e
+
+    print(f"Хвилю оброблено: {len(processed_orders)} замовлень, пропущено {len(skipped_orders)}, "
+          f"створено {created_requests} запитів на переміщення")
+
+    return {
+        'success': bool(processed_orders),
+        'message': f'Оброблено {len(processed_orders)} замовлень, пропущено {len(skipped_orders)}. '
+                   f'Створено {created_requests} запитів на переміщення',
+        'processed_orders': processed_orders,
+        'skipped_orders': skipped_orders,
+        'created_requests': created_requests
+    }
@@ -0,0 +1,282 @@
+"""
+Модуль формування палет для клієнтських замовлень.
+
+Кожна товарна позиція описується об'ємом і вагою одного ящика та кількістю
+ящиків. Стратегії розкладають ящики по палетах з обмеженням за об'ємом
+і максимальною вагою та повертають компактний план (позиція, палета, ящики),
+з якого OrderItem створюються лише в кінці.
+
+Відкриті палети зберігаються в індексі стратегії: first-fit шукає першу
+палету з місцем у дереві максимумів за номером палети, best-fit —
+у списку, впорядкованому за вільним об'ємом (bisect). Пошук палети для
+чергової порції ящиків — O(log n) замість перебору всіх відкритих палет.
+"""
+from abc import ABC, abstractmethod
+from array import array
+from bisect import bisect_left, insort
+
+PALLET_VOLUME = 960000  # 120 * 80 * 100 см³
+MAX_PALLET_WEIGHT = 1000.0  # кг
+CLOSED = float('-inf')  # Запас закритої палети в індексі
+
+
+class PalletPlan:
+    """Результат формування палет: список частин (індекс позиції, номер палети, кількість ящиків)"""
+
+    def __init__(self):
+        self.line_index = array('l')
+        self.pallet_number = array('l')
+        self.box_count = array('l')
+        self.pallets_count = 0
+
+    def add(self, line_index, pallet_number, box_count):
+        self.line_index.append(line_index)
+        self.pallet_number.append(pallet_number)
+        self.box_count.append(box_count)
+
+    def __len__(self):
+        return len(self.box_count)
+
+    def __iter__(self):
+        """Повертає частини плану в порядку позицій замовлення, потім палет"""
+        order = sorted(range(len(self)), key=lambda i: (self.line_index[i], self.pallet_number[i]))
+        for i in order:
+            yield self.line_index[i], self.pallet_number[i], self.box_count[i]
+
+
+class FirstFitIndex:
+    """
+    Відкриті палети в дереві максимумів вільного об'єму та ваги за номером
+    палети: перша палета, куди влазить ящик, знаходиться спуском по дереву.
+    """
+
+    def __init__(self, free_volume, free_weight, check_weight):
+        self.free_volume = free_volume
+        self.free_weight = free_weight
+        self.check_weight = check_weight
+        self.size = 1
+        self.max_volume = array('d', [CLOSED, CLOSED])
+        self.max_weight = array('d', [CLOSED, CLOSED])
+
+    def _grow(self, pallet):
+        """Подвоює кількість листків, поки палета не поміститься"""
+        while pallet >= self.size:
+            size = self.size * 2
+            max_volume = array('d', [CLOSED]) * (2 * size)
+            max_weight = array('d', [CLOSED]) * (2 * size)
+            max_volume[size:size + self.size] = self.max_volume[self.size:]
+            max_weight[size:size + self.size] = self.max_weight[self.size:]
+            for node in range(size - 1, 0, -1):
+                max_volume[node] = max(max_volume[2 * node], max_volume[2 * node + 1])
+                max_weight[node] = max(max_weight[2 * node], max_weight[2 * node + 1])
+            self.size, self.max_volume, self.max_weight = size, max_volume, max_weight
+
+    def _set(self, pallet, volume, weight):
+        node = self.size + pallet
+        self.max_volume[node] = volume
+        self.max_weight[node] = weight
+        node //= 2
+        while node:
+            self.max_volume[node] = max(self.max_volume[2 * node], self.max_volume[2 * node + 1])
+            self.max_weight[node] = max(self.max_weight[2 * node], self.max_weight[2 * node + 1])
+            node //= 2
+
+    def add(self, pallet):
+        self._grow(pallet)
+        self._set(pallet, self.free_volume[pallet], self.free_weight[pallet])
+
+    def update(self, pallet, old_volume):
+        self._set(pallet, self.free_volume[pallet], self.free_weight[pallet])
+
+    def remove(self, pallet, old_volume):
+        self._set(pallet, CLOSED, CLOSED)
+
+    def _has_room(self, node, unit_volume, unit_weight):
+        """Чи може в піддереві бути палета з місцем (максимуми об'єму й ваги можуть бути з різних палет)"""
+        if unit_volume > 0:
+            if self.max_volume[node] < unit_volume:
+                return False
+        elif self.max_volume[node] == CLOSED:
+            return False
+        return not (self.check_weight and unit_weight > 0 and self.max_weight[node] < unit_weight)
+
+    def find(self, unit_volume, unit_weight):
+        """Палета з найменшим номером, куди влазить хоча б один ящик, або None"""
+        stack = [1]
+        while stack:
+            node = stack.pop()
+            if not self._has_room(node, unit_volume, unit_weight):
+                continue
+            if node >= self.size:
+                return node - self.size
+            stack.append(2 * node + 1)
+            stack.append(2 * node)
+        return None
+
+
+class BestFitIndex:
+    """
+    Відкриті палети, впорядковані за (вільний об'єм, номер палети):
+    найменший достатній запас знаходиться через bisect. Палети, де бракує
+    ваги, пропускаються послідовно — обмеження за вагою спрацьовує рідко.
+    """
+
+    def __init__(self, free_volume, free_weight, check_weight):
+        self.free_volume = free_volume
+        self.free_weight = free_weight
+        self.check_weight = check_weight
+        self.keys = []
+
+    def add(self, pallet):
+        insort(self.keys, (self.free_volume[pallet], pallet))
+
+    def remove(self, pallet, old_volume):
+        del self.keys[bisect_left(self.keys, (old_volume, pallet))]
+
+    def update(self, pallet, old_volume):
+        self.remove(pallet, old_volume)
+        self.add(pallet)
+
+    def find(self, unit_volume, unit_weight):
+        """Палета з найменшим вільним об'ємом, куди влазить хоча б один ящик, або None"""
+        start = bisect_left(self.keys, (unit_volume, -1)) if unit_volume > 0 else 0
+        check_weight = self.check_weight and unit_weight > 0
+        for position in range(start, len(self.keys)):
+            pallet = self.keys[position][1]
+            if not check_weight or self.free_weight[pallet] >= unit_weight:
+                return pallet
+        return None
+
+
+class PalletBuilder(ABC):
+    """
+    Базова стратегія формування палет.
+
+    Палети зберігаються як масиви залишкового об'єму та ваги. Підкласи
+    визначають порядок обходу позицій (line_order) та індекс відкритих
+    палет, з якого вибирається палета для чергової порції ящиків (open_index).
+    """
+
+    name = None
+
+    def __init__(self, pallet_volume=PALLET_VOLUME, max_weight=MAX_PALLET_WEIGHT):
+        self.pallet_volume = pallet_volume
+        self.max_weight = max_weight
+
+    def line_order(self, unit_volumes, box_counts):
+        """Порядок обробки позицій (за замовчуванням — як у замовленні)"""
+        return range(len(box_counts))
+
+    @abstractmethod
+    def open_index(self, free_volume, free_weight):
+        """Індекс відкритих палет з методами add, update, remove і find"""
+
+    def _fits(self, free_volume, free_weight, unit_volume, unit_weight):
+        """Скільки ящиків поміщається на палету з вказаним запасом об'єму та ваги"""
+        fit = int(free_volume // unit_volume) if unit_volume > 0 else None
+        if unit_weight > 0 and self.max_weight:
+            by_weight = int(free_weight // unit_weight)
+            fit = by_weight if fit is None else min(fit, by_weight)
+        return fit
+
+    def build(self, unit_volumes, unit_weights, box_counts):
+        """
+        Розкладає ящики всіх позицій по палетах.
+
+        Args:
+            unit_volumes: Об'єм одного ящика кожної позиції, см³
+            unit_weights: Вага одного ящика кожної позиції, кг (0 — невідомо)
+            box_counts: Кількість ящиків кожної позиції
+
+        Returns:
+            PalletPlan: План розміщення
+        """
+        unit_volumes = array('d', unit_volumes)
+        unit_weights = array('d', unit_weights)
+        box_counts = array('l', box_counts)
+
+        plan = PalletPlan()
+        free_volume = array('d')
+        free_weight = array('d')
+        index = self.open_index(free_volume, free_weight)
+
+        # Палету, на яку не влазить навіть найменший ящик, більше не переглядаємо
+        min_volume = min((v for v, b in zip(unit_volumes, box_counts) if b > 0), default=0)
+        min_weight = min((w for w, b in zip(unit_weights, box_counts) if b > 0), default=0)
+
+        for line in self.line_order(unit_volumes, box_counts):
+            unit_volume = unit_volumes[line]
+            unit_weight = unit_weights[line]
+            boxes_remaining = box_counts[line]
+
+            while boxes_remaining > 0:
+                pallet = index.find(unit_volume, unit_weight)
+
+                if pallet is None:
+                    # Нова палета; ящик, більший за палету, займає її повністю
+                    pallet = len(free_volume)
+                    free_volume.append(self.pallet_volume)
+                    free_weight.append(self.max_weight or 0)
+                    fit = self._fits(self.pallet_volume, self.max_weight or 0, unit_volume, unit_weight)
+                    qty = min(boxes_remaining, fit or 1) if fit is not None else boxes_remaining
+                    index.add(pallet)
+                else:
+                    fit = self._fits(free_volume[pallet], free_weight[pallet], unit_volume, unit_weight)
+                    qty = min(boxes_remaining, fit) if fit is not None else boxes_remaining
+
+                old_volume = free_volume[pallet]
+                free_volume[pallet] -= qty * unit_volume
+                free_weight[pallet] -= qty * unit_weight
+                plan.add(line, pallet + 1, qty)
+                boxes_remaining -= qty
+
+                if free_volume[pallet] < min_volume or (self.max_weight and free_weight[pallet] < min_weight):
+                    index.remove(pallet, old_volume)
+                else:
+                    index.update(pallet, old_volume)
+
+        plan.pallets_count = len(free_volume)
+        return plan
+
+
+class GreedyPalletBuilder(PalletBuilder):
+    """Жадібна стратегія: позиції в порядку замовлення, перша палета, де є місце"""
+
+    name = 'greedy'
+
+    def open_index(self, free_volume, free_weight):
+        return FirstFitIndex(free_volume, free_weight, bool(self.max_weight))
+
+
+class FirstFitDecreasingPalletBuilder(GreedyPalletBuilder):
+    """First-fit decreasing: спочатку найбільші ящики, перша палета, де є місце"""
+
+    name = 'first_fit_decreasing'
+
+    def line_order(self, unit_volumes, box_counts):
+        return sorted(range(len(box_counts)), key=lambda line: unit_volumes[line], reverse=True)
+
+
+class BestFitPalletBuilder(FirstFitDecreasingPalletBuilder):
+    """Best-fit decreasing: спочатку найбільші ящики, палета з найменшим вільним об'ємом, де є місце"""
+
+    name = 'best_fit'
+
+    def open_index(self, free_volume, free_weight):
+        return BestFitIndex(free_volume, free_weight, bool(self.max_weight))
+
+
+PALLET_BUILDERS = {
+    builder.name: builder
+    for builder in (GreedyPalletBuilder, FirstFitDecreasingPalletBuilder, BestFitPalletBuilder)
+}
+
+DEFAULT_PALLET_BUILDER = FirstFitDecreasingPalletBuilder.name
+
+
+def get_pallet_builder(name=None, pallet_volume=PALLET_VOLUME, max_weight=MAX_PALLET_WEIGHT):
+    """Повертає стратегію формування палет за назвою"""
+    builder_cls = PALLET_BUILDERS.get(name or DEFAULT_PALLET_BUILDER)
+    if not builder_cls:
+        raise ValueError(f"Невідома стратегія формування палет: {name}")
+    return builder_cls(pallet_volume=pallet_volume, max_weight=max_weight)
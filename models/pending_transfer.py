@@ -58,4 +58,127 @@ class PendingTransferRequest(db.Model):
         db.session.add(transfer)
         db.session.commit()
         
-        return True
\ No newline at end of file
+        return True
+
+
+def confirm_transfers(transfer_ids=None, ssccs=None):
+    """
+    Підтверджує багато запитів на переміщення однією транзакцією.
+
+    Запити та палети завантажуються двома запитами, палети переміщуються
+    (Inventory синхронізується одним пакетом при flush), записи
+    InventoryTransfer додаються одним INSERT, а зміни зберігаються одним комітом.
+
+    Args:
+        transfer_ids: Список ID запитів на переміщення
+        ssccs: Список SSCC палет (для ТЗД)
+
+    Returns:
+        dict: Результат операції з результатом по кожному запиту
+    """
+    from sqlalchemy import insert, or_
+    from models.received_inventory import ReceivedInventory
+    from models.picking import InventoryTransfer
+
+    transfer_ids = [int(transfer_id) for transfer_id in (transfer_ids or [])]
+    ssccs = [str(sscc) for sscc in (ssccs or [])]
+    if not transfer_ids and not ssccs:
+        return {'success': False, 'message': 'Не вказано запитів на переміщення', 'confirmed': 0, 'failed': 0,
+                'results': []}
+
+    conditions = []
+    if transfer_ids:
+        conditions.append(PendingTransferRequest.id.in_(transfer_ids))
+    if ssccs:
+        conditions.append(PendingTransferRequest.sscc.in_(ssccs))
+    transfers = PendingTransferRequest.query.filter(or_(*conditions)).order_by(
+        PendingTransferRequest.id
+    ).with_for_update().all()
+
+    by_id = {transfer.id: transfer for transfer in transfers}
+    # Для SSCC беремо перший непідтверджений запит, а якщо таких немає — підтверджений,
+    # щоб повторне сканування отримало ту саму відповідь, що й пошук за ID
+    by_sscc = {}
+    for transfer in transfers:
+        current = by_sscc.get(transfer.sscc)
+        if current is None or (current.confirmed and not transfer.confirmed):
+            by_sscc[transfer.sscc] = transfer
+
+    # Порядок результатів відповідає порядку запиту
+    results = []
+    selected = []
+    seen = set()
+    for key, transfer in [(('id', i), by_id.get(i)) for i in transfer_ids] + \
+                         [(('sscc', sscc), by_sscc.get(sscc)) for sscc in ssccs]:
+        result = {'transfer_id': key[1] if key[0] == 'id' else None,
+                  'sscc': key[1] if key[0] == 'sscc' else None,
+                  'success': False}
+        results.append(result)
+        if transfer is None:
+            result['message'] = 'Запит на переміщення не знайдено'
+        elif transfer.confirmed:
+            result.update(transfer_id=transfer.id, sscc=transfer.sscc, sku=transfer.sku,
+                          message='Переміщення вже підтверджено')
+        elif transfer.id in seen:
+            result.update(transfer_id=transfer.id, sscc=transfer.sscc, sku=transfer.sku,
+                          message='Запит вказано повторно')
+        else:
+            seen.add(transfer.id)
+            result.update(transfer_id=transfer.id, sscc=transfer.sscc, sku=transfer.sku)
+            selected.append((transfer, result))
+
+    # Всі палети одним запитом
+    pallets = {}
+    if selected:
+        for pallet in ReceivedInventory.query.filter(
+            ReceivedInventory.sscc.in_({transfer.sscc for transfer, _ in selected})
+        ).all():
+            pallets[pallet.sscc] = pallet
+
+    transfer_rows = []
+    now = datetime.utcnow()
+    for transfer, result in selected:
+        pallet = pallets.get(transfer.sscc)
+        if not pallet or pallet.sku != transfer.sku or pallet.storage_location_id != transfer.from_location_id:
+            result['message'] = f"Товар {transfer.sku} з SSCC {transfer.sscc} не знайдено в локації {transfer.from_location_id}"
+            continue
+
+        # Оновлюємо локацію товару
+        pallet.storage_location_id = transfer.to_location_id
+        transfer.confirmed = True
+        transfer_rows.append({
+            'sku': transfer.sku,
+            'from_location_id': transfer.from_location_id,
+            'to_location_id': transfer.to_location_id,
+            'box_count': transfer.box_count,
+            'sscc_from': transfer.sscc,
+            'sscc_to': transfer.sscc,  # SSCC не змінюється
+            'created_at': now
+        })
+        result['success'] = True
+        result['message'] = f'Переміщення товару {transfer.sku} підтверджено'
+
+    try:
+        if transfer_rows:
+            db.session.execute(insert(InventoryTransfer), transfer_rows)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"Помилка пакетного підтвердження переміщень: {str(e)}")
+        for result in results:
+            if result['success']:
+                result['success'] = False
+                result['message'] = f'Помилка збереження: {str(e)}'
+        transfer_rows = []
+
+    confirmed = len(transfer_rows)
+    failed = len(results) - confirmed
+    print(f"Підтверджено {confirmed} переміщень, не вдалося: {failed}")
+
+    return {
+        'success': confirmed > 0 and failed == 0,
+        'message': f'Підтверджено {confirmed} з {len(results)} переміщень',
+        'confirmed': confirmed,
+        'failed': failed,
+        'results': results
+    }
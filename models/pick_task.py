@@ -0,0 +1,408 @@
+"""
+Завдання на відбір, розподілені під час обробки замовлення.
+
+Для кожної позиції нових лотів process_order (і хвильова обробка) одразу
+розподіляє ящики по конкретних палетах за FEFO: спочатку палети в місцях
+відбору (рівень 1), потім палети, для яких щойно створено запит на
+переміщення в місце відбору. Кожен рядок pick_task — лот, SKU, SSCC,
+комірка і заплановані ящики. Ящики відкритих завдань вважаються
+зайнятими, тож наступні замовлення не розподіляють їх повторно.
+
+Сканування лише підтверджує завдання (відібрано менше — завдання
+лишається відкритим). Якщо завдань не вистачає (палету забрали, лот
+створено до появи таблиці), відбір доповнюється з вільних палет рівня 1
+і записується як завдання-коригування.
+
+Ящики списуються з палети умовним UPDATE ... WHERE box_count >= n, тож
+одночасні комплектувальники не втрачають відбори і не роблять залишок
+від'ємним. Конфлікти транзакцій (взаємне блокування, зайнята база)
+прозоро повторюються (retry_on_conflict).
+"""
+import time
+import random
+from datetime import datetime
+from extensions import db
+from sqlalchemy import and_, case, exists, func, insert, select, update
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import aliased
+from sqlalchemy.orm.attributes import set_committed_value
+
+TASK_OPEN = 'open'
+TASK_PICKED = 'picked'
+TASK_SHORT = 'short'          # Палета спорожніла раніше, ніж завдання виконано
+TASK_CANCELLED = 'cancelled'  # Лот завершено без цього відбору
+
+TAKE_ATTEMPTS = 5        # Повтори умовного списання з однієї палети
+CONFLICT_ATTEMPTS = 8    # Повтори транзакції відбору після конфлікту
+CONFLICT_BACKOFF = 0.02  # Базова пауза між повторами, с
+# PostgreSQL: serialization_failure, deadlock_detected, lock_not_available
+CONFLICT_PGCODES = ('40001', '40P01', '55P03')
+
+
+class PickTask(db.Model):
+    __tablename__ = 'pick_task'
+    id = db.Column(db.Integer, primary_key=True)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
+    order_lot_id = db.Column(db.Integer, db.ForeignKey('order_lot.id'), nullable=False, index=True)
+    lot_number = db.Column(db.String(50), nullable=False, index=True)
+    sku = db.Column(db.String(50), nullable=False)
+    sscc = db.Column(db.String(30), nullable=False, index=True)
+    location_id = db.Column(db.Integer, db.ForeignKey('storage_location.id'), nullable=True)
+    location_code = db.Column(db.String(50), nullable=True)
+    planned_boxes = db.Column(db.Integer, nullable=False)           # Розподілено ящиків
+    picked_boxes = db.Column(db.Integer, nullable=False, default=0)  # Підтверджено ящиків
+    status = db.Column(db.String(20), nullable=False, default=TASK_OPEN, index=True)
+    adjusted = db.Column(db.Boolean, nullable=False, default=False)  # Додано під час сканування
+    picked_by_user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    picked_at = db.Column(db.DateTime, nullable=True)
+
+    order_lot = db.relationship('OrderLot', backref='pick_tasks')
+
+    @property
+    def outstanding(self):
+        return max(self.planned_boxes - self.picked_boxes, 0)
+
+    def __repr__(self):
+        return f'<PickTask {self.lot_number} {self.sku} {self.sscc}: {self.picked_boxes}/{self.planned_boxes}>'
+
+
+def _outstanding_by_sscc():
+    """Ящики палет, зайняті відкритими завданнями"""
+    return select(
+        PickTask.sscc,
+        func.sum(PickTask.planned_boxes - PickTask.picked_boxes).label('boxes')
+    ).where(PickTask.status == TASK_OPEN).group_by(PickTask.sscc).subquery()
+
+
+def allocate_pick_tasks(orders):
+    """
+    Розподіляє незібрану потребу нових лотів замовлень (ще без завдань)
+    по палетах за FEFO і додає завдання одним пакетним INSERT (без коміту).
+    Викликається після створення лотів і запитів на переміщення.
+
+    Returns:
+        dict: Кількість завдань і нерозподілені ящики за SKU
+    """
+    from models.order_lot import OrderLot, OrderLotProgress
+    from models.received_inventory import ReceivedInventory
+    from models.storage import StorageLocation
+    from models.pending_transfer import PendingTransferRequest
+
+    order_ids = [order.id for order in orders]
+    demand = db.session.query(
+        OrderLot.id, OrderLot.order_id, OrderLot.lot_number, OrderLotProgress.sku,
+        OrderLotProgress.required_quantity - OrderLotProgress.picked_boxes
+    ).join(
+        OrderLotProgress, OrderLotProgress.order_lot_id == OrderLot.id
+    ).filter(
+        OrderLot.order_id.in_(order_ids),
+        OrderLot.status == 'wait',
+        OrderLotProgress.picked_boxes < OrderLotProgress.required_quantity,
+        ~exists().where(PickTask.order_lot_id == OrderLot.id)
+    ).order_by(OrderLot.id, OrderLotProgress.id).all() if order_ids else []
+    if not demand:
+        return {'created_tasks': 0, 'unallocated': {}}
+
+    # Палети рівня 1 і палети з непідтвердженим переміщенням у місце відбору
+    # одним запитом, з вільним залишком після відкритих завдань
+    skus = sorted({row[3] for row in demand})
+    target = aliased(StorageLocation)
+    outstanding = _outstanding_by_sscc()
+    pallets = {}
+    for sku, sscc, box_count, outstanding_boxes, location_id, location_code in db.session.query(
+        ReceivedInventory.sku,
+        ReceivedInventory.sscc,
+        ReceivedInventory.box_count,
+        func.coalesce(outstanding.c.boxes, 0),
+        func.coalesce(target.id, StorageLocation.id),
+        func.coalesce(target.location_code, StorageLocation.location_code)
+    ).join(
+        StorageLocation, StorageLocation.id == ReceivedInventory.storage_location_id
+    ).outerjoin(
+        PendingTransferRequest, and_(
+            PendingTransferRequest.sscc == ReceivedInventory.sscc,
+            PendingTransferRequest.confirmed == False  # noqa: E712
+        )
+    ).outerjoin(
+        target, target.id == PendingTransferRequest.to_location_id
+    ).outerjoin(
+        outstanding, outstanding.c.sscc == ReceivedInventory.sscc
+    ).filter(
+        ReceivedInventory.sku.in_(skus),
+        ReceivedInventory.box_count > 0,
+        (StorageLocation.level == '1') | (target.level == '1')
+    ).order_by(
+        ReceivedInventory.sku,
+        case((StorageLocation.level == '1', 0), else_=1),
+        ReceivedInventory.expiry_date.is_(None),
+        ReceivedInventory.expiry_date,
+        ReceivedInventory.id
+    ):
+        free = box_count - int(outstanding_boxes)
+        if free > 0:
+            pallets.setdefault(sku, []).append([sscc, location_id, location_code, free])
+
+    now = datetime.utcnow()
+    rows = []
+    unallocated = {}
+    for lot_id, order_id, lot_number, sku, quantity in demand:
+        for pallet in pallets.get(sku, []):
+            if quantity <= 0:
+                break
+            boxes = min(quantity, pallet[3])
+            if boxes <= 0:
+                continue
+            pallet[3] -= boxes
+            quantity -= boxes
+            rows.append({
+                'order_id': order_id,
+                'order_lot_id': lot_id,
+                'lot_number': lot_number,
+                'sku': sku,
+                'sscc': pallet[0],
+                'location_id': pallet[1],
+                'location_code': pallet[2],
+                'planned_boxes': boxes,
+                'picked_boxes': 0,
+                'status': TASK_OPEN,
+                'adjusted': False,
+                'created_at': now
+            })
+        if quantity > 0:
+            unallocated[sku] = unallocated.get(sku, 0) + quantity
+
+    if rows:
+        db.session.execute(insert(PickTask), rows)
+    print(f"Створено завдань на відбір: {len(rows)}" +
+          (f", не розподілено ящиків: {sum(unallocated.values())}" if unallocated else ''))
+    return {'created_tasks': len(rows), 'unallocated': unallocated}
+
+
+def task_sources(lot_numbers, skus):
+    """
+    Відкриті завдання лотів для SKU разом із палетами одним запитом.
+    Завдання на палети, які ще не переміщено на рівень 1, не повертаються.
+
+    Returns:
+        dict: {(lot_number, sku): [(завдання, палета, код комірки)]}
+    """
+    from models.received_inventory import ReceivedInventory
+    from models.storage import StorageLocation
+
+    if not lot_numbers or not skus:
+        return {}
+    query = db.session.query(PickTask, ReceivedInventory, StorageLocation.location_code).join(
+        ReceivedInventory, ReceivedInventory.sscc == PickTask.sscc
+    ).join(
+        StorageLocation, StorageLocation.id == ReceivedInventory.storage_location_id
+    ).filter(
+        PickTask.lot_number.in_(list(lot_numbers)),
+        PickTask.sku.in_(list(skus)),
+        PickTask.status == TASK_OPEN,
+        StorageLocation.level == '1'
+    ).order_by(PickTask.id)
+
+    sources = {}
+    for task, item, location_code in query:
+        sources.setdefault((task.lot_number, task.sku), []).append((task, item, location_code))
+    return sources
+
+
+def free_pallets(skus):
+    """
+    Палети рівня 1 з ящиками, не зайнятими відкритими завданнями, за FEFO.
+
+    Returns:
+        dict: {sku: [[палета, код комірки, вільні ящики]]}
+    """
+    from models.received_inventory import ReceivedInventory
+    from models.storage import StorageLocation
+
+    if not skus:
+        return {}
+    outstanding = _outstanding_by_sscc()
+    query = db.session.query(
+        ReceivedInventory, StorageLocation.location_code, func.coalesce(outstanding.c.boxes, 0)
+    ).join(
+        StorageLocation, ReceivedInventory.storage_location_id == StorageLocation.id
+    ).outerjoin(
+        outstanding, outstanding.c.sscc == ReceivedInventory.sscc
+    ).filter(
+        ReceivedInventory.sku.in_(list(skus)),
+        StorageLocation.level == '1',
+        ReceivedInventory.box_count > 0
+    ).order_by(ReceivedInventory.sku, ReceivedInventory.expiry_date)
+
+    pallets = {}
+    for item, location_code, outstanding_boxes in query:
+        free = item.box_count - int(outstanding_boxes)
+        if free > 0:
+            pallets.setdefault(item.sku, []).append([item, location_code, free])
+    return pallets
+
+
+def take_boxes(item, boxes, deltas):
+    """
+    Атомарно списує ящики з палети умовним UPDATE ... WHERE box_count >= n.
+
+    Палету могли змінити інші комплектувальники після читання, тому
+    кількість у Python не віднімається. Якщо умова не виконалась, залишок
+    перечитується і списання повторюється з меншою кількістю. Вага ящика
+    палети при відборі не змінюється (вага списується пропорційно), тому
+    вагу відібраного рахуємо з прочитаних значень.
+
+    Args:
+        item: Палета ReceivedInventory
+        boxes: Скільки ящиків списати
+        deltas: Різниці {(sku, location_id): кількість} для синхронізації Inventory
+
+    Returns:
+        tuple: (списано ящиків, вага)
+    """
+    from models.received_inventory import ReceivedInventory
+
+    table = ReceivedInventory.__table__
+    box_weight = item.net_weight / item.box_count if item.box_count else 0
+    returning = db.session.get_bind().dialect.update_returning
+
+    for _ in range(TAKE_ATTEMPTS):
+        if boxes <= 0:
+            break
+        weight = box_weight * boxes
+        stmt = update(table).where(
+            table.c.id == item.id,
+            table.c.box_count >= boxes
+        ).values(box_count=table.c.box_count - boxes, net_weight=table.c.net_weight - weight)
+        if returning:
+            row = db.session.execute(stmt.returning(table.c.box_count, table.c.net_weight)).first()
+        else:
+            row = None
+            if db.session.execute(stmt).rowcount == 1:
+                row = db.session.execute(
+                    select(table.c.box_count, table.c.net_weight).where(table.c.id == item.id)
+                ).first()
+        if row is not None:
+            # Значення з бази без позначки зміни: flush не запише палету вдруге
+            set_committed_value(item, 'box_count', row.box_count)
+            set_committed_value(item, 'net_weight', row.net_weight)
+            key = (item.sku, item.storage_location_id)
+            deltas[key] = deltas.get(key, 0) - boxes
+            return boxes, weight
+
+        # Палету змінив інший комплектувальник — перечитуємо залишок і повторюємо
+        current = db.session.execute(
+            select(table.c.box_count, table.c.net_weight).where(table.c.id == item.id)
+        ).first()
+        current_boxes = max(current.box_count or 0, 0) if current else 0
+        set_committed_value(item, 'box_count', current_boxes)
+        if current:
+            set_committed_value(item, 'net_weight', current.net_weight)
+        if current_boxes:
+            box_weight = current.net_weight / current_boxes
+        boxes = min(boxes, current_boxes)
+    return 0, 0.0
+
+
+def draw_boxes(count, tasks=(), pallets=(), user_id=None, now=None, deltas=None):
+    """
+    Списує count ящиків: спочатку за завданнями, потім з вільних палет.
+    Палети змінюються атомарним UPDATE (take_boxes); різниці для Inventory
+    накопичуються в deltas і застосовуються викликачем (sync_inventory).
+
+    Args:
+        tasks: [(завдання, палета, код комірки)] з task_sources
+        pallets: [[палета, код комірки, вільні ящики]] з free_pallets
+
+    Returns:
+        list: (палета, код комірки, ящиків, вага, завдання або None)
+    """
+    now = now or datetime.utcnow()
+    deltas = {} if deltas is None else deltas
+    picks = []
+
+    for task, item, location_code in tasks:
+        if count <= 0:
+            break
+        boxes, weight = take_boxes(item, min(count, task.outstanding, item.box_count), deltas)
+        if boxes > 0:
+            picks.append((item, location_code, boxes, weight, task))
+            task.picked_boxes += boxes
+            task.picked_by_user_id = user_id
+            task.picked_at = now
+            count -= boxes
+        if task.outstanding == 0:
+            task.status = TASK_PICKED
+        elif item.box_count <= 0:
+            task.status = TASK_SHORT
+
+    for pallet in pallets:
+        if count <= 0:
+            break
+        item, location_code, free = pallet
+        boxes, weight = take_boxes(item, min(count, free, item.box_count), deltas)
+        if boxes > 0:
+            picks.append((item, location_code, boxes, weight, None))
+            pallet[2] -= boxes
+            count -= boxes
+    return picks
+
+
+def is_conflict(error):
+    """Чи є помилка бази конфліктом одночасних транзакцій, після якого варто повторити"""
+    orig = getattr(error, 'orig', None)
+    if getattr(orig, 'pgcode', None) in CONFLICT_PGCODES:
+        return True
+    return 'database is locked' in str(orig or error)
+
+
+def retry_on_conflict(operation, *args, **kwargs):
+    """
+    Виконує операцію відбору (одна транзакція з комітом) і прозоро повторює
+    її після відкату, якщо база повідомила про взаємне блокування,
+    конфлікт серіалізації або зайняту базу (SQLite).
+    """
+    for attempt in range(1, CONFLICT_ATTEMPTS + 1):
+        try:
+            return operation(*args, **kwargs)
+        except OperationalError as e:
+            db.session.rollback()
+            if attempt == CONFLICT_ATTEMPTS or not is_conflict(e):
+                raise
+            print(f"Конфлікт одночасного відбору, повтор {attempt} з {CONFLICT_ATTEMPTS - 1}")
+            time.sleep(CONFLICT_BACKOFF * attempt * (1 + random.random()))
+
+
+def adjustment_rows(lot, sku, picks, user_id, now):
+    """Завдання-коригування для відборів поза розподіленими завданнями"""
+    return [
+        {
+            'order_id': lot.order_id,
+            'order_lot_id': lot.id,
+            'lot_number': lot.lot_number,
+            'sku': sku,
+            'sscc': item.sscc,
+            'location_id': item.storage_location_id,
+            'location_code': location_code,
+            'planned_boxes': boxes,
+            'picked_boxes': boxes,
+            'status': TASK_PICKED,
+            'adjusted': True,
+            'picked_by_user_id': user_id,
+            'created_at': now,
+            'picked_at': now
+        }
+        for item, location_code, boxes, _, task in picks if task is None
+    ]
+
+
+def close_lot_tasks(lot_ids):
+    """Скасовує відкриті завдання завершених лотів, звільняючи розподілені ящики"""
+    if lot_ids:
+        db.session.execute(
+            update(PickTask).where(
+                PickTask.order_lot_id.in_(list(lot_ids)),
+                PickTask.status == TASK_OPEN
+            ).values(status=TASK_CANCELLED),
+            execution_options={'synchronize_session': False}
+        )
@@ -0,0 +1,128 @@
+"""
+Порядок обходу комірок відбору (рівень 1) для комплектувальника.
+
+Для кожної комірки рівня 1 заздалегідь рахується ранг у маршруті обходу
+складу і зберігається в таблиці pick_walk_rank. За замовчуванням обхід
+«змійкою»: ряди йдуть за кодом, у парних рядах комірки за зростанням,
+у непарних — за спаданням, тож комплектувальник не повертається
+до початку кожного ряду. Схема 'ascending' обходить усі ряди від початку.
+Таблиця перебудовується в тій самій транзакції, що змінює ряди чи комірки,
+а також командою flask pick-walk-ranks (після зміни PICK_WALK_PATTERN).
+"""
+from extensions import db
+from flask import current_app
+from sqlalchemy import event, select, delete, insert, func
+from sqlalchemy.orm import object_session
+from models.storage import StorageRow, StorageLocation
+from models.transfer_sequencing import Point, travel_distance, _number
+
+DEFAULT_WALK_PATTERN = 'serpentine'
+WALK_PATTERNS = ('serpentine', 'ascending')
+PICKING_LEVELS = ('1', '01')
+
+WALK_LAYOUT_CHANGED_KEY = 'pick_walk_layout_changed'
+
+
+class PickWalkRank(db.Model):
+    __tablename__ = 'pick_walk_rank'
+    location_id = db.Column(db.Integer, db.ForeignKey('storage_location.id', ondelete='CASCADE'), primary_key=True)
+    walk_rank = db.Column(db.Integer, nullable=False, index=True)  # Порядковий номер у маршруті обходу
+    row_number = db.Column(db.Integer, nullable=False)             # Номер ряду в порядку обходу
+    cell_number = db.Column(db.Integer, nullable=False)            # Номер комірки в ряду
+
+    def __repr__(self):
+        return f'<PickWalkRank {self.location_id}: {self.walk_rank}>'
+
+
+def walk_pattern():
+    try:
+        pattern = current_app.config.get('PICK_WALK_PATTERN', DEFAULT_WALK_PATTERN)
+    except RuntimeError:
+        pattern = DEFAULT_WALK_PATTERN
+    return pattern if pattern in WALK_PATTERNS else DEFAULT_WALK_PATTERN
+
+
+def compute_walk_ranks(locations, pattern=DEFAULT_WALK_PATTERN):
+    """
+    Ранги обходу для комірок.
+
+    Args:
+        locations: Пари (location_id, row_code, cell)
+        pattern: 'serpentine' або 'ascending'
+
+    Returns:
+        list: Словники location_id, walk_rank, row_number, cell_number
+    """
+    rows = {}
+    for location_id, row_code, cell in locations:
+        rows.setdefault(row_code, []).append((_number(cell), location_id))
+
+    ranks = []
+    for row_number, row_code in enumerate(sorted(rows)):
+        cells = sorted(rows[row_code], reverse=pattern == 'serpentine' and row_number % 2 == 1)
+        for cell_number, location_id in cells:
+            ranks.append({
+                'location_id': location_id,
+                'walk_rank': len(ranks) + 1,
+                'row_number': row_number,
+                'cell_number': cell_number
+            })
+    return ranks
+
+
+def rebuild_walk_ranks(connection=None, pattern=None):
+    """Перераховує таблицю рангів для всіх комірок рівня 1 (DELETE і один пакетний INSERT)"""
+    connection = connection or db.session.connection()
+    locations = connection.execute(
+        select(StorageLocation.id, StorageLocation.row_code, StorageLocation.cell).where(
+            StorageLocation.level.in_(PICKING_LEVELS)
+        )
+    ).all()
+    ranks = compute_walk_ranks(locations, pattern or walk_pattern())
+    connection.execute(delete(PickWalkRank.__table__))
+    if ranks:
+        connection.execute(insert(PickWalkRank.__table__), ranks)
+    return len(ranks)
+
+
+def ensure_walk_ranks():
+    """Будує таблицю рангів, якщо вона ще порожня (перший запуск)"""
+    if db.session.query(PickWalkRank.location_id).first() is None:
+        return rebuild_walk_ranks()
+    return 0
+
+
+def walk_route_length(points, row_length):
+    """
+    Довжина замкненого маршруту від початку складу через точки (row_number, cell_number)
+    у заданому порядку і назад.
+    """
+    depot = Point(0, 0, 1)
+    route = [depot] + [Point(row_number, cell_number, 1) for row_number, cell_number in points] + [depot]
+    return sum(travel_distance(route[k], route[k + 1], row_length) for k in range(len(route) - 1))
+
+
+def _walk_layout_changed(mapper, connection, target):
+    object_session(target).info[WALK_LAYOUT_CHANGED_KEY] = True
+
+
+for _model in (StorageLocation, StorageRow):
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event_name, _walk_layout_changed)
+
+
+@event.listens_for(db.session, 'after_flush')
+def rebuild_after_layout_change(session, flush_context):
+    """Ранги перебудовуються в транзакції, яка змінила ряди чи комірки"""
+    if session.info.pop(WALK_LAYOUT_CHANGED_KEY, False):
+        rebuild_walk_ranks(session.connection())
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_walk_layout_change(session):
+    session.info.pop(WALK_LAYOUT_CHANGED_KEY, None)
+
+
+def max_cell_number():
+    """Довжина ряду (найбільший номер комірки) для оцінки відстаней"""
+    return select(func.coalesce(func.max(PickWalkRank.cell_number), 1)).scalar_subquery()
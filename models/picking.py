@@ -1,6 +1,10 @@
 from extensions import db
 from datetime import datetime
-from models.order_lot import OrderLot, OrderLotSKU
+from sqlalchemy import insert
+from models.order_lot import OrderLot, OrderLotSKU, OrderLotProgress, ensure_lot_progress, record_pick
+from models.pick_task import (PickTask, task_sources, free_pallets, draw_boxes, adjustment_rows, close_lot_tasks,
+                              retry_on_conflict)
+from models.received_inventory import sync_inventory
 
 class OrderPickingItem(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -54,12 +58,15 @@ def perform_picking(order_id, sku, requested_quantity, user_id, lot_number):
     Returns:
         dict: Результат операції з інформацією про відбір
     """
-    from models.received_inventory import ReceivedInventory
-    from models.storage import StorageLocation
+    # Конфлікт з іншим комплектувальником (блокування, зайнята база) — транзакція повторюється
+    return retry_on_conflict(_perform_picking, order_id, sku, requested_quantity, user_id, lot_number)
+
+
+def _perform_picking(order_id, sku, requested_quantity, user_id, lot_number):
+    """Одна спроба відбору однією транзакцією"""
     from models.order import Order, OrderItem
     from models import LogisticsItemData
     from models.pending_transfer import PendingTransferRequest
-    import math
     
     # Перевіряємо наявність замовлення
     order = Order.query.get(order_id)
@@ -77,15 +84,6 @@ def perform_picking(order_id, sku, requested_quantity, user_id, lot_number):
             'message': 'Товар не знайдено в замовленні'
         }
     
-    # Перевіряємо наявність незавершених запитів на переміщення для цього SKU
-    pending_transfers = PendingTransferRequest.get_pending_transfers_for_sku(sku)
-    if pending_transfers:
-        return {
-            'success': False,
-            'message': f'Для товару {sku} є незавершені запити на переміщення. Зачекайте на їх підтвердження перед відбором.',
-            'pending_transfers': len(pending_transfers)
-        }
-    
     # Отримуємо дані про логістику товару
     logistics = LogisticsItemData.query.filter_by(sku=sku).first()
     if not logistics:
@@ -97,68 +95,42 @@ def perform_picking(order_id, sku, requested_quantity, user_id, lot_number):
     # Використовуємо безпосередньо запитану кількість
     target_box_count = requested_quantity
     
-    # Знаходимо товар в комірках комплектації (level = 1)
-    # Спочатку знаходимо SSCC, які вже відібрані для інших замовлень
-    
-    # Тепер знаходимо доступний інвентар, виключаючи вже відібрані SSCC
-    picking_inventory = db.session.query(ReceivedInventory).join(
-        StorageLocation, ReceivedInventory.storage_location_id == StorageLocation.id
-    ).filter(
-        ReceivedInventory.sku == sku,
-        StorageLocation.level == '1',
-        ReceivedInventory.box_count > 0,
-        # Виключаємо SSCC, які вже відібрані для інших замовлень
-    ).order_by(ReceivedInventory.expiry_date).all()
-    
-    # Виводимо діагностичну інформацію
-    print(f"Знайдено {len(picking_inventory)} доступних позицій для SKU {sku} в комірках комплектації")
-    
-    # Перевіряємо загальну доступну кількість
-    available_boxes = sum(item.box_count for item in picking_inventory)
-    
-    # Якщо недостатньо товару в комірках комплектації, перевіряємо наявність запитів на переміщення
-    if available_boxes < target_box_count:
-        from models.inventory_management import check_picking_availability
-        from models.pending_transfer import PendingTransferRequest
-        
-        # Перевіряємо наявність товару та створюємо запити на переміщення при необхідності
-        availability_result = check_picking_availability(sku, target_box_count)
-        
-        # Перевіряємо, чи є незавершені запити на переміщення
+    # Рядок лота блокується, щоб прогрес, лічильник позицій і завдання лота оновлювались послідовно.
+    # Прогрес старого лота створюється з історії до запису поточного відбору
+    lot = OrderLot.query.filter_by(order_id=order_id, lot_number=lot_number).with_for_update().first()
+    if lot:
+        ensure_lot_progress(lot)
+
+    # Палети та комірки вже розподілені завданнями під час обробки замовлення
+    tasks = task_sources([lot_number], [sku]).get((lot_number, sku), [])
+    planned_boxes = sum(min(task.outstanding, item.box_count) for task, item, _ in tasks)
+    print(f"Знайдено {len(tasks)} завдань на відбір ({planned_boxes} ящиків) для SKU {sku} в лоті {lot_number}")
+
+    # Коригування: завдань не вистачає (палету забрали або лот створено до появи завдань) —
+    # доповнюємо з вільних палет рівня 1, якщо для SKU немає незавершених переміщень
+    pallets = []
+    if planned_boxes < target_box_count:
         pending_transfers = PendingTransferRequest.get_pending_transfers_for_sku(sku)
-        
         if pending_transfers:
             return {
                 'success': False,
-                'message': f'Для товару {sku} є незавершені запити на переміщення. Зачекайте на їх підтвердження.',
+                'message': f'Для товару {sku} є незавершені запити на переміщення. Зачекайте на їх підтвердження перед відбором.',
                 'pending_transfers': len(pending_transfers)
             }
-        
-        # Якщо потрібне переміщення, повертаємо повідомлення про необхідність підтвердження
-        if availability_result.get('requires_transfer', False):
-            return {
-                'success': False,
-                'message': f'Недостатньо товару в місцях відбору. {availability_result.get("message", "")}',
-                'requires_transfer': True,
-                'available': availability_result.get('available', 0),
-                'required': availability_result.get('required', target_box_count)
-            }
-        
-        # Оновлюємо доступну кількість
-        available_boxes = availability_result.get('available', available_boxes)
-    
-    # Якщо доступна кількість менша за запитану, відбираємо те, що є
-    actual_box_count = min(target_box_count, available_boxes)
+        pallets = free_pallets([sku]).get(sku, [])
+
+    # Виконуємо відбір товару
+    now = datetime.utcnow()
+    inventory_deltas = {}
+    picks = draw_boxes(target_box_count, tasks, pallets, user_id, now, inventory_deltas)
     
     # Якщо немає доступних ящиків взагалі, повертаємо помилку
-    if actual_box_count == 0:
+    if not picks:
         return {
             'success': False,
             'message': 'Немає доступного товару для відбору'
         }
     
-    # Виконуємо відбір товару
-    remaining_to_pick = actual_box_count
     picked_items = []
     
     # Зберігаємо інформацію про запитану кількість для логування
@@ -166,22 +138,8 @@ def perform_picking(order_id, sku, requested_quantity, user_id, lot_number):
     total_picked_weight = 0
     total_picked_boxes = 0
     
-    for item in picking_inventory:
-        if remaining_to_pick <= 0:
-            break
-            
-        pick_count = min(remaining_to_pick, item.box_count)
-        
-        # Розраховуємо вагу відібраного товару
-        calculated_weight = (item.net_weight / item.box_count) * pick_count if item.box_count > 0 else 0
-        
-        # Зменшуємо кількість товару в комірці
-        item.box_count -= pick_count
-        item.net_weight -= calculated_weight
-        
+    for item, location_code, pick_count, calculated_weight, _ in picks:
         # Зберігаємо інформацію про відбір
-        location_code = StorageLocation.query.get(item.storage_location_id).location_code
-        
         picking_item = OrderPickingItem(
             order_id=order_id,
             sku=sku,
@@ -191,6 +149,7 @@ def perform_picking(order_id, sku, requested_quantity, user_id, lot_number):
             actual_quantity=calculated_weight if logistics.packaging_unit_type == 'КГ' else pick_count,
             packaging_unit_type=logistics.packaging_unit_type,
             picked_by_user_id=user_id,
+            picked_at=now,
             storage_location=location_code,
             lot_number=lot_number
         )
@@ -199,8 +158,6 @@ def perform_picking(order_id, sku, requested_quantity, user_id, lot_number):
         print(f"Створено запис відбору: SKU={sku}, lot_number={lot_number}, кількість={pick_count}")
         
         db.session.add(picking_item)
-        # Зберігаємо зміни одразу, щоб уникнути проблем з транзакціями
-        db.session.flush()
         picked_items.append({
             'sscc': item.sscc,
             'location': location_code,
@@ -210,7 +167,15 @@ def perform_picking(order_id, sku, requested_quantity, user_id, lot_number):
         
         total_picked_weight += calculated_weight
         total_picked_boxes += pick_count
-        remaining_to_pick -= pick_count
+
+    # Палети списано прямими UPDATE — залишки Inventory оновлюємо в тій самій транзакції
+    sync_inventory(db.session, inventory_deltas)
+
+    # Відбори поза завданнями записуються як завдання-коригування
+    adjustments = adjustment_rows(lot, sku, picks, user_id, now) if lot else []
+    if adjustments:
+        db.session.execute(insert(PickTask), adjustments)
+    actual_box_count = total_picked_boxes
     
     # Розраховуємо фактичну кількість відібраного товару
     actual_picked_quantity = total_picked_boxes
@@ -222,103 +187,49 @@ def perform_picking(order_id, sku, requested_quantity, user_id, lot_number):
             'message': 'Не вдалося відібрати жодного ящика товару'
         }
     
-    # Перевіряємо чи всі товари в замовленні зібрані
-    all_items_picked = True
-    underpicked = False
-    
-    # Отримуємо тільки товари з поточного лота
-    lot_items = [item for item in order.items if item.lot_number == lot_number]
-    print(f"Перевіряємо товари лота {lot_number}, знайдено {len(lot_items)} товарів")
-    
-    for item in lot_items:
-        # Підраховуємо загальну кількість відібраних ящиків для цього SKU в цьому лоті
-        picked_count = db.session.query(db.func.sum(OrderPickingItem.picked_box_count)).filter(
-            OrderPickingItem.order_id == order_id,
-            OrderPickingItem.sku == item.sku,
-            OrderPickingItem.lot_number == lot_number
-        ).scalar() or 0
-        
-        print(f"Перевірка товару {item.sku} в лоті {lot_number}: потрібно {item.quantity}, відібрано {picked_count}")
-        
-        # Якщо відібрано менше ніж потрібно, то не всі товари зібрані
-        if picked_count < item.quantity:
-            all_items_picked = False
-            # Якщо це поточний товар і відібрано менше ніж запитано, фіксуємо недобір
-            if item.sku == sku and actual_box_count < requested_box_count:
-                underpicked = True
-            break
-    
-    # Перевіряємо всі лоти цього замовлення
-    all_lots = OrderLot.query.filter_by(order_id=order_id).all()
-    all_lots_packed = all(lot.status == 'packed' for lot in all_lots)
+    progress = record_pick(lot, sku, total_picked_boxes, total_picked_weight) if lot else None
 
-    if all_lots_packed:
-        order.status = 'packed'
-    db.session.add(order)
-    
-    # Виводимо діагностичну інформацію перед збереженням змін
-    print(f"Зберігаємо зміни в базі даних. Відібрано {total_picked_boxes} ящиків товару {sku} для лота {lot_number}")
-    
-    # Зберігаємо всі зміни в базі даних
-    db.session.commit()
-    
-    # Перевіряємо, чи зберігся запис в базі даних
-    verification = db.session.query(db.func.sum(OrderPickingItem.picked_box_count)).filter(
-        OrderPickingItem.order_id == order_id,
-        OrderPickingItem.sku == sku,
-        OrderPickingItem.lot_number == lot_number
-    ).scalar() or 0
-    
-    print(f"Перевірка після збереження: для SKU {sku} в лоті {lot_number} відібрано {verification} ящиків")
-    
-    all_lot_items = OrderItem.query.filter_by(order_id=order_id, lot_number=lot_number).all()
-    lot_fully_picked = True
-    for item in all_lot_items:
-        picked_count = db.session.query(db.func.sum(OrderPickingItem.picked_box_count)).filter(
-            OrderPickingItem.order_id == order_id,
-            OrderPickingItem.sku == item.sku,
-            OrderPickingItem.lot_number == lot_number
-        ).scalar() or 0
-        if picked_count < item.quantity:
-            lot_fully_picked = False
-            break
+    # Лот зібрано, коли не залишилось незібраних позицій — без перерахунку історії
+    all_items_picked = bool(lot) and lot.remaining_lines == 0
+    # Недобір — відібрано менше запитаного, і позиція ще не закрита
+    underpicked = actual_box_count < requested_box_count and not (progress and progress.is_complete)
+    if progress:
+        print(f"Для SKU {sku} в лоті {lot_number} відібрано {progress.picked_boxes} з {progress.required_quantity} ящиків, "
+              f"незібраних позицій: {lot.remaining_lines}")
 
+    lot_fully_picked = all_items_picked
     if lot_fully_picked:
+        lot.status = 'packed'
+        lot.completed_at = datetime.utcnow()
+        lot.picker_id = user_id
+        # Невикористані завдання лота звільняють розподілені ящики
+        close_lot_tasks([lot.id])
 
-        lot = OrderLot.query.filter_by(order_id=order_id, lot_number=lot_number).first()
-        if lot:
-            lot.status = 'packed'
-            lot.completed_at = datetime.utcnow()
-
-            for item in all_lot_items:
-                picked_count = db.session.query(db.func.sum(OrderPickingItem.picked_box_count)).filter(
-                    OrderPickingItem.order_id == order_id,
-                    OrderPickingItem.sku == item.sku,
-                    OrderPickingItem.lot_number == lot_number
-                ).scalar() or 0
-
-                total_weight = db.session.query(db.func.sum(OrderPickingItem.calculated_weight)).filter(
-                    OrderPickingItem.order_id == order_id,
-                    OrderPickingItem.sku == item.sku,
-                    OrderPickingItem.lot_number == lot_number
-                ).scalar() or 0
-
-                logistics = LogisticsItemData.query.filter_by(sku=item.sku).first()
-                product_name = item.product_name or (logistics.product_name if logistics else item.sku)
-
-                db.session.add(OrderLotSKU(
-                    order_lot_id=lot.id,
-                    sku=item.sku,
-                    product_name=product_name,
-                    quantity=picked_count,
-                    weight=total_weight
-                ))
+        lot_skus = [
+            {
+                'order_lot_id': lot.id,
+                'sku': row.sku,
+                'product_name': row.product_name,
+                'quantity': row.picked_boxes,
+                'weight': row.picked_weight
+            }
+            for row in OrderLotProgress.query.filter_by(order_lot_id=lot.id).order_by(OrderLotProgress.id)
+        ]
+        # Підсумки лота одним пакетним INSERT
+        db.session.execute(insert(OrderLotSKU), lot_skus)
+        lot.box_count = sum(row['quantity'] for row in lot_skus)
+        lot.total_weight = sum(row['weight'] for row in lot_skus)
+        db.session.add(lot)
 
-            lot.box_count = sum(s.quantity for s in lot.sku_details)
-            lot.total_weight = sum(s.weight for s in lot.sku_details)
+        # Замовлення зібране, коли зібрані всі його лоти
+        if all(other.status == 'packed' for other in OrderLot.query.filter_by(order_id=order_id)):
+            order.status = 'packed'
 
-            db.session.add(lot)
-            db.session.commit()
+    # Виводимо діагностичну інформацію перед збереженням змін
+    print(f"Зберігаємо зміни в базі даних. Відібрано {total_picked_boxes} ящиків товару {sku} для лота {lot_number}")
+    
+    # Відбір і завершення лота зберігаються однією транзакцією
+    db.session.commit()
     
     return {
         'success': True,
@@ -329,4 +240,4 @@ def perform_picking(order_id, sku, requested_quantity, user_id, lot_number):
         'actual_quantity': actual_picked_quantity,
         'underpicked': underpicked,
         'is_last_item': lot_fully_picked
-    }
\ No newline at end of file
+    }
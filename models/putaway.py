@@ -0,0 +1,743 @@
+"""
+Розміщення (putaway) прийнятих палет.
+
+Правила вибору комірки:
+1. Для SKU з призначеним місцем відбору — саме місце відбору, якщо воно порожнє,
+   інакше вільна комірка верхнього рівня (level > '1') в тому ж ряду.
+2. Для SKU без місця відбору — вільна комірка верхнього рівня в ряду,
+   температурний режим якого відповідає товару.
+3. Якщо нічого не знайдено — будь-яка вільна комірка верхнього рівня.
+
+Замість пошуку порожніх комірок запитом по всіх локаціях для кожної палети
+використовується індекс вільних комірок у пам'яті процесу (FreeSlotIndex):
+черги вільних комірок за ключем (температурний діапазон, ряд, рівень).
+Індекс завантажується двома запитами і далі оновлюється інкрементально —
+обробники маперів ReceivedInventory рахують зміни зайнятості комірок,
+які застосовуються до індексу після commit. Вибрана комірка одразу
+позначається зайнятою (claim), щоб інша палета того ж запиту чи паралельний
+запит не отримали її ж; після rollback вона повертається у вільні.
+Зміни, зроблені іншими процесами, індекс не бачить, тому кандидати
+атомарно закріплюються в базі (claim_slots: SELECT ... FOR UPDATE SKIP LOCKED
+на PostgreSQL, таблиця putaway_claim на інших СУБД) і після цього
+перевіряються на зайнятість одним запитом. Паралельні приймальники
+отримують різні комірки і не чекають один на одного. Весь індекс
+перезавантажується раз на PUTAWAY_INDEX_TTL секунд або після змін
+рядів і комірок.
+"""
+import heapq
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from extensions import db
+from flask import current_app
+from sqlalchemy import event, func, inspect, select, and_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import object_session
+from models.storage import StorageRow, StorageLocation, SkuPickingLocation
+from models.received_inventory import ReceivedInventory
+
+DEFAULT_INDEX_TTL = 300  # Секунд між повними перезавантаженнями індексу
+
+OCCUPANCY_KEY = 'putaway_occupancy_deltas'
+CLAIMS_KEY = 'putaway_claims'
+LAYOUT_CHANGED_KEY = 'putaway_layout_changed'
+CLAIM_TOKEN_KEY = 'putaway_claim_token'
+
+
+class PutawayClaim(db.Model):
+    """
+    Закріплення комірки за приймальником на час його транзакції
+    (для СУБД без SELECT ... FOR UPDATE SKIP LOCKED)
+    """
+    __tablename__ = 'putaway_claim'
+    location_id = db.Column(db.Integer, db.ForeignKey('storage_location.id'), primary_key=True)
+    token = db.Column(db.String(32), nullable=False, index=True)
+    claimed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<PutawayClaim {self.location_id}>'
+
+
+def is_upper_level(level):
+    """Верхній рівень зберігання (рівень 1 — місця відбору)"""
+    return level > '1'
+
+
+class FreeSlotIndex:
+    """Вільні комірки складу, згруповані за (температурний діапазон, ряд, рівень)"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.loaded_at = None
+        self.buckets = {}      # {(band, row_code, level): [location_id, ...] як купа}
+        self.queued = set()    # Комірки, що лежать у чергах
+        self.slots = {}        # {location_id: (ключ, location_code)}
+        self.occupancy = {}    # {location_id: палет + тимчасових claim}
+        self.row_keys = {}     # {row_code: [ключі верхніх рівнів]}
+        self.orphan_keys = []  # Ключі верхніх рівнів комірок без запису StorageRow (діапазон None)
+        self.band_rows = {}    # {(temperature_min, temperature_max): [row_code, ...]}
+
+    def load(self, session):
+        """Повне завантаження індексу двома запитами"""
+        locations = session.query(
+            StorageLocation.id,
+            StorageLocation.location_code,
+            StorageLocation.row_code,
+            StorageLocation.level,
+            StorageRow.code.label('storage_row'),
+            StorageRow.temperature_min,
+            StorageRow.temperature_max
+        ).outerjoin(StorageRow, StorageRow.code == StorageLocation.row_code).all()
+
+        occupied = dict(session.query(
+            ReceivedInventory.storage_location_id, func.count(ReceivedInventory.id)
+        ).filter(
+            ReceivedInventory.storage_location_id.isnot(None)
+        ).group_by(ReceivedInventory.storage_location_id).all())
+
+        buckets, slots, row_keys, band_rows, orphan_keys = {}, {}, {}, {}, []
+        for location in locations:
+            # Комірки ряду без запису StorageRow потрапляють лише в останній пошук (upper_keys())
+            band = (location.temperature_min, location.temperature_max) if location.storage_row else None
+            key = (band, location.row_code, location.level)
+            slots[location.id] = (key, location.location_code)
+            buckets.setdefault(key, [])
+            if not occupied.get(location.id):
+                buckets[key].append(location.id)
+            if band is None:
+                if is_upper_level(location.level) and key not in orphan_keys:
+                    orphan_keys.append(key)
+                continue
+            if location.row_code not in band_rows.setdefault(band, []):
+                band_rows[band].append(location.row_code)
+            if is_upper_level(location.level) and key not in row_keys.setdefault(location.row_code, []):
+                row_keys[location.row_code].append(key)
+
+        for bucket in buckets.values():
+            heapq.heapify(bucket)
+        for keys in row_keys.values():
+            keys.sort(key=lambda key: key[2])
+        orphan_keys.sort(key=lambda key: (key[1] or '', key[2]))
+
+        with self.lock:
+            self.buckets = buckets
+            self.slots = slots
+            self.row_keys = row_keys
+            self.orphan_keys = orphan_keys
+            self.band_rows = {band: sorted(rows) for band, rows in band_rows.items()}
+            self.occupancy = {location_id: count for location_id, count in occupied.items() if count}
+            self.queued = {location_id for bucket in buckets.values() for location_id in bucket}
+            self.loaded_at = time.monotonic()
+
+    def is_stale(self, ttl):
+        return self.loaded_at is None or time.monotonic() - self.loaded_at > ttl
+
+    def invalidate(self):
+        with self.lock:
+            self.loaded_at = None
+
+    def _release(self, location_id):
+        """Повертає комірку в чергу, якщо вона стала вільною (під self.lock)"""
+        slot = self.slots.get(location_id)
+        if slot is None or self.occupancy.get(location_id) or location_id in self.queued:
+            return
+        heapq.heappush(self.buckets[slot[0]], location_id)
+        self.queued.add(location_id)
+
+    def adjust(self, changes):
+        """Застосовує зміни зайнятості {location_id: різниця}"""
+        with self.lock:
+            for location_id, delta in changes.items():
+                if location_id is None or not delta:
+                    continue
+                count = max(self.occupancy.get(location_id, 0) + delta, 0)
+                if count:
+                    self.occupancy[location_id] = count
+                else:
+                    self.occupancy.pop(location_id, None)
+                    self._release(location_id)
+
+    def claim(self, location_id):
+        """Займає конкретну комірку, якщо вона вільна"""
+        with self.lock:
+            if location_id not in self.slots or self.occupancy.get(location_id):
+                return False
+            self.occupancy[location_id] = 1
+            return True
+
+    def claim_first(self, keys):
+        """Займає першу вільну комірку з черг keys (у порядку ключів)"""
+        with self.lock:
+            for key in keys:
+                bucket = self.buckets.get(key)
+                while bucket:
+                    location_id = heapq.heappop(bucket)
+                    self.queued.discard(location_id)
+                    # Застарілі елементи черги (комірку вже зайнято) пропускаються
+                    if not self.occupancy.get(location_id):
+                        self.occupancy[location_id] = 1
+                        return location_id
+        return None
+
+    def upper_keys(self, rows=None):
+        """Ключі верхніх рівнів для рядів rows (None — усі ряди, включно з комірками без StorageRow)"""
+        if rows is None:
+            return [key for row in sorted(self.row_keys) for key in self.row_keys[row]] + self.orphan_keys
+        return [key for row in rows for key in self.row_keys.get(row, ())]
+
+    def compatible_rows(self, temperature):
+        """Ряди, температурний режим яких включає temperature"""
+        return sorted(
+            row for (temperature_min, temperature_max), rows in self.band_rows.items()
+            if temperature_min <= temperature <= temperature_max
+            for row in rows
+        )
+
+    def location_code(self, location_id):
+        slot = self.slots.get(location_id)
+        return slot[1] if slot else None
+
+
+def get_free_slot_index():
+    """Індекс вільних комірок поточного застосунку (перезавантажується за TTL)"""
+    index = current_app.extensions.get('putaway_index')
+    if index is None:
+        index = current_app.extensions.setdefault('putaway_index', FreeSlotIndex())
+    if index.is_stale(current_app.config.get('PUTAWAY_INDEX_TTL', DEFAULT_INDEX_TTL)):
+        index.load(db.session)
+    return index
+
+
+def _occupied_in_db(location_ids):
+    """Зайняті в базі комірки серед location_ids (одним запитом)"""
+    if not location_ids:
+        return set()
+    with db.session.no_autoflush:
+        return {location_id for (location_id,) in db.session.query(ReceivedInventory.storage_location_id).filter(
+            ReceivedInventory.storage_location_id.in_(location_ids)
+        ).distinct()}
+
+
+def _remember_claim(index, location_id):
+    db.session.info.setdefault(CLAIMS_KEY, []).append((index, location_id))
+
+
+def _forget_claims(location_ids):
+    """Claim на комірки, зайняті іншим процесом, не знімається після commit — комірка лишається зайнятою"""
+    claims = db.session.info.get(CLAIMS_KEY)
+    if claims:
+        db.session.info[CLAIMS_KEY] = [claim for claim in claims if claim[1] not in location_ids]
+
+
+def _claim_token(session):
+    token = session.info.get(CLAIM_TOKEN_KEY)
+    if token is None:
+        token = session.info[CLAIM_TOKEN_KEY] = uuid.uuid4().hex
+    return token
+
+
+def claim_slots(location_ids):
+    """
+    Атомарно закріплює комірки за поточною транзакцією.
+
+    PostgreSQL: SELECT ... FOR UPDATE SKIP LOCKED по рядках storage_location —
+    комірки, які вже закріпив інший приймальник, пропускаються без очікування,
+    а блокування знімається разом із commit/rollback.
+    Інші СУБД: рядки в таблиці putaway_claim, вставлені в тій самій транзакції
+    (INSERT ... ON CONFLICT DO NOTHING); вони видаляються перед commit.
+
+    Returns:
+        set: Комірки, закріплені за поточною транзакцією
+    """
+    from models.inventory_summary import insert_for_dialect
+
+    location_ids = sorted(set(location_ids) - {None})
+    if not location_ids:
+        return set()
+    connection = db.session.connection()
+
+    if connection.dialect.name == 'postgresql':
+        return {location_id for (location_id,) in connection.execute(
+            select(StorageLocation.id).where(
+                StorageLocation.id.in_(location_ids)
+            ).with_for_update(skip_locked=True)
+        )}
+
+    table = PutawayClaim.__table__
+    token = _claim_token(db.session)
+    now = datetime.utcnow()
+    rows = [{'location_id': location_id, 'token': token, 'claimed_at': now} for location_id in location_ids]
+    insert = insert_for_dialect(connection)
+    if insert is not None:
+        stmt = insert(table).values(rows).on_conflict_do_nothing(
+            index_elements=['location_id']
+        ).returning(table.c.location_id)
+        return {location_id for (location_id,) in connection.execute(stmt)}
+
+    claimed = set()
+    for row in rows:
+        try:
+            with connection.begin_nested():
+                connection.execute(table.insert().values(**row))
+            claimed.add(row['location_id'])
+        except IntegrityError:
+            pass
+    return claimed
+
+
+def release_slot_claims(session, location_ids=None):
+    """Видаляє рядки putaway_claim поточної транзакції (усі або лише location_ids)"""
+    token = session.info.get(CLAIM_TOKEN_KEY)
+    if token is None:
+        return
+    table = PutawayClaim.__table__
+    condition = table.c.token == token
+    if location_ids is not None:
+        condition = and_(condition, table.c.location_id.in_(location_ids))
+    session.connection().execute(table.delete().where(condition))
+
+
+def _secure(location_ids):
+    """
+    Закріплює вибрані в індексі комірки: claim у базі, потім перевірка, що
+    комірка досі порожня. Claim іншого приймальника тримається до його commit,
+    тож його палету перевірка після нашого claim вже бачить.
+
+    Комірки, зайняті палетами, лишаються зайнятими в індексі; комірки
+    з чужим claim повертаються в індекс після завершення транзакції.
+
+    Returns:
+        set: Закріплені комірки
+    """
+    location_ids = set(location_ids) - {None}
+    if not location_ids:
+        return set()
+    claimed = claim_slots(location_ids)
+    occupied = _occupied_in_db(claimed)
+    if occupied:
+        release_slot_claims(db.session, occupied)
+        _forget_claims(occupied)
+    return claimed - occupied
+
+
+def _verify_claim(index, location_id, verify=True):
+    """Запам'ятовує claim в індексі; verify — одразу закріпити комірку в базі"""
+    _remember_claim(index, location_id)
+    return not verify or location_id in _secure({location_id})
+
+
+def _claim_verified(index, keys, verify=True):
+    """Займає першу вільну комірку з keys, перевіривши її в базі"""
+    while True:
+        location_id = index.claim_first(keys)
+        if location_id is None or _verify_claim(index, location_id, verify):
+            return location_id
+
+
+def choose_location(sku, temperature=None, picking_location_id=None, index=None, verify=True):
+    """
+    Вибирає і займає комірку для палети SKU.
+
+    Args:
+        sku: Артикул товару
+        temperature: Температурний режим товару (LogisticsItemData.temperature_range)
+        picking_location_id: Призначене місце відбору SKU (None — немає)
+        index: Індекс вільних комірок (за замовчуванням — індекс застосунку)
+        verify: Перевірити вибрану комірку в базі (False — перевіряє викликач, див. PutawayPlanner.choose_many)
+
+    Returns:
+        tuple: (location_id, location_code) або (None, None), якщо вільних комірок немає
+    """
+    index = index or get_free_slot_index()
+
+    if picking_location_id is not None:
+        if index.claim(picking_location_id) and _verify_claim(index, picking_location_id, verify):
+            code = index.location_code(picking_location_id)
+            print(f"[+] Using empty picking location {code} for SKU {sku}")
+            return picking_location_id, code
+
+        # Місце відбору зайняте — верхні рівні в тому ж ряду
+        slot = index.slots.get(picking_location_id)
+        if slot is not None:
+            location_id = _claim_verified(index, index.upper_keys([slot[0][1]]), verify)
+            if location_id is not None:
+                code = index.location_code(location_id)
+                print(f"[+] Using upper level location {code} in same row as picking location for SKU {sku}")
+                return location_id, code
+
+    elif temperature is not None:
+        rows = index.compatible_rows(temperature)
+        if rows:
+            location_id = _claim_verified(index, index.upper_keys(rows), verify)
+            if location_id is not None:
+                code = index.location_code(location_id)
+                print(f"[+] Using temperature-compatible upper level location {code} for SKU {sku}")
+                return location_id, code
+        print(f"[!] No available upper level storage location found for SKU {sku} with temperature {temperature}°C")
+
+    # Будь-яка вільна комірка на верхніх рівнях
+    location_id = _claim_verified(index, index.upper_keys(), verify)
+    if location_id is not None:
+        code = index.location_code(location_id)
+        print(f"[+] Using last resort upper level location {code} for SKU {sku}")
+        return location_id, code
+
+    print(f"[!] No available upper level storage locations found for SKU {sku}")
+    return None, None
+
+
+class PutawayPlanner:
+    """
+    Розміщення палет одного запиту: довідкові дані SKU (місце відбору,
+    логістичні дані) завантажуються один раз на SKU.
+    """
+
+    def __init__(self, index=None):
+        self.index = index or get_free_slot_index()
+        self.picking_locations = {}
+        self.logistics = {}
+
+    def prefetch(self, skus):
+        """Завантажує місця відбору та логістичні дані для SKU двома запитами"""
+        from models import LogisticsItemData
+
+        skus = {sku for sku in skus if sku not in self.picking_locations}
+        if not skus:
+            return
+        picking = dict(db.session.query(SkuPickingLocation.sku, SkuPickingLocation.picking_location_id).filter(
+            SkuPickingLocation.sku.in_(skus)
+        ).all())
+        logistics = {row.sku: row for row in db.session.query(
+            LogisticsItemData.sku,
+            LogisticsItemData.product_name,
+            LogisticsItemData.shelf_life,
+            LogisticsItemData.temperature_range
+        ).filter(LogisticsItemData.sku.in_(skus))}
+        for sku in skus:
+            self.picking_locations[sku] = picking.get(sku)
+            self.logistics[sku] = logistics.get(sku)
+
+    def temperature(self, sku):
+        logistics = self.logistics.get(sku)
+        return logistics.temperature_range if logistics else None
+
+    def choose(self, sku, verify=True):
+        """Вибирає комірку для палети; повертає (location_id, location_code)"""
+        self.prefetch([sku])
+        return choose_location(sku, self.temperature(sku), self.picking_locations[sku], self.index, verify)
+
+    def choose_many(self, skus, timings=None):
+        """
+        Вибирає комірки для палет зі списку SKU (по одній на елемент).
+        Вибрані комірки перевіряються в базі одним запитом; для комірок,
+        які вже зайняв інший процес, вибір повторюється.
+
+        Args:
+            skus: SKU палет
+            timings: Список для часу розміщення кожної палети, мс (необов'язково)
+
+        Returns:
+            list: Пари (location_id, location_code) у порядку skus
+        """
+        self.prefetch(skus)
+        placements = [(None, None)] * len(skus)
+        if timings is not None:
+            timings[:] = [0.0] * len(skus)
+        pending = list(range(len(skus)))
+        while pending:
+            for position in pending:
+                started = time.perf_counter()
+                placements[position] = self.choose(skus[position], verify=False)
+                if timings is not None:
+                    timings[position] += (time.perf_counter() - started) * 1000
+            chosen = {placements[position][0] for position in pending} - {None}
+            secured = _secure(chosen)
+            if secured == chosen:
+                break
+            pending = [position for position in pending if placements[position][0] in chosen - secured]
+        return placements
+
+
+def _item_id(pallet):
+    try:
+        return int(pallet.get('item_id'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _elapsed_ms(started):
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+def receive_pallets(pallets, invoice_number, received_by, index=None, fallback_location_code=None):
+    """
+    Пакетне приймання палет: розміщення розраховується для всіх палет наперед,
+    записи ReceivedInventory вставляються одним INSERT, а Inventory і зведення
+    залишків оновлюються одним пакетом (sync_inventory). Commit робить викликач.
+
+    Args:
+        pallets: Список словників з полями item_id, sscc, box_count, net_weight, gross_weight
+            та необов'язковим storage_location (код комірки, вказаний приймальником)
+        invoice_number: Номер накладної
+        received_by: ID користувача, що приймає
+        index: Індекс вільних комірок (за замовчуванням — індекс застосунку)
+        fallback_location_code: Комірка для палет, яким не знайшлося місця
+            (None — такі палети не записуються)
+
+    Returns:
+        dict: Результат з обробленими палетами та часом етапів і кожної палети (мс)
+    """
+    from models import OrderItem
+    from models.received_inventory import sync_inventory
+
+    started = time.perf_counter()
+
+    # Довідкові дані для всіх палет — кількома запитами
+    item_ids = {_item_id(pallet) for pallet in pallets} - {None}
+    order_items = {item.id: item for item in OrderItem.query.filter(OrderItem.id.in_(item_ids))} if item_ids else {}
+    # Палети з невідомим товаром пропускаються
+    pallets = [pallet for pallet in pallets if _item_id(pallet) in order_items]
+
+    ssccs = [pallet.get('sscc') for pallet in pallets]
+    existing = {sscc for (sscc,) in db.session.query(ReceivedInventory.sscc).filter(
+        ReceivedInventory.sscc.in_(set(ssccs))
+    )} if ssccs else set()
+    counts = Counter(ssccs)
+    duplicates = sorted({sscc for sscc in ssccs if sscc in existing or counts[sscc] > 1}, key=str)
+    if duplicates:
+        return {
+            'success': False,
+            'message': f"Палети з SSCC {', '.join(map(str, duplicates))} вже прийнято або повторюються в запиті",
+            'duplicates': duplicates
+        }
+
+    skus = [order_items[_item_id(pallet)].sku for pallet in pallets]
+    planner = PutawayPlanner(index)
+    planner.prefetch(skus)
+    prefetch_ms = _elapsed_ms(started)
+
+    # Комірки, вказані вручну, та резервна комірка — одним запитом
+    codes = {pallet.get('storage_location') for pallet in pallets if pallet.get('storage_location')}
+    if fallback_location_code:
+        codes.add(fallback_location_code)
+    locations = dict(db.session.query(StorageLocation.location_code, StorageLocation.id).filter(
+        StorageLocation.location_code.in_(codes)
+    ).all()) if codes else {}
+    fallback = (locations.get(fallback_location_code), fallback_location_code) \
+        if locations.get(fallback_location_code) else (None, None)
+
+    # Розміщення всіх палет до запису в базу
+    placement_started = time.perf_counter()
+    automatic = [position for position, pallet in enumerate(pallets) if not pallet.get('storage_location')]
+    automatic_timings = []
+    chosen = planner.choose_many([skus[position] for position in automatic], automatic_timings)
+    placements = []
+    for pallet in pallets:
+        code = pallet.get('storage_location')
+        # Невідома вручну вказана комірка — резервна комірка, як у save-receiving
+        placements.append((locations[code], code) if code in locations else fallback)
+    placement_timings = [0.0] * len(pallets)
+    for position, placement, pallet_ms in zip(automatic, chosen, automatic_timings):
+        placements[position] = placement if placement[0] is not None else fallback
+        placement_timings[position] = pallet_ms
+    placement_ms = _elapsed_ms(placement_started)
+
+    received_at = datetime.now()
+    rows = []
+    processed_pallets = []
+    inventory_deltas = {}
+    occupancy = {}
+    for pallet, sku, (location_id, location_code), pallet_ms in zip(pallets, skus, placements, placement_timings):
+        order_item = order_items[_item_id(pallet)]
+        logistics = planner.logistics.get(sku)
+        if location_id is not None:
+            product_name = logistics.product_name if logistics else order_item.product_name
+            expiry_date = None
+            if logistics and logistics.shelf_life:
+                expiry_date = received_at + timedelta(days=logistics.shelf_life)
+            box_count = pallet.get('box_count', 0)
+            rows.append({
+                'sscc': pallet.get('sscc'),
+                'storage_location_id': location_id,
+                'sku': sku,
+                'product_name': product_name,
+                'box_count': box_count,
+                'net_weight': pallet.get('net_weight', 0),
+                'received_at': received_at,
+                'expiry_date': expiry_date,
+                'received_by': received_by,
+                'invoice_number': invoice_number
+            })
+            key = (sku, location_id)
+            inventory_deltas[key] = inventory_deltas.get(key, 0) + (box_count or 0)
+            occupancy[location_id] = occupancy.get(location_id, 0) + 1
+
+        processed_pallets.append({
+            'sscc': pallet.get('sscc'),
+            'item_sku': sku,
+            'item_name': order_item.product_name,
+            'box_count': pallet.get('box_count'),
+            'gross_weight': pallet.get('gross_weight'),
+            'net_weight': pallet.get('net_weight'),
+            'storage_location': location_code,
+            'placement_ms': round(pallet_ms, 2)
+        })
+
+    # Один INSERT для всіх палет; обробники маперів при цьому не викликаються,
+    # тому Inventory та індекс вільних комірок оновлюються явно
+    insert_started = time.perf_counter()
+    if rows:
+        db.session.execute(ReceivedInventory.__table__.insert(), rows)
+    insert_ms = _elapsed_ms(insert_started)
+
+    sync_started = time.perf_counter()
+    sync_inventory(db.session, inventory_deltas)
+    note_occupancy(db.session, occupancy)
+    sync_ms = _elapsed_ms(sync_started)
+
+    # Спільні етапи розподіляються між палетами порівну
+    shared_ms = (insert_ms + sync_ms) / len(rows) if rows else 0
+    for processed in processed_pallets:
+        processed['write_ms'] = round(shared_ms, 2) if processed['storage_location'] else 0
+
+    return {
+        'success': True,
+        'message': f'Дані прийому збережено для {len(processed_pallets)} палет',
+        'processed_pallets': processed_pallets,
+        'received_count': len(rows),
+        'timings': {
+            'prefetch_ms': prefetch_ms,
+            'placement_ms': placement_ms,
+            'insert_ms': insert_ms,
+            'sync_ms': sync_ms,
+            'total_ms': _elapsed_ms(started)
+        }
+    }
+
+
+@contextmanager
+def placement_savepoint(session):
+    """
+    Точка збереження для одного пакета розміщень (receive_pallets).
+
+    Якщо всередині виникає помилка, відкочується лише цей пакет: claim,
+    зроблені в ньому, повертаються в індекс вільних комірок, а накопичена
+    зайнятість — до стану перед пакетом. Зміни попередніх пакетів транзакції
+    застосуються до індексу після commit як звичайно.
+    """
+    occupancy = dict(session.info.get(OCCUPANCY_KEY) or {})
+    claims = list(session.info.get(CLAIMS_KEY) or [])
+    try:
+        with session.begin_nested():
+            yield
+    except Exception:
+        for claim_index, location_id in session.info.get(CLAIMS_KEY) or []:
+            if (claim_index, location_id) not in claims:
+                claim_index.adjust({location_id: -1})
+        session.info[CLAIMS_KEY] = claims
+        session.info[OCCUPANCY_KEY] = occupancy
+        raise
+
+
+# Інкрементальне оновлення індексу: зміни зайнятості комірок накопичуються
+# в сесії і застосовуються до індексу лише після успішного commit.
+
+def _add_occupancy(target, location_id, delta):
+    if location_id is None:
+        return
+    changes = object_session(target).info.setdefault(OCCUPANCY_KEY, {})
+    changes[location_id] = changes.get(location_id, 0) + delta
+
+
+@event.listens_for(ReceivedInventory, 'after_insert')
+def occupy_after_insert(mapper, connection, target):
+    _add_occupancy(target, target.storage_location_id, 1)
+
+
+@event.listens_for(ReceivedInventory, 'after_update')
+def occupy_after_update(mapper, connection, target):
+    history = inspect(target).attrs.storage_location_id.history
+    if not history.has_changes():
+        return
+    old_location_id = history.deleted[0] if history.deleted else None
+    if old_location_id == target.storage_location_id:
+        return
+    _add_occupancy(target, old_location_id, -1)
+    _add_occupancy(target, target.storage_location_id, 1)
+
+
+@event.listens_for(ReceivedInventory, 'after_delete')
+def occupy_after_delete(mapper, connection, target):
+    history = inspect(target).attrs.storage_location_id.history
+    location_id = history.deleted[0] if history.deleted else target.storage_location_id
+    _add_occupancy(target, location_id, -1)
+
+
+def note_occupancy(session, changes):
+    """Зміни зайнятості {location_id: різниця} для записів, вставлених без ORM (пакетний INSERT)"""
+    occupancy = session.info.setdefault(OCCUPANCY_KEY, {})
+    for location_id, delta in changes.items():
+        if location_id is not None:
+            occupancy[location_id] = occupancy.get(location_id, 0) + delta
+
+
+def _layout_changed(mapper, connection, target):
+    object_session(target).info[LAYOUT_CHANGED_KEY] = True
+
+
+for _model in (StorageLocation, StorageRow):
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(_model, _event_name, _layout_changed)
+
+
+def _session_indexes(session, claims):
+    """Індекс застосунку та індекси, в яких сесія займала комірки"""
+    indexes = {id(index): index for index, _ in claims}
+    try:
+        index = current_app.extensions.get('putaway_index')
+    except RuntimeError:
+        # Поза контекстом застосунку індексу немає
+        index = None
+    if index is not None:
+        indexes[id(index)] = index
+    return list(indexes.values())
+
+
+@event.listens_for(db.session, 'before_commit')
+def remove_claim_rows(session):
+    """Claim у putaway_claim потрібні лише до commit — далі комірку займає палета"""
+    release_slot_claims(session)
+
+
+@event.listens_for(db.session, 'after_commit')
+def apply_occupancy_changes(session):
+    changes = session.info.pop(OCCUPANCY_KEY, None) or {}
+    claims = session.info.pop(CLAIMS_KEY, None) or []
+    layout_changed = session.info.pop(LAYOUT_CHANGED_KEY, False)
+    session.info.pop(CLAIM_TOKEN_KEY, None)
+    for index in _session_indexes(session, claims):
+        if layout_changed:
+            index.invalidate()
+            continue
+        # Тимчасові claim замінюються фактичною зайнятістю
+        index_changes = dict(changes)
+        for claim_index, location_id in claims:
+            if claim_index is index:
+                index_changes[location_id] = index_changes.get(location_id, 0) - 1
+        index.adjust(index_changes)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def release_claims(session):
+    # Відкат точки збереження не скасовує claim зовнішньої транзакції (див. placement_savepoint)
+    if session.in_nested_transaction():
+        return
+    session.info.pop(OCCUPANCY_KEY, None)
+    session.info.pop(LAYOUT_CHANGED_KEY, None)
+    claims = session.info.pop(CLAIMS_KEY, None) or []
+    session.info.pop(CLAIM_TOKEN_KEY, None)
+    for claim_index, location_id in claims:
+        claim_index.adjust({location_id: -1})
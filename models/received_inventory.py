@@ -1,20 +1,25 @@
 from extensions import db
 from datetime import datetime
-from sqlalchemy import event
+from sqlalchemy import event, inspect, select, update, and_, or_
+from sqlalchemy.orm import column_property, object_session
+
+SYNC_DELTAS_KEY = 'received_inventory_sync_deltas'
 
 class ReceivedInventory(db.Model):
     __tablename__ = 'received_inventory'
     id = db.Column(db.Integer, primary_key=True)
     sscc = db.Column(db.String(30), unique=True, nullable=False)
-    storage_location_id = db.Column(db.Integer, db.ForeignKey('storage_location.id'))
-    sku = db.Column(db.String(20), nullable=False)
+    # active_history: старі значення потрібні для синхронізації Inventory навіть після expire
+    storage_location_id = column_property(db.Column(db.Integer, db.ForeignKey('storage_location.id'), index=True),
+                                          active_history=True)
+    sku = column_property(db.Column(db.String(20), nullable=False), active_history=True)
     product_name = db.Column(db.String(100), nullable=False)
-    box_count = db.Column(db.Integer, default=0)
+    box_count = column_property(db.Column(db.Integer, default=0), active_history=True)
     net_weight = db.Column(db.Float, default=0.0)
     received_at = db.Column(db.DateTime, default=datetime.utcnow)
     expiry_date = db.Column(db.DateTime, nullable=True)
     received_by = db.Column(db.Integer, db.ForeignKey('user.id'))
-    invoice_number = db.Column(db.String(50), nullable=False)
+    invoice_number = db.Column(db.String(50), nullable=False, index=True)
     
     # Relationships
     storage_location = db.relationship('StorageLocation', backref='received_items')
@@ -23,96 +28,163 @@ class ReceivedInventory(db.Model):
     def __repr__(self):
         return f'<ReceivedInventory {self.sscc} - {self.product_name}>'
 
-    def update_inventory(self):
-        """Оновлює або створює запис в таблиці Inventory після збереження ReceivedInventory"""
-        from models.inventory import Inventory
-        
-        # Шукаємо запис Inventory за sku та location_id
-        inventory = Inventory.query.filter_by(
-            sku=self.sku, 
-            location_id=self.storage_location_id
-        ).first()
-        
-        if inventory:
-            # Якщо запис існує, оновлюємо кількість
-            inventory.quantity += self.box_count
-        else:
-            # Якщо запису немає, створюємо новий
-            inventory = Inventory(
-                sku=self.sku,
-                location_id=self.storage_location_id,
-                quantity=self.box_count,
-                reserved_quantity=0
+
+# Синхронізація Inventory з ReceivedInventory.
+# Обробники маперів лише накопичують різниці кількості за ключем (sku, location_id),
+# а після flush вони застосовуються одним пакетним INSERT ... ON CONFLICT
+# по унікальному ключу (sku, location_id). Записи з кількістю <= 0 видаляються.
+
+def _add_sync_delta(target, sku, location_id, box_count):
+    if not box_count:
+        return
+    session = object_session(target)
+    deltas = session.info.setdefault(SYNC_DELTAS_KEY, {})
+    key = (sku, location_id)
+    deltas[key] = deltas.get(key, 0) + box_count
+
+
+def _old_value(target, key):
+    history = inspect(target).attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(target, key)
+
+
+@event.listens_for(ReceivedInventory, 'after_insert')
+def receive_after_insert(mapper, connection, target):
+    """Нова палета збільшує кількість у своїй комірці"""
+    _add_sync_delta(target, target.sku, target.storage_location_id, target.box_count)
+
+
+@event.listens_for(ReceivedInventory, 'after_update')
+def receive_after_update(mapper, connection, target):
+    """Зміна кількості або переміщення палети: віднімаємо старе значення, додаємо нове"""
+    old_sku = _old_value(target, 'sku')
+    old_location_id = _old_value(target, 'storage_location_id')
+    old_box_count = _old_value(target, 'box_count')
+
+    if (old_sku, old_location_id, old_box_count) == (target.sku, target.storage_location_id, target.box_count):
+        return
+
+    _add_sync_delta(target, old_sku, old_location_id, -(old_box_count or 0))
+    _add_sync_delta(target, target.sku, target.storage_location_id, target.box_count)
+
+
+@event.listens_for(ReceivedInventory, 'after_delete')
+def receive_after_delete(mapper, connection, target):
+    """Видалена палета зменшує кількість у комірці"""
+    _add_sync_delta(target, _old_value(target, 'sku'), _old_value(target, 'storage_location_id'),
+                    -(_old_value(target, 'box_count') or 0))
+
+
+def _upsert_inventory(connection, deltas, now):
+    from models.inventory import Inventory
+    from models.inventory_summary import insert_for_dialect
+
+    table = Inventory.__table__
+    insert = insert_for_dialect(connection)
+
+    located = [(key, delta) for key, delta in deltas if key[1] is not None]
+    rows = [
+        {'sku': sku, 'location_id': location_id, 'quantity': delta, 'reserved_quantity': 0,
+         'created_at': now, 'updated_at': now}
+        for (sku, location_id), delta in located
+    ]
+    if insert is not None and rows:
+        stmt = insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=['sku', 'location_id'],
+            set_={'quantity': table.c.quantity + stmt.excluded.quantity, 'updated_at': stmt.excluded.updated_at}
+        )
+        connection.execute(stmt, rows)
+        pending = [(key, delta) for key, delta in deltas if key[1] is None]
+    else:
+        pending = deltas
+
+    # Палети без комірки (NULL не конфліктує в унікальному ключі) та інші СУБД
+    for (sku, location_id), delta in pending:
+        location_filter = table.c.location_id.is_(None) if location_id is None else table.c.location_id == location_id
+        result = connection.execute(
+            update(table).where(table.c.sku == sku, location_filter).values(
+                quantity=table.c.quantity + delta, updated_at=now
             )
-            db.session.add(inventory)
+        )
+        if result.rowcount == 0:
+            connection.execute(table.insert().values(
+                sku=sku, location_id=location_id, quantity=delta, reserved_quantity=0,
+                created_at=now, updated_at=now
+            ))
+
+
+def _remove_empty_inventory(connection, keys):
+    """Видаляє записи Inventory з кількістю <= 0 серед змінених; повертає видалені рядки"""
+    from models.inventory import Inventory
+
+    table = Inventory.__table__
+    key_filters = [
+        and_(table.c.sku == sku,
+             table.c.location_id.is_(None) if location_id is None else table.c.location_id == location_id)
+        for sku, location_id in keys
+    ]
+    removed = connection.execute(
+        select(table.c.id, table.c.sku, table.c.location_id, table.c.quantity, table.c.reserved_quantity).where(
+            table.c.quantity <= 0, or_(*key_filters)
+        )
+    ).all()
+    if removed:
+        connection.execute(table.delete().where(table.c.id.in_([row.id for row in removed])))
+    return removed
+
+
+def sync_inventory(session, deltas):
+    """
+    Застосовує різниці кількості {(sku, location_id): delta} до Inventory
+    та зведення залишків у поточній транзакції.
+    """
+    from models.inventory import Inventory
+    from models.storage import StorageLocation
+    from models.inventory_summary import InventorySummary, add_delta, apply_deltas, contribution
+
+    deltas = sorted(((key, delta) for key, delta in deltas.items() if delta),
+                    key=lambda item: (item[0][0], item[0][1] is None, item[0][1] or 0))
+    if not deltas:
+        return
+
+    connection = session.connection()
+    now = datetime.utcnow()
+    _upsert_inventory(connection, deltas, now)
+    removed = _remove_empty_inventory(connection, [key for key, _ in deltas])
+
+    # Зведення залишків: прямі запити не проходять через flush сесії
+    location_ids = {key[1] for key, _ in deltas if key[1] is not None}
+    levels = dict(connection.execute(
+        select(StorageLocation.id, StorageLocation.level).where(StorageLocation.id.in_(location_ids))
+    ).all()) if location_ids else {}
+    summary_deltas = {}
+    for (sku, location_id), delta in deltas:
+        add_delta(summary_deltas, sku, contribution(delta, 0, levels.get(location_id)))
+    for row in removed:
+        add_delta(summary_deltas, row.sku,
+                  contribution(row.quantity, row.reserved_quantity, levels.get(row.location_id)), sign=-1)
+    apply_deltas(connection, summary_deltas)
+
+    # Об'єкти в сесії могли застаріти після прямих запитів
+    keys = {key for key, _ in deltas}
+    for instance in list(session.identity_map.values()):
+        if isinstance(instance, Inventory) and (instance.sku, instance.location_id) in keys:
+            session.expire(instance)
+        elif isinstance(instance, InventorySummary):
+            session.expire(instance)
+
 
-# Обробники подій SQLAlchemy для автоматичного оновлення Inventory
 @event.listens_for(db.session, 'after_flush')
 def receive_after_flush(session, flush_context):
-    """Викликається після flush операцій в сесії"""
-    for instance in session.new:
-        if isinstance(instance, ReceivedInventory):
-            instance.update_inventory()
-
-@event.listens_for(ReceivedInventory, 'before_delete')
-def receive_before_delete(mapper, connection, target):
-    """Викликається перед видаленням запису ReceivedInventory"""
-    if isinstance(target, ReceivedInventory):
-        from models.inventory import Inventory
-        # Знаходимо відповідний запис в Inventory
-        inventory = Inventory.query.filter_by(
-            sku=target.sku, 
-            location_id=target.storage_location_id
-        ).first()
-        
-        if inventory:
-            # Зменшуємо кількість товару
-            inventory.quantity -= target.box_count
-            # Якщо кількість стала від'ємною або нульовою, видаляємо запис
-            if inventory.quantity <= 0:
-                db.session.delete(inventory)
-
-@event.listens_for(ReceivedInventory, 'before_update')
-def receive_before_update(mapper, connection, target):
-    """Викликається перед оновленням запису ReceivedInventory"""
-    # Зберігаємо старі значення для порівняння
-    if hasattr(target, '_sa_instance_state') and hasattr(target._sa_instance_state, 'committed_state'):
-        old_values = target._sa_instance_state.committed_state
-        
-        # Якщо змінилася кількість або розташування
-        if 'box_count' in old_values or 'storage_location_id' in old_values:
-            from models.inventory import Inventory
-            
-            old_box_count = old_values.get('box_count', target.box_count)
-            old_location_id = old_values.get('storage_location_id', target.storage_location_id)
-            
-            # Якщо змінилося розташування
-            if old_location_id != target.storage_location_id:
-                # Зменшуємо кількість у старому розташуванні
-                old_inventory = Inventory.query.filter_by(sku=target.sku, location_id=old_location_id).first()
-                if old_inventory:
-                    old_inventory.quantity -= old_box_count
-                    if old_inventory.quantity <= 0:
-                        db.session.delete(old_inventory)
-                
-                # Збільшуємо кількість у новому розташуванні
-                new_inventory = Inventory.query.filter_by(sku=target.sku, location_id=target.storage_location_id).first()
-                if new_inventory:
-                    new_inventory.quantity += target.box_count
-                else:
-                    new_inventory = Inventory(
-                        sku=target.sku,
-                        location_id=target.storage_location_id,
-                        quantity=target.box_count,
-                        reserved_quantity=0
-                    )
-                    db.session.add(new_inventory)
-            
-            # Якщо змінилася тільки кількість, але не розташування
-            elif old_box_count != target.box_count:
-                inventory = Inventory.query.filter_by(sku=target.sku, location_id=target.storage_location_id).first()
-                if inventory:
-                    # Оновлюємо кількість (віднімаємо стару, додаємо нову)
-                    inventory.quantity = inventory.quantity - old_box_count + target.box_count
-                    if inventory.quantity <= 0:
-                        db.session.delete(inventory)
\ No newline at end of file
+    """Застосовує накопичені за flush різниці одним пакетом"""
+    deltas = session.info.pop(SYNC_DELTAS_KEY, None)
+    if deltas:
+        sync_inventory(session, deltas)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def discard_sync_deltas(session):
+    session.info.pop(SYNC_DELTAS_KEY, None)
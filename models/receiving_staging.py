@@ -0,0 +1,424 @@
+"""
+Поетапне (асинхронне) приймання палет з ТЗД.
+
+Ендпоінт приймання лише перевіряє SSCC і зберігає сканування в таблиці
+receiving_scan зі статусом 'pending' — термінал отримує відповідь одразу.
+Фоновий обробник (flask receiving-worker) забирає накопичені сканування
+пакетами, розміщує їх і записує палети через receive_pallets (один INSERT
+і одне оновлення Inventory на пакет), а статус і призначену комірку
+записує назад у сканування в тій самій транзакції. Термінал дізнається
+комірку за SSCC, прогрес приймання доступний по замовленню.
+"""
+import math
+import time
+from collections import Counter
+from datetime import datetime
+from extensions import db
+from sqlalchemy import func, case, update, bindparam
+from sqlalchemy.exc import IntegrityError
+
+DEFAULT_BATCH_SIZE = 200
+FALLBACK_LOCATION_CODE = 'RECEIVING'
+
+STATUS_PENDING = 'pending'
+STATUS_PLACED = 'placed'
+STATUS_FAILED = 'failed'
+
+
+class ReceivingScan(db.Model):
+    __tablename__ = 'receiving_scan'
+    id = db.Column(db.Integer, primary_key=True)
+    sscc = db.Column(db.String(30), unique=True, nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('order.id'), nullable=False, index=True)
+    item_id = db.Column(db.Integer, db.ForeignKey('order_item.id'), nullable=False)
+    invoice_number = db.Column(db.String(50), nullable=False)
+    box_count = db.Column(db.Integer, default=0)
+    gross_weight = db.Column(db.Float, default=0.0)
+    pallet_weight = db.Column(db.Float, default=0.0)
+    net_weight = db.Column(db.Float, default=0.0)
+    requested_location = db.Column(db.String(20), nullable=True)  # Комірка, вказана приймальником
+    status = db.Column(db.String(20), default=STATUS_PENDING, nullable=False, index=True)  # pending, placed, failed
+    storage_location_code = db.Column(db.String(20), nullable=True)  # Призначена комірка
+    message = db.Column(db.String(200), nullable=True)
+    received_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    processed_at = db.Column(db.DateTime, nullable=True)
+
+    def __repr__(self):
+        return f'<ReceivingScan {self.sscc} ({self.status})>'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'sscc': self.sscc,
+            'order_id': self.order_id,
+            'item_id': self.item_id,
+            'box_count': self.box_count,
+            'status': self.status,
+            'storage_location': self.storage_location_code,
+            'message': self.message,
+            'created_at': self.created_at.strftime('%Y-%m-%d %H:%M:%S') if self.created_at else None,
+            'processed_at': self.processed_at.strftime('%Y-%m-%d %H:%M:%S') if self.processed_at else None
+        }
+
+
+# Числові поля сканування: (поле, тип, назва для повідомлення)
+SCAN_NUMBER_FIELDS = (
+    ('box_count', int, 'Кількість ящиків'),
+    ('gross_weight', float, 'Вага брутто'),
+    ('pallet_weight', float, 'Вага палети'),
+    ('net_weight', float, 'Вага нетто'),
+)
+
+
+def _positive_number(value, kind):
+    """Додатне число типу kind (int або float) з даних терміналу або None"""
+    if isinstance(value, bool):
+        return None
+    if kind is int:
+        if isinstance(value, str) and value.strip().isdigit():
+            value = int(value)
+        if not isinstance(value, int):
+            return None
+        number = value
+    else:
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return None
+        if not math.isfinite(number):
+            return None
+    return number if number > 0 else None
+
+
+def _validate_scan(data):
+    """
+    Перевіряє дані сканування палети до збереження.
+
+    Returns:
+        tuple: (значення сканування, None) або (None, повідомлення про помилку)
+    """
+    sscc = str(data.get('sscc') or '').strip()
+    if not sscc or data.get('item_id') in (None, ''):
+        return None, 'Неповні дані'
+
+    item_id = _positive_number(data.get('item_id'), int)
+    if item_id is None:
+        return None, f"Некоректний ID товару: {data.get('item_id')}"
+
+    values = {'sscc': sscc, 'item_id': item_id,
+              'requested_location': str(data.get('storage_location') or '').strip() or None}
+    for field, kind, label in SCAN_NUMBER_FIELDS:
+        number = _positive_number(data.get(field), kind)
+        if number is None:
+            kind_name = 'цілим числом' if kind is int else 'числом'
+            return None, f'{label} має бути {kind_name} більше нуля (палета {sscc})'
+        values[field] = number
+    return values, None
+
+
+def _new_scan(values, order_item, received_by):
+    return ReceivingScan(
+        sscc=values['sscc'],
+        order_id=order_item.order_id,
+        item_id=order_item.id,
+        invoice_number=order_item.invoice_number or '',
+        box_count=values['box_count'],
+        gross_weight=values['gross_weight'],
+        pallet_weight=values['pallet_weight'],
+        net_weight=values['net_weight'],
+        requested_location=values['requested_location'],
+        received_by=received_by
+    )
+
+
+def _taken_ssccs(ssccs):
+    """SSCC серед ssccs, що вже прийняті або чекають розміщення (двома запитами)"""
+    from models import ReceivedInventory
+
+    ssccs = set(ssccs)
+    received = {sscc for (sscc,) in db.session.query(ReceivedInventory.sscc).filter(ReceivedInventory.sscc.in_(ssccs))}
+    staged = {sscc for (sscc,) in db.session.query(ReceivingScan.sscc).filter(ReceivingScan.sscc.in_(ssccs))}
+    return received | staged
+
+
+def _commit_scans():
+    """Commit збережених сканувань; False, якщо інший термінал встиг зберегти той самий SSCC"""
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Перевірка SSCC і вставка — окремі запити, унікальний ключ sscc ловить гонку
+        db.session.rollback()
+        return False
+    return True
+
+
+def stage_scan(data, received_by):
+    """
+    Перевіряє і зберігає сканування палети для фонової обробки.
+
+    Args:
+        data: Дані сканування (sscc, item_id, box_count, ваги, storage_location)
+        received_by: ID користувача, що приймає
+
+    Returns:
+        dict: Результат з даними збереженого сканування
+    """
+    from models import OrderItem
+
+    values, error = _validate_scan(data)
+    if error:
+        return {'success': False, 'message': error}
+    sscc = values['sscc']
+
+    order_item = db.session.get(OrderItem, values['item_id'])
+    if not order_item:
+        return {'success': False, 'message': f"Товар з ID {values['item_id']} не знайдено"}
+
+    if _taken_ssccs([sscc]):
+        return {'success': False, 'message': f'Палету з SSCC {sscc} вже прийнято'}
+
+    scan = _new_scan(values, order_item, received_by)
+    db.session.add(scan)
+    if not _commit_scans():
+        return {'success': False, 'message': f'Палету з SSCC {sscc} вже прийнято'}
+
+    return {
+        'success': True,
+        'message': 'Сканування збережено, палета очікує розміщення',
+        'scan': scan.to_dict()
+    }
+
+
+def stage_scans(pallets, received_by):
+    """
+    Перевіряє і зберігає сканування всіх палет машини одним пакетом.
+
+    Якщо хоча б одна палета некоректна, її SSCC вже прийнято або повторюється
+    в запиті, не зберігається жодна. Commit включає й інші зміни сесії
+    (наприклад, статус замовлення, встановлений викликачем).
+
+    Args:
+        pallets: Список даних сканування (як у stage_scan)
+        received_by: ID користувача, що приймає
+
+    Returns:
+        dict: Результат зі збереженими скануваннями (статус pending)
+    """
+    from models import OrderItem
+
+    if not pallets:
+        return {'success': False, 'message': 'Неповні дані або відсутні палети'}
+
+    scans_values = []
+    for pallet in pallets:
+        values, error = _validate_scan(pallet or {})
+        if error:
+            return {'success': False, 'message': error}
+        scans_values.append(values)
+
+    item_ids = {values['item_id'] for values in scans_values}
+    order_items = {item.id: item for item in OrderItem.query.filter(OrderItem.id.in_(item_ids))}
+    missing = sorted(item_ids - set(order_items))
+    if missing:
+        return {'success': False, 'message': f"Товари з ID {', '.join(map(str, missing))} не знайдено"}
+
+    ssccs = [values['sscc'] for values in scans_values]
+    counts = Counter(ssccs)
+    taken = _taken_ssccs(ssccs)
+    duplicates = sorted({sscc for sscc in ssccs if sscc in taken or counts[sscc] > 1})
+    if duplicates:
+        return {
+            'success': False,
+            'message': f"Палети з SSCC {', '.join(duplicates)} вже прийнято або повторюються в запиті",
+            'duplicates': duplicates
+        }
+
+    scans = [_new_scan(values, order_items[values['item_id']], received_by) for values in scans_values]
+    db.session.add_all(scans)
+    if not _commit_scans():
+        return {'success': False, 'message': 'Частину палет вже прийнято з іншого терміналу'}
+
+    return {
+        'success': True,
+        'message': f'Збережено сканувань: {len(scans)}, палети очікують розміщення',
+        'scans': [scan.to_dict() for scan in scans]
+    }
+
+
+def _claim_pending(batch_size):
+    """Забирає наступний пакет сканувань; на PostgreSQL паралельні обробники пропускають чужі"""
+    query = ReceivingScan.query.filter_by(status=STATUS_PENDING).order_by(ReceivingScan.id).limit(batch_size)
+    if db.session.get_bind().dialect.name == 'postgresql':
+        query = query.with_for_update(skip_locked=True)
+    return query.all()
+
+
+def _finish(results):
+    """Записує статус, комірку і повідомлення для сканувань одним пакетним UPDATE"""
+    if not results:
+        return
+    table = ReceivingScan.__table__
+    db.session.execute(
+        update(table).where(table.c.id == bindparam('scan_id')).values(
+            status=bindparam('new_status'),
+            storage_location_code=bindparam('location_code'),
+            message=bindparam('new_message'),
+            processed_at=bindparam('finished_at')
+        ),
+        results
+    )
+
+
+def process_receiving_scans(batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Обробляє один пакет сканувань: розміщення та запис палет однією транзакцією.
+
+    Групи сканувань (накладна, приймальник) розміщуються в окремих точках
+    збереження: якщо група падає з помилкою, лише її сканування отримують
+    статус failed, а решта пакета записується.
+
+    Returns:
+        dict: Кількість оброблених, розміщених та відхилених сканувань
+    """
+    from models import ReceivedInventory
+    from models.putaway import receive_pallets, placement_savepoint
+
+    scans = _claim_pending(batch_size)
+    if not scans:
+        db.session.rollback()
+        return {'success': True, 'message': 'Немає сканувань для обробки', 'processed': 0, 'placed': 0, 'failed': 0}
+
+    now = datetime.utcnow()
+    results = []
+
+    # SSCC, прийняті за цей час іншим шляхом (поза чергою сканувань)
+    received = {sscc for (sscc,) in db.session.query(ReceivedInventory.sscc).filter(
+        ReceivedInventory.sscc.in_([scan.sscc for scan in scans])
+    )}
+    groups = {}
+    for scan in scans:
+        if scan.sscc in received:
+            results.append({'scan_id': scan.id, 'new_status': STATUS_FAILED, 'location_code': None,
+                            'new_message': 'Палету з таким SSCC вже прийнято', 'finished_at': now})
+            continue
+        groups.setdefault((scan.invoice_number, scan.received_by), []).append(scan)
+
+    for (invoice_number, received_by), group in groups.items():
+        # Кожна група — в окремій точці збереження: помилка однієї групи не блокує чергу
+        try:
+            with placement_savepoint(db.session):
+                result = receive_pallets([
+                    {
+                        'item_id': scan.item_id,
+                        'sscc': scan.sscc,
+                        'box_count': scan.box_count,
+                        'net_weight': scan.net_weight,
+                        'gross_weight': scan.gross_weight,
+                        'storage_location': scan.requested_location
+                    } for scan in group
+                ], invoice_number, received_by, fallback_location_code=FALLBACK_LOCATION_CODE)
+                db.session.flush()
+        except Exception as e:
+            print(f"Помилка розміщення сканувань накладної {invoice_number}: {str(e)}")
+            message = f'Помилка розміщення: {str(e)}'[:200]
+            results.extend({'scan_id': scan.id, 'new_status': STATUS_FAILED, 'location_code': None,
+                            'new_message': message, 'finished_at': now} for scan in group)
+            continue
+
+        locations = {pallet['sscc']: pallet['storage_location'] for pallet in result.get('processed_pallets', [])}
+        for scan in group:
+            location_code = locations.get(scan.sscc)
+            if location_code:
+                results.append({'scan_id': scan.id, 'new_status': STATUS_PLACED, 'location_code': location_code,
+                                'new_message': None, 'finished_at': now})
+            else:
+                results.append({'scan_id': scan.id, 'new_status': STATUS_FAILED, 'location_code': None,
+                                'new_message': result['message'] if not result['success'] else 'Палету не розміщено',
+                                'finished_at': now})
+
+    _finish(results)
+    db.session.commit()
+
+    placed = sum(1 for result in results if result['new_status'] == STATUS_PLACED)
+    message = f'Оброблено сканувань: {len(results)}, розміщено палет: {placed}'
+    print(message)
+    return {'success': True, 'message': message, 'processed': len(results), 'placed': placed,
+            'failed': len(results) - placed}
+
+
+def run_receiving_worker(app, interval, batch_size=DEFAULT_BATCH_SIZE, iterations=None):
+    """
+    Фоновий обробник сканувань: обробляє пакети, доки черга не спорожніє,
+    потім чекає interval секунд.
+
+    Args:
+        app: Flask-застосунок
+        interval: Пауза, коли черга порожня, секунд
+        batch_size: Сканувань в одному пакеті
+        iterations: Кількість циклів (None — безкінечно)
+    """
+    count = 0
+    while iterations is None or count < iterations:
+        with app.app_context():
+            try:
+                # Повні пакети означають, що в черзі ще є сканування
+                while process_receiving_scans(batch_size)['processed'] >= batch_size:
+                    pass
+            except Exception as e:
+                db.session.rollback()
+                print(f"Помилка обробки сканувань приймання: {str(e)}")
+            finally:
+                db.session.remove()
+        count += 1
+        if iterations is None or count < iterations:
+            time.sleep(interval)
+
+
+def get_receiving_scans(ssccs):
+    """Стан сканувань за списком SSCC одним запитом (у порядку ssccs, невідомі пропускаються)"""
+    scans = {scan.sscc: scan for scan in ReceivingScan.query.filter(ReceivingScan.sscc.in_(set(ssccs)))}
+    return [scans[sscc].to_dict() for sscc in ssccs if sscc in scans]
+
+
+def get_receiving_progress(order_id):
+    """
+    Прогрес приймання замовлення: кількість сканувань за статусами
+    та кількість ящиків за позиціями (замовлено / в черзі / розміщено).
+    """
+    from models import OrderItem
+
+    placed_boxes = func.sum(case((ReceivingScan.status == STATUS_PLACED, ReceivingScan.box_count), else_=0))
+    pending_boxes = func.sum(case((ReceivingScan.status == STATUS_PENDING, ReceivingScan.box_count), else_=0))
+    rows = db.session.query(
+        OrderItem.id,
+        OrderItem.sku,
+        OrderItem.product_name,
+        OrderItem.quantity,
+        func.coalesce(pending_boxes, 0),
+        func.coalesce(placed_boxes, 0)
+    ).outerjoin(
+        ReceivingScan, ReceivingScan.item_id == OrderItem.id
+    ).filter(
+        OrderItem.order_id == order_id
+    ).group_by(OrderItem.id, OrderItem.sku, OrderItem.product_name, OrderItem.quantity).order_by(OrderItem.id).all()
+
+    statuses = dict(db.session.query(ReceivingScan.status, func.count(ReceivingScan.id)).filter(
+        ReceivingScan.order_id == order_id
+    ).group_by(ReceivingScan.status).all())
+
+    return {
+        'order_id': order_id,
+        'scans': {status: statuses.get(status, 0) for status in (STATUS_PENDING, STATUS_PLACED, STATUS_FAILED)},
+        'items': [
+            {
+                'item_id': item_id,
+                'sku': sku,
+                'product_name': product_name,
+                'quantity': quantity,
+                'pending_boxes': int(pending),
+                'placed_boxes': int(placed)
+            }
+            for item_id, sku, product_name, quantity, pending, placed in rows
+        ]
+    }
@@ -0,0 +1,202 @@
+"""
+Планувальник поповнення місць відбору за схемою min/max.
+
+Для кожного призначеного місця відбору (SkuPickingLocation) рахується
+прогнозований залишок на рівні 1: поточна кількість мінус ще не відібрана
+потреба відкритих лотів плюс товар, що вже їде непідтвердженими
+переміщеннями. Якщо прогноз нижчий за мінімум, запитується поповнення
+до максимуму. Всі дані завантажуються кількома згрупованими запитами,
+а запити на переміщення створюються одним пакетом (create_pending_transfers).
+"""
+import time
+from extensions import db
+from flask import current_app
+from sqlalchemy import case, func
+from models.inventory import Inventory
+from models.storage import StorageLocation, SkuPickingLocation
+from models.order_lot import OrderLot, OrderLotProgress
+from models.pending_transfer import PendingTransferRequest
+
+DEFAULT_MIN_BOXES = 10
+DEFAULT_MAX_BOXES = 60
+
+# Статуси лотів, потреба яких ще не відібрана
+OPEN_LOT_STATUSES = ('wait', 'start')
+
+
+def _picking_quantities(skus):
+    """Кількість ящиків на рівні 1 за SKU"""
+    rows = db.session.query(
+        Inventory.sku, func.sum(Inventory.quantity)
+    ).join(
+        StorageLocation, Inventory.location_id == StorageLocation.id
+    ).filter(
+        Inventory.sku.in_(skus),
+        StorageLocation.level == '1'
+    ).group_by(Inventory.sku).all()
+    return {sku: int(quantity or 0) for sku, quantity in rows}
+
+
+def _open_lot_demand(skus):
+    """
+    Невідібрана потреба відкритих лотів за SKU.
+
+    Потреба береться з прогресу лотів (order_lot_progress), який створюється
+    разом із лотами; для лотів, створених до появи прогресу, — з позицій
+    замовлення лота мінус уже відібране.
+    """
+    from models.order import OrderItem
+    from models.picking import OrderPickingItem
+
+    remaining = OrderLotProgress.required_quantity - OrderLotProgress.picked_boxes
+    demand = {sku: int(quantity or 0) for sku, quantity in db.session.query(
+        OrderLotProgress.sku, func.sum(case((remaining > 0, remaining), else_=0))
+    ).join(
+        OrderLot, OrderLot.id == OrderLotProgress.order_lot_id
+    ).filter(
+        OrderLot.status.in_(OPEN_LOT_STATUSES),
+        OrderLotProgress.sku.in_(skus)
+    ).group_by(OrderLotProgress.sku)}
+
+    # Лоти без прогресу (remaining_lines ще не заповнено)
+    legacy_lots = db.session.query(OrderLot.lot_number).filter(
+        OrderLot.status.in_(OPEN_LOT_STATUSES),
+        OrderLot.remaining_lines.is_(None)
+    )
+    required = db.session.query(
+        OrderItem.sku, func.sum(OrderItem.quantity)
+    ).filter(
+        OrderItem.lot_number.in_(legacy_lots),
+        OrderItem.sku.in_(skus)
+    ).group_by(OrderItem.sku).all()
+    if required:
+        picked = dict(db.session.query(
+            OrderPickingItem.sku, func.sum(OrderPickingItem.picked_box_count)
+        ).filter(
+            OrderPickingItem.lot_number.in_(legacy_lots),
+            OrderPickingItem.sku.in_(skus)
+        ).group_by(OrderPickingItem.sku).all())
+        for sku, quantity in required:
+            left = max(int(quantity or 0) - int(picked.get(sku) or 0), 0)
+            demand[sku] = demand.get(sku, 0) + left
+
+    return {sku: quantity for sku, quantity in demand.items() if quantity > 0}
+
+
+def _incoming_quantities(skus):
+    """Ящики в непідтверджених переміщеннях за SKU"""
+    rows = db.session.query(
+        PendingTransferRequest.sku, func.sum(PendingTransferRequest.box_count)
+    ).filter(
+        PendingTransferRequest.confirmed == False,  # noqa: E712
+        PendingTransferRequest.sku.in_(skus)
+    ).group_by(PendingTransferRequest.sku).all()
+    return {sku: int(quantity or 0) for sku, quantity in rows}
+
+
+def plan_replenishment(dry_run=True):
+    """
+    Розраховує поповнення місць відбору і (якщо не dry_run) створює запити на переміщення.
+
+    Args:
+        dry_run: Лише повернути план без створення запитів
+
+    Returns:
+        dict: Результат з планом по кожному SKU, що потребує поповнення
+    """
+    from models.inventory_management import create_pending_transfers
+
+    default_min = current_app.config.get('REPLENISHMENT_MIN_BOXES', DEFAULT_MIN_BOXES)
+    default_max = current_app.config.get('REPLENISHMENT_MAX_BOXES', DEFAULT_MAX_BOXES)
+
+    assignments = db.session.query(
+        SkuPickingLocation.sku,
+        SkuPickingLocation.min_quantity,
+        SkuPickingLocation.max_quantity,
+        StorageLocation.location_code
+    ).join(
+        StorageLocation, StorageLocation.id == SkuPickingLocation.picking_location_id
+    ).order_by(SkuPickingLocation.sku).all()
+
+    skus = [assignment.sku for assignment in assignments]
+    if not skus:
+        return {
+            'success': True,
+            'message': 'Немає призначених місць відбору',
+            'dry_run': dry_run,
+            'plan': [],
+            'created_requests': 0
+        }
+
+    on_hand = _picking_quantities(skus)
+    demand = _open_lot_demand(skus)
+    incoming = _incoming_quantities(skus)
+
+    plan = []
+    for sku, min_quantity, max_quantity, location_code in assignments:
+        min_quantity = default_min if min_quantity is None else min_quantity
+        max_quantity = max(default_max if max_quantity is None else max_quantity, min_quantity)
+
+        projected = on_hand.get(sku, 0) - demand.get(sku, 0) + incoming.get(sku, 0)
+        if projected >= min_quantity:
+            continue
+
+        plan.append({
+            'sku': sku,
+            'location': location_code,
+            'on_hand': on_hand.get(sku, 0),
+            'open_demand': demand.get(sku, 0),
+            'incoming': incoming.get(sku, 0),
+            'projected': projected,
+            'min_quantity': min_quantity,
+            'max_quantity': max_quantity,
+            'required': max_quantity - projected,
+            'created_requests': 0
+        })
+
+    created_requests = 0
+    if plan and not dry_run:
+        result = create_pending_transfers({row['sku']: row['required'] for row in plan})
+        created_requests = result['created_requests']
+        for row in plan:
+            row['created_requests'] = result['created_by_sku'].get(row['sku'], 0)
+
+    if dry_run:
+        message = f'Поповнення потребують {len(plan)} з {len(skus)} місць відбору (пробний запуск)'
+    else:
+        message = f'Поповнення потребують {len(plan)} з {len(skus)} місць відбору. ' \
+                  f'Створено {created_requests} запитів на переміщення'
+    print(message)
+
+    return {
+        'success': True,
+        'message': message,
+        'dry_run': dry_run,
+        'plan': plan,
+        'created_requests': created_requests
+    }
+
+
+def run_replenishment_worker(app, interval, dry_run=False, iterations=None):
+    """
+    Періодично запускає планувальник поповнення (фонова задача).
+
+    Args:
+        app: Flask-застосунок
+        interval: Пауза між запусками, секунд
+        dry_run: Лише звітувати без створення запитів
+        iterations: Кількість запусків (None — безкінечно)
+    """
+    count = 0
+    while iterations is None or count < iterations:
+        with app.app_context():
+            try:
+                plan_replenishment(dry_run=dry_run)
+            except Exception as e:
+                db.session.rollback()
+                print(f"Помилка планування поповнення: {str(e)}")
+            finally:
+                db.session.remove()
+        count += 1
+        if iterations is None or count < iterations:
+            time.sleep(interval)
@@ -0,0 +1,235 @@
+"""
+Радник розміщення місць відбору за швидкістю обертання SKU.
+
+Частота відбору рахується з історії OrderPickingItem одним згрупованим
+запитом (кількість рядків відбору і ящиків за SKU за період). SKU
+діляться на класи ABC за накопиченою часткою рядків відбору. Комірки
+рівня 1 впорядковуються за доступністю — відстанню від початку
+маршруту комплектувальника (та сама модель відстаней, що й для
+маршрутів переміщень). Найчастіше відбирані SKU отримують найближчі
+сумісні за температурою комірки; вигода оцінюється як зменшення
+сумарного шляху «початок → комірка → початок» на кожен рядок відбору.
+"""
+from datetime import datetime, timedelta
+from extensions import db
+from sqlalchemy import func, update, bindparam
+from models.storage import StorageRow, StorageLocation, SkuPickingLocation
+from models.transfer_sequencing import Point, location_point, travel_distance
+
+DEFAULT_HISTORY_DAYS = 90
+CLASS_A_SHARE = 0.8   # SKU, що дають перші 80% рядків відбору
+CLASS_B_SHARE = 0.95  # Наступні 15%; решта — клас C
+
+
+def pick_velocity(days=DEFAULT_HISTORY_DAYS):
+    """
+    Частота відбору за SKU за останні days днів.
+
+    Returns:
+        dict: {sku: (рядків відбору, ящиків)}
+    """
+    from models.picking import OrderPickingItem
+
+    since = datetime.utcnow() - timedelta(days=days)
+    rows = db.session.query(
+        OrderPickingItem.sku,
+        func.count(OrderPickingItem.id),
+        func.coalesce(func.sum(OrderPickingItem.picked_box_count), 0)
+    ).filter(
+        OrderPickingItem.picked_at >= since
+    ).group_by(OrderPickingItem.sku).all()
+    return {sku: (int(lines), int(boxes)) for sku, lines, boxes in rows}
+
+
+def classify_abc(velocity):
+    """Клас ABC для кожного SKU за накопиченою часткою рядків відбору"""
+    total = sum(lines for lines, _ in velocity.values())
+    classes = {}
+    accumulated = 0
+    for sku, (lines, _) in sorted(velocity.items(), key=lambda item: (-item[1][0], item[0])):
+        # Клас визначається часткою до додавання SKU, щоб перший SKU завжди був A
+        share = accumulated / total if total else 1.0
+        classes[sku] = 'A' if share < CLASS_A_SHARE else 'B' if share < CLASS_B_SHARE else 'C'
+        accumulated += lines
+    return classes
+
+
+def _picking_cells():
+    """Комірки рівня 1 з рядом, температурним режимом і відстанню від початку маршруту"""
+    rows = db.session.query(
+        StorageLocation.id,
+        StorageLocation.location_code,
+        StorageLocation.row_code,
+        StorageLocation.cell,
+        StorageLocation.level,
+        StorageRow.temperature_min,
+        StorageRow.temperature_max
+    ).join(
+        StorageRow, StorageRow.code == StorageLocation.row_code
+    ).filter(
+        StorageLocation.level.in_(['1', '01']),
+        StorageLocation.location_type == 'picking'
+    ).all()
+
+    row_codes = sorted({code for (code,) in db.session.query(StorageRow.code)})
+    row_index = {code: index for index, code in enumerate(row_codes)}
+    points = {row.id: location_point(row, row_index) for row in rows}
+    row_length = max([point.cell for point in points.values()] + [1])
+    depot = Point(0, 0, 1)
+
+    return {
+        row.id: {
+            'code': row.location_code,
+            'band': (row.temperature_min, row.temperature_max),
+            'distance': travel_distance(depot, points[row.id], row_length)
+        }
+        for row in rows
+    }
+
+
+def plan_slotting(days=DEFAULT_HISTORY_DAYS):
+    """
+    Пропонує нові місця відбору: SKU у порядку спадання частоти відбору
+    отримують найближчі вільні сумісні комірки. Серед однаково
+    віддалених комірок SKU залишається на поточній.
+
+    Args:
+        days: Період історії відбору, днів
+
+    Returns:
+        dict: Класи ABC, переміщення та прогнозований шлях комплектувальника
+    """
+    from models import LogisticsItemData
+
+    velocity = pick_velocity(days)
+    classes = classify_abc(velocity)
+    assignments = dict(db.session.query(SkuPickingLocation.sku, SkuPickingLocation.picking_location_id))
+    cells = _picking_cells()
+    temperatures = dict(db.session.query(LogisticsItemData.sku, LogisticsItemData.temperature_range).filter(
+        LogisticsItemData.sku.in_(list(assignments))
+    )) if assignments else {}
+
+    # Комірки за доступністю; SKU з місцем поза рівнем 1 не переставляються і займають свої комірки
+    ordered = sorted(cells, key=lambda location_id: (cells[location_id]['distance'], cells[location_id]['code']))
+    movable = {sku: location_id for sku, location_id in assignments.items() if location_id in cells}
+    taken = set(assignments.values()) - set(movable.values())
+
+    skus = sorted(movable, key=lambda sku: (-velocity.get(sku, (0, 0))[0], sku))
+    proposed = {}
+    for sku in skus:
+        temperature = temperatures.get(sku)
+        current = movable[sku]
+        best = next((
+            location_id for location_id in ordered
+            if location_id not in taken and (
+                temperature is None or cells[location_id]['band'][0] <= temperature <= cells[location_id]['band'][1]
+            )
+        ), None)
+        if current not in taken and (best is None or cells[current]['distance'] <= cells[best]['distance']):
+            best = current
+        elif best is None:
+            # Сумісних вільних комірок немає, а поточну зайняв швидший SKU
+            best = next((location_id for location_id in ordered if location_id not in taken), current)
+        proposed[sku] = best
+        taken.add(best)
+
+    moves = []
+    current_travel = proposed_travel = 0.0
+    for sku in skus:
+        lines, boxes = velocity.get(sku, (0, 0))
+        current, target = movable[sku], proposed[sku]
+        # Шлях «туди й назад» на кожен рядок відбору
+        current_travel += 2 * lines * cells[current]['distance']
+        proposed_travel += 2 * lines * cells[target]['distance']
+        if target != current:
+            moves.append({
+                'sku': sku,
+                'abc_class': classes.get(sku, 'C'),
+                'pick_lines': lines,
+                'picked_boxes': boxes,
+                'from_location_id': current,
+                'from_location': cells[current]['code'],
+                'to_location_id': target,
+                'to_location': cells[target]['code'],
+                'travel_saving': round(2 * lines * (cells[current]['distance'] - cells[target]['distance']), 1)
+            })
+
+    saving = current_travel - proposed_travel
+    message = f'Запропоновано переміщень місць відбору: {len(moves)} з {len(skus)} SKU, ' \
+              f'шлях комплектувальника {current_travel:.0f} -> {proposed_travel:.0f} м'
+    print(message)
+
+    return {
+        'success': True,
+        'message': message,
+        'days': days,
+        'classes': {label: sum(1 for value in classes.values() if value == label) for label in 'ABC'},
+        'skus': [
+            {
+                'sku': sku,
+                'abc_class': classes.get(sku, 'C'),
+                'pick_lines': velocity.get(sku, (0, 0))[0],
+                'picked_boxes': velocity.get(sku, (0, 0))[1],
+                'location': cells[movable[sku]]['code'],
+                'proposed_location': cells[proposed[sku]]['code']
+            }
+            for sku in skus
+        ],
+        'moves': moves,
+        'current_travel': round(current_travel, 1),
+        'proposed_travel': round(proposed_travel, 1),
+        'travel_saving': round(saving, 1),
+        'travel_saving_percent': round(saving / current_travel * 100, 1) if current_travel else 0.0
+    }
+
+
+def apply_slotting(moves, skus=None):
+    """
+    Застосовує запропоновані переміщення одним пакетним UPDATE.
+
+    Переміщення пропускається, якщо призначення SKU вже змінилося або
+    цільова комірка залишається за SKU, який не переміщується.
+
+    Args:
+        moves: Переміщення з plan_slotting
+        skus: Застосувати лише для цих SKU (None — всі)
+
+    Returns:
+        dict: Кількість застосованих і пропущених переміщень
+    """
+    if skus is not None:
+        skus = set(skus)
+        moves = [move for move in moves if move['sku'] in skus]
+    if not moves:
+        return {'success': True, 'message': 'Немає переміщень для застосування', 'applied': 0, 'skipped': []}
+
+    moving = {move['sku'] for move in moves}
+    targets = {move['to_location_id'] for move in moves}
+    staying = {location_id for (location_id,) in db.session.query(SkuPickingLocation.picking_location_id).filter(
+        SkuPickingLocation.picking_location_id.in_(targets),
+        SkuPickingLocation.sku.notin_(moving)
+    )}
+
+    batch = [
+        {'move_sku': move['sku'], 'old_location_id': move['from_location_id'], 'new_location_id': move['to_location_id']}
+        for move in moves if move['to_location_id'] not in staying
+    ]
+    skipped = [move['sku'] for move in moves if move['to_location_id'] in staying]
+
+    applied = 0
+    if batch:
+        table = SkuPickingLocation.__table__
+        result = db.session.execute(
+            update(table).where(
+                table.c.sku == bindparam('move_sku'),
+                table.c.picking_location_id == bindparam('old_location_id')
+            ).values(picking_location_id=bindparam('new_location_id')),
+            batch
+        )
+        # Не всі драйвери повертають кількість рядків для пакетного UPDATE
+        applied = result.rowcount if db.session.get_bind().dialect.supports_sane_multi_rowcount else len(batch)
+    db.session.commit()
+
+    message = f'Застосовано переміщень місць відбору: {applied}, пропущено: {len(moves) - applied}'
+    print(message)
+    return {'success': True, 'message': message, 'applied': applied, 'skipped': skipped}
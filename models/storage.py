@@ -78,6 +78,9 @@ class SkuPickingLocation(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     sku = db.Column(db.String(50), unique=True, nullable=False)
     picking_location_id = db.Column(db.Integer, db.ForeignKey('storage_location.id'), nullable=False)
+    # Межі поповнення в ящиках (None — значення за замовчуванням з налаштувань)
+    min_quantity = db.Column(db.Integer, nullable=True)
+    max_quantity = db.Column(db.Integer, nullable=True)
     
     def __repr__(self):
         return f'<SkuPickingLocation {self.sku} -> {self.picking_location_id}>'
\ No newline at end of file
@@ -0,0 +1,242 @@
+"""
+Послідовність виконання переміщень для водіїв навантажувачів.
+
+Координати комірки беруться з StorageLocation (row_code, cell, level):
+ряди паралельні, проїзд між рядами — через торці (початок або кінець ряду),
+підйом на рівень додає фіксовану вартість. Для завдань будується матриця
+відстаней «місце вивантаження попереднього завдання → місце забору
+наступного», маршрут будується найближчим сусідом і покращується 2-opt.
+Для кількох водіїв загальний маршрут ділиться на послідовні частини
+приблизно однакової вартості, і кожна частина оптимізується окремо.
+
+2-opt обмежений кількістю перевірених пар (MAX_TWO_OPT_CHECKS), а готові
+маршрути кешуються за набором запитів, рядами складу і кількістю водіїв,
+тож повторне відкриття сторінки без змін у запитах маршрут не перераховує.
+"""
+import re
+import threading
+from array import array
+from collections import OrderedDict
+from extensions import db
+from sqlalchemy.orm import joinedload
+from models.pending_transfer import PendingTransferRequest
+from models.storage import StorageRow
+
+ROW_SPACING = 4.0   # Відстань між сусідніми рядами, м
+CELL_LENGTH = 1.2   # Довжина комірки вздовж ряду, м
+LEVEL_COST = 2.0    # Еквівалент відстані на один рівень підйому, м
+MAX_TWO_OPT_PASSES = 20
+MAX_TWO_OPT_CHECKS = 200000  # Максимум перевірених пар розворотів на один маршрут
+ROUTE_CACHE_SIZE = 32
+
+# Кеш маршрутів: (ID запитів, ряди, водії) -> [(водій, довжина, [ID запитів])]
+_route_cache = OrderedDict()
+_route_cache_lock = threading.Lock()
+
+
+class Point:
+    """Положення в складі: номер ряду, комірка, рівень"""
+
+    __slots__ = ('row', 'cell', 'level')
+
+    def __init__(self, row, cell, level):
+        self.row = row
+        self.cell = cell
+        self.level = level
+
+
+def _number(value):
+    digits = re.sub(r'\D', '', str(value or ''))
+    return int(digits) if digits else 0
+
+
+def location_point(location, row_index):
+    """Point для StorageLocation (row_index — {row_code: порядковий номер ряду})"""
+    if location is None:
+        return Point(0, 0, 1)
+    return Point(row_index.get(location.row_code, 0), _number(location.cell), _number(location.level) or 1)
+
+
+def travel_distance(a, b, row_length):
+    """Відстань між двома точками з урахуванням проїзду через торці рядів та підйому"""
+    if a.row == b.row:
+        horizontal = abs(a.cell - b.cell) * CELL_LENGTH
+    else:
+        # Переїзд в інший ряд — через ближчий торець
+        via_front = a.cell + b.cell
+        via_back = 2 * row_length - a.cell - b.cell
+        horizontal = min(via_front, via_back) * CELL_LENGTH + abs(a.row - b.row) * ROW_SPACING
+    return horizontal + abs(a.level - b.level) * LEVEL_COST
+
+
+def build_distance_matrix(pickups, drops, depot, row_length):
+    """
+    Матриця D[i][j] — шлях від вивантаження завдання i до забору завдання j.
+    Вузол 0 — стартова точка (depot), завдання нумеруються з 1.
+    """
+    ends = [depot] + drops
+    starts = [depot] + pickups
+    return [array('d', (travel_distance(end, start, row_length) for start in starts)) for end in ends]
+
+
+def route_cost(matrix, route):
+    """Вартість відкритого маршруту (без повернення на старт)"""
+    return sum(matrix[route[k]][route[k + 1]] for k in range(len(route) - 1))
+
+
+def nearest_neighbour(matrix, nodes, start=0):
+    """Маршрут найближчого сусіда від start через усі nodes"""
+    route = [start]
+    remaining = set(nodes)
+    current = start
+    while remaining:
+        row = matrix[current]
+        current = min(remaining, key=lambda node: (row[node], node))
+        remaining.remove(current)
+        route.append(current)
+    return route
+
+
+def two_opt(matrix, route, max_passes=MAX_TWO_OPT_PASSES, max_checks=MAX_TWO_OPT_CHECKS):
+    """
+    Покращення відкритого маршруту з фіксованим стартом розворотами відрізків.
+
+    Матриця несиметрична, тому вартість розвернутого відрізка береться
+    з префіксних сум ребер у зворотному напрямку. Після розвороту суми
+    перераховуються лише від його початку; після max_checks перевірених
+    пар повертається найкращий знайдений маршрут.
+    """
+    route = list(route)
+    n = len(route)
+    if n < 4:
+        return route
+
+    forward = array('d', [0.0]) * n
+    backward = array('d', [0.0]) * n
+
+    def refresh(start):
+        for k in range(max(start, 1), n):
+            forward[k] = forward[k - 1] + matrix[route[k - 1]][route[k]]
+            backward[k] = backward[k - 1] + matrix[route[k]][route[k - 1]]
+
+    refresh(1)
+    checks = 0
+    for _ in range(max_passes):
+        improved = False
+        for i in range(1, n - 1):
+            if checks >= max_checks:
+                return route
+            checks += n - i - 1
+            for j in range(i + 1, n):
+                before = route[i - 1]
+                after = route[j + 1] if j + 1 < n else None
+                old = matrix[before][route[i]] + (forward[j] - forward[i])
+                new = matrix[before][route[j]] + (backward[j] - backward[i])
+                if after is not None:
+                    old += matrix[route[j]][after]
+                    new += matrix[route[i]][after]
+                if new + 1e-9 < old:
+                    route[i:j + 1] = reversed(route[i:j + 1])
+                    refresh(i)
+                    improved = True
+        if not improved:
+            break
+    return route
+
+
+def _split(route, matrix, handling, drivers):
+    """Ділить маршрут (без старту) на drivers послідовних частин приблизно однакової вартості"""
+    tasks = route[1:]
+    if drivers <= 1 or len(tasks) <= 1:
+        return [tasks]
+
+    costs = []
+    previous = route[0]
+    for node in tasks:
+        costs.append(matrix[previous][node] + handling[node])
+        previous = node
+    total = sum(costs)
+
+    parts = [[] for _ in range(min(drivers, len(tasks)))]
+    accumulated = 0.0
+    index = 0
+    for node, cost in zip(tasks, costs):
+        # Переходимо до наступного водія, коли його частка вже набрана
+        if parts[index] and index < len(parts) - 1 and accumulated >= total * (index + 1) / len(parts):
+            index += 1
+        parts[index].append(node)
+        accumulated += cost
+    return [part for part in parts if part]
+
+
+def _build_routes(transfers, drivers, row_codes):
+    """Маршрути водіїв: [(номер водія, довжина, [індекси запитів з 1])]"""
+    row_index = {code: index for index, code in enumerate(row_codes)}
+
+    pickups = [location_point(transfer.from_location, row_index) for transfer in transfers]
+    drops = [location_point(transfer.to_location, row_index) for transfer in transfers]
+    row_length = max([point.cell for point in pickups + drops] + [1])
+    depot = Point(0, 0, 1)
+
+    matrix = build_distance_matrix(pickups, drops, depot, row_length)
+    # Вартість самого переміщення (забір → вивантаження) не залежить від порядку
+    handling = [0.0] + [travel_distance(p, d, row_length) for p, d in zip(pickups, drops)]
+
+    nodes = range(1, len(transfers) + 1)
+    route = two_opt(matrix, nearest_neighbour(matrix, nodes))
+
+    routes = []
+    for number, part in enumerate(_split(route, matrix, handling, drivers), start=1):
+        driver_route = two_opt(matrix, nearest_neighbour(matrix, part))
+        distance = route_cost(matrix, driver_route) + sum(handling[node] for node in part)
+        routes.append((number, round(distance, 1), driver_route[1:]))
+    return routes
+
+
+def sequence_transfers(transfers, drivers=1):
+    """
+    Впорядковує запити на переміщення в короткі маршрути для кількох водіїв.
+
+    Args:
+        transfers: Запити PendingTransferRequest з завантаженими from_location/to_location
+        drivers: Кількість водіїв
+
+    Returns:
+        list: Для кожного водія словник з маршрутом (transfers) та довжиною (distance)
+    """
+    drivers = max(int(drivers or 1), 1)
+    if not transfers:
+        return []
+
+    row_codes = tuple(sorted({code for (code,) in db.session.query(StorageRow.code)}))
+    transfers = sorted(transfers, key=lambda transfer: transfer.id)
+    # Локації запиту не змінюються, тож маршрут визначається набором запитів і рядами
+    key = (tuple(transfer.id for transfer in transfers), row_codes, drivers)
+    with _route_cache_lock:
+        cached = _route_cache.get(key)
+        if cached is not None:
+            _route_cache.move_to_end(key)
+    if cached is None:
+        cached = _build_routes(transfers, drivers, row_codes)
+        with _route_cache_lock:
+            _route_cache[key] = cached
+            while len(_route_cache) > ROUTE_CACHE_SIZE:
+                _route_cache.popitem(last=False)
+
+    return [
+        {
+            'driver': number,
+            'distance': distance,
+            'transfers': [transfers[node - 1] for node in nodes]
+        }
+        for number, distance, nodes in cached
+    ]
+
+
+def get_transfer_routes(drivers=1):
+    """Маршрути для всіх незавершених переміщень (локації завантажуються одним запитом)"""
+    transfers = PendingTransferRequest.query.options(
+        joinedload(PendingTransferRequest.from_location),
+        joinedload(PendingTransferRequest.to_location)
+    ).filter_by(confirmed=False).order_by(PendingTransferRequest.id).all()
+    return sequence_transfers(transfers, drivers)
@@ -31,6 +31,7 @@ def create_customer_order():
             new_order = Order(
                 order_type='customer',
                 customer_id=form.customer_id.data,
+                priority=form.priority.data or 0,
                 status='created',
                 created_by=current_user.id,
                 created_at=datetime.now()
@@ -113,6 +114,33 @@ def process_customer_order(order_id):
     
     return redirect(url_for('customer_orders.customer_order_detail', order_id=order.id))
 
+@customer_orders_bp.route('/customer-orders/release-wave', methods=['POST'])
+@login_required
+@position_required(ORDER_ACCESS_POSITIONS)
+def release_customer_order_wave():
+    """Обробляє хвилю замовлень зі статусом 'created' за один прохід"""
+    from models.order_wave import get_wave_candidates, release_wave
+
+    if request.is_json:
+        data = request.get_json() or {}
+        order_ids = data.get('order_ids')
+        limit = data.get('limit')
+    else:
+        order_ids = request.form.getlist('order_ids', type=int)
+        limit = request.form.get('limit', type=int)
+
+    try:
+        orders = get_wave_candidates(order_ids=order_ids or None, limit=limit or None)
+        result = release_wave(orders)
+    except Exception as e:
+        result = {'success': False, 'message': f'Непередбачена помилка: {str(e)}'}
+
+    if request.is_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify(result)
+
+    flash(result['message'], 'success' if result['success'] else 'warning')
+    return redirect(url_for('customer_orders.customer_order_list'))
+
 @customer_orders_bp.route('/customer-orders/<int:order_id>/complete', methods=['POST'])
 @login_required
 @position_required(ORDER_ACCESS_POSITIONS)
@@ -1,13 +1,17 @@
 from flask import Blueprint, render_template, jsonify, request, send_file
+from flask_login import login_required
 from sqlalchemy import func, text
 from models import ReceivedInventory, StorageLocation
-from extensions import db
+from extensions import db, position_required
 import pandas as pd
 import io
 from datetime import datetime
 
 inventory_report_bp = Blueprint('inventory_report', __name__)
 
+# Звірку та виправлення Inventory виконують лише керівники (та адміністратори)
+RECONCILE_ACCESS_POSITIONS = ['Керівник']
+
 @inventory_report_bp.route('/inventory/report', methods=['GET'])
 def inventory_report():
     # Query to aggregate inventory data from received_inventory table
@@ -81,4 +85,32 @@ def export_inventory_report():
         as_attachment=True,
         download_name=filename,
         mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
\ No newline at end of file
+    )
+
+
+@inventory_report_bp.route('/inventory/reconcile', methods=['POST'])
+@login_required
+@position_required(RECONCILE_ACCESS_POSITIONS)
+def inventory_reconcile():
+    """Звіряє Inventory з прийнятими палетами і за потреби виправляє розбіжності"""
+    from models.inventory_reconciliation import reconcile_inventory
+
+    data = request.get_json(silent=True) or request.form
+    apply = str(data.get('apply', '')).lower() in ('1', 'true', 'yes', 'on')
+    try:
+        chunk_size = int(data.get('chunk_size') or 1000)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Невірний розмір порції'}), 400
+
+    try:
+        result = reconcile_inventory(
+            sku_from=data.get('sku_from') or None,
+            sku_to=data.get('sku_to') or None,
+            apply=apply,
+            chunk_size=chunk_size
+        )
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': f'Помилка звірки: {str(e)}'}), 500
+
+    return jsonify(result)
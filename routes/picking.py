@@ -1,10 +1,18 @@
-from flask import Blueprint, request, jsonify
+import json
+import time
+from flask import Blueprint, Response, request, jsonify, stream_with_context
 from models.order import Order, OrderItem
-from models.order_lot import OrderLot
+from models.order_lot import OrderLot, OrderLotProgress, ensure_lot_progress
+from models.storage import StorageLocation, SkuPickingLocation
+from models.pick_walk import PickWalkRank, ensure_walk_ranks, walk_route_length, max_cell_number
 from models.picking import perform_picking, OrderPickingItem
+from models.pick_task import close_lot_tasks
+from models.lot_feed import available_lots_page, page_size, lot_feed, FEED_HEARTBEAT, FEED_STREAM_SECONDS
+from models.cluster_picking import claim_cluster_lots, get_cluster_pick_list, confirm_cluster_picks, release_cluster
 from extensions import db
+from sqlalchemy import and_, case
 from datetime import datetime
-from flask_login import current_user
+from flask_login import current_user, login_required
 from models import User
 
 picking_bp = Blueprint('picking', __name__, url_prefix='/tsd-emulator/picking')
@@ -27,13 +35,7 @@ def get_order_details():
     if lot.status == 'packed':
         return jsonify({'success': False, 'message': 'Цей лот вже зібрано'})
     
-    # Знаходимо всі товари з цим лотом
-    order_items = OrderItem.query.filter_by(lot_number=lot_number).all()
-    
-    if not order_items:
-        return jsonify({'success': False, 'message': 'Товари лота не знайдено'})
-    
-    order = order_items[0].order  # всі артикулі у лоті належать одному замовленню
+    order = lot.order  # всі артикулі у лоті належать одному замовленню
     
     if not order:
         return jsonify({'success': False, 'message': 'Замовлення не знайдено'})
@@ -62,35 +64,60 @@ def get_order_details():
     # Змінюємо статус лота на 'start' при початку відбору (F1)
     if lot.status == 'wait':
         lot.status = 'start'
-        db.session.commit()
         order.started_by_user_id = current_user.id
         db.session.commit()
     
-    # Імпортуємо SkuPickingLocation для отримання інформації про місце відбору
-    from models.storage import SkuPickingLocation
+    # Відібрана кількість — з прогресу лота, без перерахунку історії відбору
+    if ensure_lot_progress(lot):
+        db.session.commit()
+    ensure_walk_ranks()
+
+    # Товари лота з місцем відбору, рангом обходу та прогресом одним запитом,
+    # у порядку обходу складу (товари без місця відбору — в кінці)
+    rows = db.session.query(
+        OrderItem,
+        StorageLocation.location_code,
+        PickWalkRank.walk_rank,
+        PickWalkRank.row_number,
+        PickWalkRank.cell_number,
+        OrderLotProgress.picked_boxes,
+        max_cell_number()
+    ).outerjoin(
+        SkuPickingLocation, SkuPickingLocation.sku == OrderItem.sku
+    ).outerjoin(
+        StorageLocation, StorageLocation.id == SkuPickingLocation.picking_location_id
+    ).outerjoin(
+        PickWalkRank, PickWalkRank.location_id == StorageLocation.id
+    ).outerjoin(
+        OrderLotProgress, and_(OrderLotProgress.order_lot_id == lot.id, OrderLotProgress.sku == OrderItem.sku)
+    ).filter(
+        OrderItem.lot_number == lot_number
+    ).order_by(
+        case((PickWalkRank.walk_rank.is_(None), 1), else_=0), PickWalkRank.walk_rank, OrderItem.id
+    ).all()
     
+    if not rows:
+        return jsonify({'success': False, 'message': 'Товари лота не знайдено'})
+
     # Формуємо відповідь по кожному артикулу в цьому лоті
     items_data = []
-    for item in order_items:
-        picked_quantity = db.session.query(
-            db.func.sum(OrderPickingItem.picked_box_count)
-        ).filter(
-            OrderPickingItem.order_id == order.id,
-            OrderPickingItem.sku == item.sku,
-            OrderPickingItem.lot_number == lot_number
-        ).scalar() or 0
-        
-        # Отримуємо інформацію про місце відбору для цього SKU
-        location_entry = SkuPickingLocation.query.filter_by(sku=item.sku).first()
-        location_name = location_entry.location.location_code if location_entry else "Не вказано"
-
+    for sequence, (item, location_code, walk_rank, _, _, picked_boxes, _) in enumerate(rows, start=1):
         items_data.append({
             'sku': item.sku,
             'product_name': item.product_name,
             'quantity': item.quantity,
-            'picked_quantity': picked_quantity,
-            'location': location_name
+            'picked_quantity': picked_boxes or 0,
+            'location': location_code or "Не вказано",
+            'walk_sequence': sequence
         })
+
+    # Довжина маршруту в порядку обходу і в порядку позицій замовлення — для оцінки економії
+    row_length = rows[0][6]
+    ranked = [row for row in rows if row[2] is not None]
+    route_length = walk_route_length([(row[3], row[4]) for row in ranked], row_length)
+    unsorted_route_length = walk_route_length(
+        [(row[3], row[4]) for row in sorted(ranked, key=lambda row: row[0].id)], row_length
+    )
     
     # Повертаємо весь лот
     return jsonify({
@@ -98,14 +125,15 @@ def get_order_details():
         'order_id': order.id,
         'order_number': order.order_number,
         'lot_number': lot_number,
-        'items': items_data
+        'items': items_data,
+        'route_length': round(route_length, 1),
+        'unsorted_route_length': round(unsorted_route_length, 1)
     })
 
 
 @picking_bp.route('/perform', methods=['POST'])
 def perform_picking_route():
     """Виконати відбір товару"""
-    from models.order_lot import OrderLot
     data = request.json
     order_id = data.get('order_id')
     sku = data.get('sku')
@@ -126,42 +154,7 @@ def perform_picking_route():
         print(f"Результат відбору: {result}")
         
         if result['success']:
-            # Перевіряємо, чи запис був створений в базі даних
-            from models.picking import OrderPickingItem
-            verification = db.session.query(db.func.sum(OrderPickingItem.picked_box_count)).filter(
-                OrderPickingItem.order_id == order_id,
-                OrderPickingItem.sku == sku,
-                OrderPickingItem.lot_number == lot_number
-            ).scalar() or 0
-            
-            print(f"Перевірка після відбору: для SKU {sku} в лоті {lot_number} відібрано {verification} ящиків")
-            
-            # Якщо це останній товар у лоті, оновлюємо статус лота на 'packed'
-            if result.get('is_last_item', False):
-                lot = OrderLot.query.filter_by(lot_number=lot_number).first()
-                if lot:
-                    print(f"Останній товар у лоті {lot_number}, оновлюємо статус на 'packed'")
-                    # Зберігаємо додаткову інформацію про зібраний лот
-                    lot.status = 'packed'
-                    lot.completed_at = datetime.utcnow()
-                    lot.picker_id = current_user.id
-                    
-                    # Отримуємо кількість зібраних ящиків та загальну вагу
-                    picking_items = OrderPickingItem.query.filter_by(lot_number=lot_number).all()
-                    lot.box_count = sum(item.picked_box_count for item in picking_items)
-                    lot.total_weight = sum(item.calculated_weight for item in picking_items)
-                    
-                    db.session.commit()
-                    print(f"Лот {lot_number} успішно оновлено, box_count={lot.box_count}, total_weight={lot.total_weight}")
-                    
-                    # Перевіряємо, чи всі лоти замовлення мають статус 'packed'
-                    order = lot.order
-                    all_lots = OrderLot.query.filter_by(order_id=order.id).all()
-                    if all(l.status == 'packed' for l in all_lots):
-                        order.status = 'packed'
-                        db.session.commit()
-                        print(f"Всі лоти замовлення {order.id} зібрані, статус замовлення оновлено на 'packed'")
-            
+            # Статус лота, його підсумки та статус замовлення оновлює perform_picking в тій самій транзакції
             return jsonify({
                 'success': True,
                 'message': result['message'],
@@ -181,33 +174,91 @@ def perform_picking_route():
             'message': f'Помилка: {str(e)}'
         })
 
+@picking_bp.route('/cluster/claim', methods=['POST'])
+@login_required
+def claim_cluster_route():
+    """Забрати лоти зі статусом 'wait' у кластер комплектувальника"""
+    data = request.get_json(silent=True) or {}
+    return jsonify(claim_cluster_lots(current_user.id, data.get('size')))
+
+
+@picking_bp.route('/cluster', methods=['GET'])
+@login_required
+def cluster_pick_list_route():
+    """Об'єднаний лист відбору кластера в порядку обходу складу"""
+    return jsonify(get_cluster_pick_list(current_user.id))
+
+
+@picking_bp.route('/cluster/confirm', methods=['POST'])
+@login_required
+def confirm_cluster_route():
+    """Підтвердити пакет сканувань кластера"""
+    data = request.get_json(silent=True) or {}
+    picks = data.get('picks')
+    if picks is None and data.get('sku'):
+        picks = [data]
+    if not picks:
+        return jsonify({'success': False, 'message': 'Не вказані всі необхідні параметри'})
+
+    try:
+        return jsonify(confirm_cluster_picks(current_user.id, picks))
+    except Exception as e:
+        db.session.rollback()
+        print(f"Помилка при відборі кластера: {str(e)}")
+        import traceback
+        traceback.print_exc()
+        return jsonify({'success': False, 'message': f'Помилка: {str(e)}'})
+
+
+@picking_bp.route('/cluster/release', methods=['POST'])
+@login_required
+def release_cluster_route():
+    """Повернути в чергу лоти кластера, з яких ще нічого не відібрано"""
+    return jsonify(release_cluster(current_user.id))
+
 @picking_bp.route('/available-lots', methods=['GET'])
 def get_available_lots():
-    """Повертає доступні лоти з оброблюваних замовлень"""
-    from models import OrderItem, Order
-    from models.order_lot import OrderLot
-    from sqlalchemy.orm import joinedload
-
-    # Знаходимо всі лоти зі статусом 'wait' з замовлень у статусі "processing" або "assembling"
-    lots = OrderLot.query.join(Order).filter(
-        OrderLot.status == 'wait',
-        Order.status.in_(["processing", "assembling"])
-    ).all()
+    """
+    Повертає сторінку доступних лотів з оброблюваних замовлень.
 
-    lots_data = []
-    for lot in lots:
-        # Знаходимо всі товари для цього лота
-        items = OrderItem.query.filter_by(lot_number=lot.lot_number).all()
-        sku_list = [item.sku for item in items]
-        
-        lots_data.append({
-            'lot_number': lot.lot_number,
-            'order_number': lot.order.order_number,
-            'status': lot.status,
-            'sku_list': sku_list
-        })
+    Параметри: after — курсор (next_after попередньої сторінки), limit — розмір сторінки.
+    """
+    page = available_lots_page(request.args.get('after', type=int), page_size(request.args.get('limit')))
+    return jsonify({'success': True, **page})
 
-    return jsonify({'success': True, 'lots': lots_data})
+@picking_bp.route('/available-lots/stream', methods=['GET'])
+def stream_available_lots():
+    """
+    Server-Sent Events: надсилає лоти, створені після курсора after
+    (або Last-Event-ID при перепідключенні), щойно транзакцію зафіксовано.
+    """
+    after_id = request.headers.get('Last-Event-ID', type=int) or request.args.get('after', type=int)
+
+    def events(after_id):
+        if after_id is None:
+            after_id = available_lots_page(limit=1)['last_id']
+        db.session.remove()
+        # Потік короткий, щоб не тримати робочий процес; EventSource перепідключається
+        # з Last-Event-ID (або з тим самим after, якщо лотів не було)
+        yield "retry: 1000\n\n"
+
+        deadline = time.monotonic() + FEED_STREAM_SECONDS
+        version = lot_feed.version
+        while time.monotonic() < deadline:
+            page = lot_feed.lots_after(after_id)
+            # З'єднання з базою не утримується, поки підписник чекає
+            db.session.remove()
+            for lot in page['lots']:
+                after_id = lot['lot_id']
+                yield f"id: {after_id}\nevent: lot\ndata: {json.dumps(lot, ensure_ascii=False)}\n\n"
+            if page['has_more']:
+                continue
+            if not page['lots']:
+                yield ": keep-alive\n\n"
+            version = lot_feed.wait(version, min(FEED_HEARTBEAT, max(deadline - time.monotonic(), 0)))
+
+    return Response(stream_with_context(events(after_id)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @picking_bp.route('/complete-lot', methods=['POST'])
 def complete_lot():
@@ -224,55 +275,19 @@ def complete_lot():
     if lot.status == 'packed':
         return jsonify({'success': True})
 
-    # Перевірка, чи всі товари з лота зібрані
-    order_items = OrderItem.query.filter_by(order_id=lot.order_id, lot_number=lot_number).all()
-    all_picked = True
-    total_weight = 0
-    total_boxes = 0
-
-    # Виводимо детальну інформацію для діагностики
-    print(f"Перевірка лота {lot_number} для замовлення {lot.order_id}")
-    print(f"Знайдено {len(order_items)} товарів у лоті")
-    
-    # Перевіряємо всі записи відбору для цього лота
-    all_picking_items = OrderPickingItem.query.filter_by(
-        order_id=lot.order_id,
-        lot_number=lot_number
-    ).all()
-    
-    print(f"Знайдено {len(all_picking_items)} записів відбору для лота {lot_number}")
-    
-    for picking_item in all_picking_items:
-        print(f"Запис відбору: SKU={picking_item.sku}, кількість={picking_item.picked_box_count}")
-    
-    for item in order_items:
-        # Отримуємо суму відібраних товарів для цього SKU в цьому лоті
-        picked_count = db.session.query(db.func.sum(OrderPickingItem.picked_box_count)).filter(
-            OrderPickingItem.order_id == lot.order_id,
-            OrderPickingItem.sku == item.sku,
-            OrderPickingItem.lot_number == lot_number
-        ).scalar() or 0
-        
-        print(f"SKU: {item.sku}, Потрібно: {item.quantity}, Відібрано: {picked_count}")
-
-        # Округляємо значення для порівняння, щоб уникнути проблем з плаваючою точкою
-        if round(picked_count) < round(item.quantity):
-            all_picked = False
-            print(f"Товар {item.sku} не повністю відібраний: {picked_count} < {item.quantity}")
-            break
-
-        total_boxes += picked_count
-
-        weight = db.session.query(db.func.sum(OrderPickingItem.calculated_weight)).filter(
-            OrderPickingItem.order_id == lot.order_id,
-            OrderPickingItem.sku == item.sku,
-            OrderPickingItem.lot_number == lot_number
-        ).scalar() or 0
-        total_weight += weight
+    # Перевірка, чи всі товари з лота зібрані — за лічильником незібраних позицій
+    if ensure_lot_progress(lot):
+        db.session.commit()
+    print(f"Перевірка лота {lot_number} для замовлення {lot.order_id}: незібраних позицій {lot.remaining_lines}")
 
-    if not all_picked:
+    if lot.remaining_lines:
         return jsonify({'success': False, 'message': 'Не всі товари з лота зібрані'})
 
+    total_boxes, total_weight = db.session.query(
+        db.func.coalesce(db.func.sum(OrderLotProgress.picked_boxes), 0),
+        db.func.coalesce(db.func.sum(OrderLotProgress.picked_weight), 0)
+    ).filter(OrderLotProgress.order_lot_id == lot.id).one()
+
     # Оновлюємо статус
     lot.status = 'packed'
     lot.completed_at = datetime.utcnow()
@@ -289,6 +304,8 @@ def complete_lot():
         
     lot.box_count = total_boxes
     lot.total_weight = total_weight
+    # Невикористані завдання лота звільняють розподілені ящики
+    close_lot_tasks([lot.id])
 
     db.session.add(lot)
     db.session.commit()
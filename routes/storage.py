@@ -350,4 +350,30 @@ def sku_picking_location_delete(id):
     db.session.delete(sku_location)
     db.session.commit()
     flash('Призначення місця відбору SKU успішно видалено', 'success')
-    return redirect(url_for('storage.sku_picking_location_list'))
\ No newline at end of file
+    return redirect(url_for('storage.sku_picking_location_list'))
+
+@storage_bp.route('/sku-picking-locations/slotting')
+@login_required
+def sku_slotting_plan():
+    from models.slotting import plan_slotting, DEFAULT_HISTORY_DAYS
+
+    days = request.args.get('days', DEFAULT_HISTORY_DAYS, type=int)
+    plan = plan_slotting(days=max(days or DEFAULT_HISTORY_DAYS, 1))
+    return render_template('storage/sku_slotting.html', plan=plan, title='Slotting by Pick Velocity')
+
+@storage_bp.route('/sku-picking-locations/slotting/apply', methods=['POST'])
+@login_required
+def sku_slotting_apply():
+    from models.slotting import plan_slotting, apply_slotting, DEFAULT_HISTORY_DAYS
+
+    days = request.form.get('days', DEFAULT_HISTORY_DAYS, type=int)
+    skus = request.form.getlist('sku')
+    if not skus:
+        flash('Не вибрано жодного переміщення', 'warning')
+        return redirect(url_for('storage.sku_slotting_plan', days=days))
+
+    # План перераховується, щоб застосувати переміщення до поточних призначень
+    plan = plan_slotting(days=max(days or DEFAULT_HISTORY_DAYS, 1))
+    result = apply_slotting(plan['moves'], skus=skus)
+    flash(result['message'], 'success' if result['applied'] else 'warning')
+    return redirect(url_for('storage.sku_slotting_plan', days=days))
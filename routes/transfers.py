@@ -1,6 +1,7 @@
-from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify
 from flask_login import login_required
-from models.pending_transfer import PendingTransferRequest
+from sqlalchemy.orm import joinedload
+from models.pending_transfer import PendingTransferRequest, confirm_transfers
 from models.storage import StorageLocation
 from extensions import db
 from utils.decorators import position_required
@@ -16,7 +17,10 @@ transfers_bp = Blueprint('transfers', __name__)
 def pending_transfers_list():
     """Відображає список незавершених запитів на переміщення"""
     # Отримуємо всі незавершені запити на переміщення
-    pending_transfers = PendingTransferRequest.query.filter_by(confirmed=False).all()
+    pending_transfers = PendingTransferRequest.query.options(
+        joinedload(PendingTransferRequest.from_location),
+        joinedload(PendingTransferRequest.to_location)
+    ).filter_by(confirmed=False).order_by(PendingTransferRequest.id).all()
     
     # Групуємо запити за SKU для зручності
     grouped_transfers = {}
@@ -25,9 +29,16 @@ def pending_transfers_list():
             grouped_transfers[transfer.sku] = []
         grouped_transfers[transfer.sku].append(transfer)
     
+    # Маршрути для водіїв (кількість водіїв — параметр drivers)
+    from models.transfer_sequencing import sequence_transfers
+    drivers = max(request.args.get('drivers', 1, type=int) or 1, 1)
+    routes = sequence_transfers(pending_transfers, drivers)
+    
     return render_template('transfers/pending_transfers.html', 
                            transfers=pending_transfers,
-                           grouped_transfers=grouped_transfers)
+                           grouped_transfers=grouped_transfers,
+                           routes=routes,
+                           drivers=drivers)
 
 @transfers_bp.route('/pending-transfers/confirm/<int:transfer_id>', methods=['POST'])
 @login_required
@@ -60,17 +71,13 @@ def confirm_transfer(transfer_id):
 @position_required(TRANSFER_ACCESS_POSITIONS)
 def confirm_all_transfers_for_sku(sku):
     """Підтверджує всі запити на переміщення для конкретного SKU"""
-    transfers = PendingTransferRequest.query.filter_by(sku=sku, confirmed=False).all()
-
-    success_count = 0
-    error_count = 0
+    transfer_ids = [transfer_id for (transfer_id,) in db.session.query(PendingTransferRequest.id).filter_by(
+        sku=sku, confirmed=False
+    )]
 
-    for transfer in transfers:
-        try:
-            transfer.confirm_transfer()
-            success_count += 1
-        except Exception:
-            error_count += 1
+    result = confirm_transfers(transfer_ids=transfer_ids)
+    success_count = result['confirmed']
+    error_count = result['failed']
 
     message_success = f'Успішно підтверджено {success_count} переміщень для товару {sku}'
     message_error = f'Не вдалося підтвердити {error_count} переміщень для товару {sku}'
@@ -86,4 +93,113 @@ def confirm_all_transfers_for_sku(sku):
     if error_count > 0:
         flash(message_error, 'warning')
 
-    return redirect(url_for('transfers.pending_transfers_list'))
\ No newline at end of file
+    return redirect(url_for('transfers.pending_transfers_list'))
+
+@transfers_bp.route('/pending-transfers/confirm-bulk', methods=['POST'])
+@login_required
+@position_required(TRANSFER_ACCESS_POSITIONS)
+def confirm_transfers_bulk():
+    """Підтверджує вибрані запити на переміщення (за ID або SSCC) однією транзакцією"""
+    if request.is_json:
+        data = request.get_json() or {}
+        transfer_ids = data.get('transfer_ids') or []
+        ssccs = data.get('ssccs') or []
+    else:
+        transfer_ids = request.form.getlist('transfer_ids', type=int)
+        ssccs = request.form.getlist('ssccs')
+
+    try:
+        result = confirm_transfers(transfer_ids=transfer_ids, ssccs=ssccs)
+    except (TypeError, ValueError) as e:
+        result = {'success': False, 'message': f'Невірні дані запиту: {str(e)}', 'results': []}
+
+    if request.is_json or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+        return jsonify(result)
+
+    flash(result['message'], 'success' if result['success'] else 'warning')
+    for item in result['results']:
+        if not item['success']:
+            flash(f"{item.get('sscc') or item.get('transfer_id')}: {item['message']}", 'danger')
+    return redirect(url_for('transfers.pending_transfers_list'))
+
+@transfers_bp.route('/replenishment/plan', methods=['GET', 'POST'])
+@login_required
+@position_required(TRANSFER_ACCESS_POSITIONS)
+def replenishment_plan():
+    """План поповнення місць відбору (GET — пробний запуск, POST — створення запитів)"""
+    from models.replenishment import plan_replenishment
+
+    try:
+        result = plan_replenishment(dry_run=request.method == 'GET')
+    except Exception as e:
+        db.session.rollback()
+        return jsonify(success=False, message=f'Помилка планування поповнення: {str(e)}'), 500
+
+    return jsonify(result)
+
+
+# API для ТЗД: список незавершених переміщень та пакетне підтвердження за SSCC
+tsd_transfers_bp = Blueprint('tsd_transfers', __name__, url_prefix='/tsd-emulator/api/transfers')
+
+@tsd_transfers_bp.route('/pending', methods=['GET'])
+@login_required
+@position_required(TRANSFER_ACCESS_POSITIONS)
+def tsd_pending_transfers():
+    """Незавершені переміщення для ТЗД"""
+    transfers = PendingTransferRequest.query.options(
+        joinedload(PendingTransferRequest.from_location),
+        joinedload(PendingTransferRequest.to_location)
+    ).filter_by(confirmed=False).order_by(PendingTransferRequest.id).all()
+    return jsonify({
+        'success': True,
+        'transfers': [{
+            'id': transfer.id,
+            'sku': transfer.sku,
+            'sscc': transfer.sscc,
+            'from_location': transfer.from_location.location_code if transfer.from_location else None,
+            'to_location': transfer.to_location.location_code if transfer.to_location else None,
+            'box_count': transfer.box_count
+        } for transfer in transfers]
+    })
+
+@tsd_transfers_bp.route('/route', methods=['GET'])
+@login_required
+@position_required(TRANSFER_ACCESS_POSITIONS)
+def tsd_transfer_route():
+    """Список завдань водія в порядку оптимального маршруту"""
+    from models.transfer_sequencing import get_transfer_routes
+
+    drivers = max(request.args.get('drivers', 1, type=int) or 1, 1)
+    driver = request.args.get('driver', 1, type=int)
+    routes = get_transfer_routes(drivers)
+    route = next((r for r in routes if r['driver'] == driver), None)
+    if route is None:
+        return jsonify({'success': True, 'driver': driver, 'drivers': drivers, 'distance': 0, 'tasks': []})
+
+    return jsonify({
+        'success': True,
+        'driver': driver,
+        'drivers': drivers,
+        'distance': route['distance'],
+        'tasks': [{
+            'sequence': sequence,
+            'id': transfer.id,
+            'sku': transfer.sku,
+            'sscc': transfer.sscc,
+            'from_location': transfer.from_location.location_code if transfer.from_location else None,
+            'to_location': transfer.to_location.location_code if transfer.to_location else None,
+            'box_count': transfer.box_count
+        } for sequence, transfer in enumerate(route['transfers'], start=1)]
+    })
+
+@tsd_transfers_bp.route('/confirm', methods=['POST'])
+@login_required
+@position_required(TRANSFER_ACCESS_POSITIONS)
+def tsd_confirm_transfers():
+    """Підтверджує відскановані палети (SSCC) або ID переміщень однією транзакцією"""
+    data = request.get_json() or {}
+    try:
+        result = confirm_transfers(transfer_ids=data.get('transfer_ids'), ssccs=data.get('ssccs'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': f'Невірні дані запиту: {str(e)}', 'results': []}), 400
+    return jsonify(result)
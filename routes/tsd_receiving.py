@@ -1,15 +1,22 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, request, jsonify, make_response
 from flask_login import login_required, current_user
 from extensions import db, position_required
-from models import Order, OrderItem, LogisticsItemData, StorageLocation, ReceivedInventory
-# Видалено імпорт SSCCBarcode
-from datetime import datetime, timedelta
+from models import Order, OrderItem, LogisticsItemData, ReceivedInventory, SSCCBarcode
+from models.receiving_staging import ReceivingScan, stage_scan, get_receiving_scans, get_receiving_progress
+from sqlalchemy import func, and_
+from datetime import datetime
+import hashlib
+import time
 
 # Define position access rights for TSD receiving
 RECEIVING_ACCESS_POSITIONS = ['Приймальник', 'Оператор', 'Начальник зміни', 'Керівник']
 
 tsd_receiving_bp = Blueprint('tsd_receiving', __name__, url_prefix='/tsd-emulator/api')
 
+# Очікування розміщення палети фоновим обробником (long polling)
+MAX_SCAN_WAIT_SECONDS = 25
+SCAN_POLL_INTERVAL = 0.5
+
 @tsd_receiving_bp.route('/available-orders', methods=['GET'])
 @login_required
 @position_required(RECEIVING_ACCESS_POSITIONS)
@@ -113,212 +120,137 @@ def get_order_items():
             'message': 'Номер накладної не вказано'
         }), 400
     
-    # Find order items by invoice number
-    order_items = OrderItem.query.filter_by(invoice_number=invoice_number).all()
-    
-    if not order_items:
+    # Версія даних накладної: остання прийнята палета і позиції замовлення (одним запитом)
+    last_received_at, received_count, items_count, items_quantity = db.session.query(
+        db.session.query(func.max(ReceivedInventory.received_at)).filter(
+            ReceivedInventory.invoice_number == invoice_number).scalar_subquery(),
+        db.session.query(func.count(ReceivedInventory.id)).filter(
+            ReceivedInventory.invoice_number == invoice_number).scalar_subquery(),
+        db.session.query(func.count(OrderItem.id)).filter(
+            OrderItem.invoice_number == invoice_number).scalar_subquery(),
+        db.session.query(func.coalesce(func.sum(OrderItem.quantity), 0)).filter(
+            OrderItem.invoice_number == invoice_number).scalar_subquery()
+    ).one()
+
+    if not items_count:
         return jsonify({
             'success': False,
             'message': f'Товари для накладної {invoice_number} не знайдено'
         }), 404
-    
-    items_data = []
-    for item in order_items:
-        # Отримати логістичні дані для SKU
-        logistics_data = LogisticsItemData.query.filter_by(sku=item.sku).first()
 
-        # Отримати останній запис ReceivedInventory для цього SKU і накладної
-        received_entry = ReceivedInventory.query.filter_by(
-            invoice_number=invoice_number,
-            sku=item.sku
-        ).order_by(ReceivedInventory.received_at.desc()).first()
+    etag = hashlib.md5(
+        f'{invoice_number}:{last_received_at}:{received_count}:{items_count}:{items_quantity}'.encode()
+    ).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+        response.set_etag(etag)
+        return response
 
-        # Отримати SSCC і вагу
-        sscc_code = received_entry.sscc if received_entry else None
-        gross_weight = 0
-        if sscc_code:
-            from models import SSCCBarcode  # імпортуй, якщо ще не імпортовано
-            sscc_info = SSCCBarcode.query.filter_by(sscc=sscc_code).first()
-            if sscc_info:
-                gross_weight = sscc_info.gross_weight
+    # Остання прийнята палета кожного SKU накладної
+    latest = db.session.query(
+        ReceivedInventory.sku.label('sku'),
+        ReceivedInventory.sscc.label('sscc'),
+        func.row_number().over(
+            partition_by=ReceivedInventory.sku,
+            order_by=(ReceivedInventory.received_at.desc(), ReceivedInventory.id.desc())
+        ).label('position')
+    ).filter(ReceivedInventory.invoice_number == invoice_number).subquery()
 
-        # Додати у відповідь
+    rows = db.session.query(
+        OrderItem,
+        LogisticsItemData.packaging_unit_type,
+        LogisticsItemData.count,
+        SSCCBarcode.gross_weight
+    ).outerjoin(
+        LogisticsItemData, LogisticsItemData.sku == OrderItem.sku
+    ).outerjoin(
+        latest, and_(latest.c.sku == OrderItem.sku, latest.c.position == 1)
+    ).outerjoin(
+        SSCCBarcode, SSCCBarcode.sscc == latest.c.sscc
+    ).filter(
+        OrderItem.invoice_number == invoice_number
+    ).order_by(OrderItem.id).all()
+
+    items_data = []
+    for item, packaging_unit_type, count, gross_weight in rows:
         items_data.append({
             'id': item.id,
             'sku': item.sku,
             'product_name': item.product_name,
             'quantity': item.quantity,
             'unit_price': item.unit_price,
-            'packaging_unit_type': logistics_data.packaging_unit_type if logistics_data else 'КГ',
-            'box_weight': gross_weight,
-            'count': logistics_data.count if logistics_data else 1
+            'packaging_unit_type': packaging_unit_type or 'КГ',
+            'box_weight': gross_weight or 0,
+            'count': count if count is not None else 1
         })
-    
-    return jsonify({
+
+    response = jsonify({
         'success': True,
         'items': items_data
     })
+    response.set_etag(etag)
+    # Термінал щоразу перевіряє актуальність через If-None-Match
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
 
 @tsd_receiving_bp.route('/save-receiving', methods=['POST'])
 @login_required
 @position_required(RECEIVING_ACCESS_POSITIONS)
 def save_receiving():
-    """Save receiving data for a pallet"""
-    data = request.get_json()
-    
-    if not data or 'sscc' not in data or 'item_id' not in data:
-        return jsonify({
-            'success': False,
-            'message': 'Неповні дані'
-        }), 400
-    
-    # Extract data
-    sscc = data['sscc']
-    item_id = data['item_id']
-    box_count = data.get('box_count', 0)
-    gross_weight = data.get('gross_weight', 0)
-    pallet_weight = data.get('pallet_weight', 0)
-    net_weight = data.get('net_weight', 0)
-    storage_location_code = data.get('storage_location', '')
-    
-    # Get the order item
-    order_item = OrderItem.query.get(item_id)
-    if not order_item:
-        return jsonify({
-            'success': False,
-            'message': f'Товар з ID {item_id} не знайдено'
-        }), 404
-    
-    try:
-        # If storage location not provided, determine it using the fixed picking location logic
-        if not storage_location_code:
-            # Оновлена логіка розміщення палет відповідно до нових вимог
-            from models.storage import SkuPickingLocation, StorageRow
-            sku_picking_location = SkuPickingLocation.query.filter_by(sku=order_item.sku).first()
-            
-            if sku_picking_location:
-                # Отримуємо призначене місце відбору
-                picking_location = StorageLocation.query.get(sku_picking_location.picking_location_id)
-                
-                if picking_location:
-                    # Перевіряємо, чи місце відбору вже зайняте
-                    has_items = ReceivedInventory.query.filter_by(storage_location_id=picking_location.id).first()
-                    
-                    # Якщо місце відбору порожнє - дозволяємо заселення
-                    if not has_items:
-                        storage_location_code = picking_location.location_code
-                        print(f"[+] Using empty picking location {storage_location_code} for SKU {order_item.sku}")
-                    else:
-                        # Якщо місце зайняте, шукаємо верхні рівні (level > '1') в тому ж ряду
-                        row_code = picking_location.row_code
-                        
-                        # Знаходимо доступну комірку на верхніх рівнях у тому ж ряду
-                        available_location = StorageLocation.query.filter(
-                            StorageLocation.row_code == row_code,
-                            StorageLocation.level > '1',  # Тільки верхні рівні
-                            ~StorageLocation.received_items.any()
-                        ).first()
-                        
-                        if available_location:
-                            storage_location_code = available_location.location_code
-                            print(f"[+] Using upper level location {storage_location_code} in same row as picking location for SKU {order_item.sku}")
-            else:
-                # Якщо для SKU не вказано місце відбору, заселяємо тільки на верхні рівні
-                # згідно температурного режиму
-                logistics_data = LogisticsItemData.query.filter_by(sku=order_item.sku).first()
-                temp_range = logistics_data.temperature_range if logistics_data and hasattr(logistics_data, 'temperature_range') else None
-                
-                if temp_range is not None:
-                    # Знаходимо сумісні ряди за температурою
-                    compatible_rows = StorageRow.query.filter(
-                        StorageRow.temperature_min <= temp_range,
-                        StorageRow.temperature_max >= temp_range
-                    ).all()
-                    
-                    if compatible_rows:
-                        # Знаходимо доступну локацію з сумісною температурою на верхніх рівнях
-                        available_location = StorageLocation.query.filter(
-                            StorageLocation.row_code.in_([row.code for row in compatible_rows]),
-                            StorageLocation.level > '1',  # Тільки верхні рівні
-                            ~StorageLocation.received_items.any()
-                        ).first()
-                        
-                        if available_location:
-                            storage_location_code = available_location.location_code
-                            print(f"[+] Using temperature-compatible upper level location {storage_location_code} for SKU {order_item.sku}")
-                        else:
-                            # Не знайдено підходящої локації
-                            print(f"[!] No available upper level storage location found for SKU {order_item.sku} with temperature {temp_range}°C")
-            
-            # Якщо досі не знайдено локацію, шукаємо будь-яку доступну локацію на верхніх рівнях
-            if not storage_location_code:
-                available_location = StorageLocation.query.filter(
-                    StorageLocation.level > '1',  # Тільки верхні рівні
-                    ~StorageLocation.received_items.any()
-                ).first()
-                
-                if available_location:
-                    storage_location_code = available_location.location_code
-                    print(f"[+] Using last resort upper level location {storage_location_code} for SKU {order_item.sku}")
-                else:
-                    # Якщо не знайдено жодної локації на верхніх рівнях, використовуємо зону прийому
-                    storage_location_code = 'RECEIVING'
-                    print(f"[!] No available upper level storage locations found, using RECEIVING for SKU {order_item.sku}")
-        
-        # Get storage location object from code
-        storage_location = StorageLocation.query.filter_by(location_code=storage_location_code).first()
-        if not storage_location:
-            # Default to a receiving area if location not found
-            storage_location = StorageLocation.query.filter_by(location_code='RECEIVING').first()
-        
-        # Get logistics data for product details and shelf life
-        logistics_data = LogisticsItemData.query.filter_by(sku=order_item.sku).first()
-        
-        # Get product name from logistics data if available
-        product_name = logistics_data.product_name if logistics_data else order_item.product_name
-        
-        # Calculate expiry date based on shelf life if available
-        received_at = datetime.now()
-        expiry_date = None
-        if logistics_data and logistics_data.shelf_life:
-            expiry_date = received_at + timedelta(days=logistics_data.shelf_life)
-        
-        # Create new received inventory entry with SSCC tracking
-        received_inventory = ReceivedInventory(
-            sscc=sscc,
-            storage_location_id=storage_location.id if storage_location else None,
-            sku=order_item.sku,
-            product_name=product_name,
-            box_count=box_count,
-            net_weight=net_weight,
-            received_at=received_at,
-            expiry_date=expiry_date,
-            received_by=current_user.id,
-            invoice_number=order_item.invoice_number
-        )
-        db.session.add(received_inventory)
-        db.session.commit()
-        
-        return jsonify({
-            'success': True,
-            'message': 'Дані прийому збережено',
-            'receiving_data': {
-                'sscc': sscc,
-                'item_sku': order_item.sku,
-                'item_name': product_name,
-                'box_count': box_count,
-                'gross_weight': gross_weight,
-                'net_weight': net_weight,
-                'storage_location': storage_location_code if storage_location else 'RECEIVING',
-                'expiry_date': expiry_date.strftime('%Y-%m-%d') if expiry_date else None
-            }
-        })
-    except Exception as e:
+    """
+    Save receiving data for a pallet.
+
+    Сканування лише перевіряється і зберігається в receiving_scan — відповідь
+    не чекає розміщення. Комірку призначає фоновий обробник (flask receiving-worker),
+    термінал отримує її через /receiving-scan.
+    """
+    result = stage_scan(request.get_json() or {}, current_user.id)
+    if not result['success']:
+        return jsonify(result), 400
+    return jsonify(result)
+
+@tsd_receiving_bp.route('/receiving-scan', methods=['GET'])
+@login_required
+@position_required(RECEIVING_ACCESS_POSITIONS)
+def receiving_scan_status():
+    """
+    Стан сканувань за SSCC (параметр sscc можна повторювати);
+    wait=N — чекати, доки всі сканування буде оброблено, до N секунд (long polling)
+    """
+    ssccs = [sscc for sscc in request.args.getlist('sscc') if sscc]
+    if not ssccs:
+        return jsonify({'success': False, 'message': 'SSCC не вказано'}), 400
+
+    wait = min(max(request.args.get('wait', 0, type=float), 0), MAX_SCAN_WAIT_SECONDS)
+    deadline = time.monotonic() + wait
+    while True:
+        scans = get_receiving_scans(ssccs)
+        if not scans:
+            return jsonify({'success': False, 'message': f"Сканування {', '.join(ssccs)} не знайдено"}), 404
+        if all(scan['status'] != 'pending' for scan in scans) or time.monotonic() >= deadline:
+            break
+        # Завершуємо транзакцію, щоб наступний запит побачив зміни обробника
         db.session.rollback()
-        return jsonify({
-            'success': False,
-            'message': f'Помилка при збереженні даних: {str(e)}'
-        }), 500
+        time.sleep(SCAN_POLL_INTERVAL)
+
+    response = {'success': True, 'scans': scans}
+    if len(ssccs) == 1:
+        response['scan'] = scans[0]
+    return jsonify(response)
+
+@tsd_receiving_bp.route('/receiving-progress', methods=['GET'])
+@login_required
+@position_required(RECEIVING_ACCESS_POSITIONS)
+def receiving_progress():
+    """Прогрес поетапного приймання замовлення (order_id або invoice_number)"""
+    order_id = request.args.get('order_id', type=int)
+    invoice_number = request.args.get('invoice_number')
+    if order_id is None and invoice_number:
+        order_id = db.session.query(OrderItem.order_id).filter_by(invoice_number=invoice_number).limit(1).scalar()
+    if order_id is None:
+        return jsonify({'success': False, 'message': 'Замовлення не знайдено'}), 404
+
+    return jsonify({'success': True, 'progress': get_receiving_progress(order_id)})
 
 @tsd_receiving_bp.route('/check-received-sscc', methods=['GET'])
 def check_received_sscc():
@@ -327,6 +259,8 @@ def check_received_sscc():
     if not sscc:
         return jsonify({'exists': False})
 
-    exists = db.session.query(ReceivedInventory.query.filter_by(sscc=sscc).exists()).scalar()
+    # Палета вже прийнята або чекає розміщення
+    exists = db.session.query(ReceivedInventory.query.filter_by(sscc=sscc).exists()).scalar() or \
+        db.session.query(ReceivingScan.query.filter_by(sscc=sscc).exists()).scalar()
 
     return jsonify({'exists': exists})
\ No newline at end of file
@@ -580,20 +580,60 @@ window.navigateToPickingOption = function() {
     document.dispatchEvent(new Event('pickingStart'));
 };
 
+let availableLotsSource = null;
+
+function appendLotOption(lotSelect, lot) {
+  const option = document.createElement('option');
+  option.value = lot.lot_number;
+  option.textContent = `${lot.lot_number} (${lot.sku_list.join(', ')})`;
+  lotSelect.appendChild(option);
+}
+
+// Нові лоти надходять через Server-Sent Events замість повторного завантаження всього списку
+function subscribeToNewLots(lastId) {
+  if (availableLotsSource) {
+    availableLotsSource.close();
+  }
+  if (!window.EventSource) {
+    return;
+  }
+  availableLotsSource = new EventSource(`/tsd-emulator/picking/available-lots/stream?after=${lastId}`);
+  availableLotsSource.addEventListener('lot', event => {
+    const lot = JSON.parse(event.data);
+    const lotSelect = document.getElementById('lotSelector');
+    if (lotSelect && !lotSelect.querySelector(`option[value="${lot.lot_number}"]`)) {
+      appendLotOption(lotSelect, lot);
+    }
+  });
+}
+
+// Сторінки списку завантажуються по черзі за курсором next_after, поки has_more
+function fetchAvailableLots(after, lots) {
+  const query = after ? `?after=${after}` : '';
+  return fetch(`/tsd-emulator/picking/available-lots${query}`)
+    .then(response => response.json())
+    .then(data => {
+      if (!data.success) {
+        return data;
+      }
+      const allLots = lots.concat(data.lots);
+      if (data.has_more) {
+        return fetchAvailableLots(data.next_after, allLots);
+      }
+      // Стрічка продовжує з останнього отриманого лота; якщо лотів немає — з найновішого
+      return {success: true, lots: allLots, cursor: data.next_after || data.last_id};
+    });
+}
+
 function loadAvailableLots() {
-    fetch('/tsd-emulator/picking/available-lots')
-      .then(response => response.json())
+    fetchAvailableLots(null, [])
       .then(data => {
         if (data.success) {
           const lotSelect = document.getElementById('lotSelector');
           lotSelect.innerHTML = '';
   
-          data.lots.forEach(lot => {
-            const option = document.createElement('option');
-            option.value = lot.lot_number;
-            option.textContent = `${lot.lot_number} (${lot.sku_list.join(', ')})`;
-            lotSelect.appendChild(option);
-          });
+          data.lots.forEach(lot => appendLotOption(lotSelect, lot));
+          subscribeToNewLots(data.cursor);
           const currentScreen = keyDispatcher.getTsdState().currentScreen;
 
           if (data.lots.length === 1 && currentScreen === 'picking-order-screen') {
@@ -1001,6 +1001,7 @@ function handleDataEntry() {
 // Обгортка для виклику функції saveBatchReceivingData з модуля receivingKeys
 window.saveBatchReceivingData = async function() {
     const state = keyDispatcher.getTsdState();
+    const ssccs = (state.tempPalletArray || []).map(pallet => pallet.sscc);
     const success = await receivingKeys.saveBatchReceivingData(
         state.currentOrder,
         state.tempPalletArray,
@@ -1015,6 +1016,9 @@ window.saveBatchReceivingData = async function() {
         });
         ssccData = null;
         handleReceivingComplete();
+
+        // Не блокуємо термінал: комірки покажемо, коли фоновий обробник розмістить палети
+        receivingKeys.waitForPlacement(ssccs, 'menu-screen');
     }
 };
 
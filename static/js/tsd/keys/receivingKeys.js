@@ -179,8 +179,8 @@ export async function saveBatchReceivingData(selectedOrder, tempPalletArray, cur
         }
         
         if (data.success) {
-            // Показуємо повідомлення про успіх
-            showMessage(`Дані збережено. Кількість палет: ${tempPalletArray.length}`, 'success', currentScreen);
+            // Палети збережено в черзі; комірки призначить фоновий обробник (див. waitForPlacement)
+            showMessage(`Дані збережено. Кількість палет: ${tempPalletArray.length}, очікують розміщення`, 'success', currentScreen);
             return true;
         } else {
             showMessage(data.message || 'Помилка збереження даних', 'error', currentScreen);
@@ -191,4 +191,55 @@ export async function saveBatchReceivingData(selectedOrder, tempPalletArray, cur
         showMessage("Помилка з'єднання з сервером: " + error.message, 'error', currentScreen);
         return false;
     }
-}
\ No newline at end of file
+}
+
+// Очікування розміщення палет фоновим обробником (long polling /receiving-scan)
+const PLACEMENT_WAIT_SECONDS = 20;
+const MAX_PLACEMENT_POLLS = 6;
+const PLACEMENT_RETRY_DELAY_MS = 2000;
+
+export async function waitForPlacement(ssccs, currentScreen) {
+    if (!ssccs || ssccs.length === 0) {
+        return [];
+    }
+
+    const query = ssccs.map(sscc => `sscc=${encodeURIComponent(sscc)}`).join('&');
+    let scans = [];
+    for (let attempt = 0; attempt < MAX_PLACEMENT_POLLS; attempt++) {
+        try {
+            const response = await fetch(`/tsd-emulator/api/receiving-scan?${query}&wait=${PLACEMENT_WAIT_SECONDS}`, {
+                credentials: 'include'
+            });
+            const data = await response.json();
+            if (!data.success) {
+                showMessage(data.message || 'Помилка отримання стану розміщення', 'error', currentScreen);
+                return scans;
+            }
+            scans = data.scans;
+        } catch (error) {
+            // Зв'язок міг перерватися — повторюємо запит після паузи
+            console.error('Error:', error);
+            await new Promise(resolve => setTimeout(resolve, PLACEMENT_RETRY_DELAY_MS));
+            continue;
+        }
+
+        if (scans.every(scan => scan.status !== 'pending')) {
+            break;
+        }
+    }
+
+    const placed = scans.filter(scan => scan.status === 'placed');
+    const failed = scans.filter(scan => scan.status === 'failed');
+    console.log('[waitForPlacement] Scans:', scans);
+
+    if (failed.length > 0) {
+        const details = failed.map(scan => `${scan.sscc}: ${scan.message || 'не розміщено'}`).join('; ');
+        showMessage(`Не розміщено ${failed.length} з ${ssccs.length} палет. ${details}`, 'error', currentScreen);
+    } else if (placed.length < ssccs.length) {
+        showMessage(`Розміщено ${placed.length} з ${ssccs.length} палет, решта ще в черзі`, 'warning', currentScreen);
+    } else {
+        const locations = placed.map(scan => `${scan.sscc} → ${scan.storage_location}`).join(', ');
+        showMessage(`Палети розміщено: ${locations}`, 'success', currentScreen);
+    }
+    return scans;
+}